@@ -330,11 +330,11 @@ FROM ventas_backend;
 \echo ''
 \echo 'Índices creados en ventas_backend:'
 SELECT
-    indexname,
+    indexrelname as indexname,
     pg_size_pretty(pg_relation_size(indexrelid)) as tamaño
 FROM pg_stat_user_indexes
-WHERE tablename = 'ventas_backend'
-ORDER BY indexname;
+WHERE relname = 'ventas_backend'
+ORDER BY indexrelname;
 
 \echo ''
 \echo '=========================================='
@@ -0,0 +1,41 @@
+-- ==================================================================================
+-- PASO 4: ÍNDICES PARA PAGINACIÓN POR CURSOR (KEYSET) EN ventas_backend
+-- ==================================================================================
+-- Descripción: Crea los índices compuestos que usa /api/ventas?pagination=cursor.
+--              Cada página se resuelve como un recorrido de rango sobre
+--              (columna de orden, id) en lugar de OFFSET sobre ~1.7M filas.
+-- IMPORTANTE: CREATE INDEX CONCURRENTLY no puede ejecutarse dentro de una
+--             transacción (no usar psql --single-transaction)
+-- Uso: psql -h localhost -U postgres -d crm_sunat -f 04_keyset_pagination_indexes.sql
+-- ==================================================================================
+
+\echo '=========================================='
+\echo 'CREANDO ÍNDICES PARA PAGINACIÓN KEYSET'
+\echo '=========================================='
+\echo ''
+
+-- sort_by=fecha -> ORDER BY fecha_emision DESC, id DESC
+\echo '1. Índice (fecha_emision DESC, id DESC)...'
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_ventas_backend_fecha_id
+    ON ventas_backend (fecha_emision DESC, id DESC);
+
+-- sort_by=monto -> ORDER BY monto_neto DESC, id DESC
+\echo '2. Índice (monto_neto DESC, id DESC)...'
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_ventas_backend_monto_id
+    ON ventas_backend (monto_neto DESC, id DESC);
+
+ANALYZE ventas_backend;
+
+\echo ''
+\echo 'Índices de paginación en ventas_backend:'
+SELECT
+    indexrelname as indice,
+    pg_size_pretty(pg_relation_size(indexrelid)) as tamaño
+FROM pg_stat_user_indexes
+WHERE relname = 'ventas_backend'
+  AND indexrelname IN ('idx_ventas_backend_fecha_id', 'idx_ventas_backend_monto_id');
+
+\echo ''
+\echo '=========================================='
+\echo 'ÍNDICES KEYSET CREADOS CON ÉXITO'
+\echo '=========================================='
@@ -0,0 +1,145 @@
+-- ==================================================================================
+-- PASO 5: ROLLUP DIARIO DE MÉTRICAS (ventas_metricas_diarias)
+-- ==================================================================================
+-- Descripción: /api/metricas/resumen recorría ventas_backend completo para el
+--              rango de fechas en cada carga del dashboard. Esta tabla guarda
+--              los montos ya agregados por (fecha_emision, ruc, moneda, estado1),
+--              así el endpoint suma unos cientos de filas en vez de facturas.
+--
+--              refresh_ventas_backend() pasa a reconstruir el rollup en la misma
+--              ejecución y registra la hora de cada refresh en mantenimiento_vistas.
+--              Si el rollup queda desfasado respecto a ventas_backend, el endpoint
+--              vuelve a la consulta directa sobre la vista.
+-- Uso: psql -h localhost -U postgres -d crm_sunat -f 05_metricas_diarias_rollup.sql
+-- ==================================================================================
+
+\echo '=========================================='
+\echo 'CREANDO ROLLUP DIARIO DE MÉTRICAS'
+\echo '=========================================='
+\echo ''
+
+-- 1. Registro de refrescos
+\echo '1. Tabla mantenimiento_vistas...'
+CREATE TABLE IF NOT EXISTS mantenimiento_vistas (
+    nombre VARCHAR(100) PRIMARY KEY,
+    actualizado_en TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    duracion_ms INTEGER
+);
+
+COMMENT ON TABLE mantenimiento_vistas IS 'Última actualización de cada vista/tabla derivada (ventas_backend, ventas_metricas_diarias)';
+
+-- 2. Rollup
+\echo '2. Tabla ventas_metricas_diarias...'
+CREATE TABLE IF NOT EXISTS ventas_metricas_diarias (
+    fecha_emision DATE NOT NULL,
+    ruc VARCHAR(11) NOT NULL,
+    moneda VARCHAR(3),
+    estado1 VARCHAR(50),
+    monto_neto NUMERIC NOT NULL DEFAULT 0,
+    cantidad INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_metricas_diarias_fecha
+    ON ventas_metricas_diarias (fecha_emision, moneda);
+CREATE INDEX IF NOT EXISTS idx_metricas_diarias_ruc_fecha
+    ON ventas_metricas_diarias (ruc, fecha_emision);
+
+COMMENT ON TABLE ventas_metricas_diarias IS 'Montos netos de facturas (tipo 1, sin boletas) agregados por día, RUC, moneda y estado1. Se reconstruye en refresh_ventas_backend()';
+
+-- 3. Reconstrucción del rollup
+\echo '3. Función rebuild_ventas_metricas_diarias()...'
+CREATE OR REPLACE FUNCTION rebuild_ventas_metricas_diarias()
+RETURNS void AS $$
+DECLARE
+    inicio TIMESTAMPTZ := clock_timestamp();
+BEGIN
+    -- DELETE (no TRUNCATE): los lectores siguen viendo el rollup anterior
+    -- hasta el commit en lugar de quedar bloqueados
+    DELETE FROM ventas_metricas_diarias;
+
+    INSERT INTO ventas_metricas_diarias (fecha_emision, ruc, moneda, estado1, monto_neto, cantidad)
+    SELECT
+        fecha_emision,
+        ruc,
+        moneda,
+        estado1,
+        COALESCE(SUM(monto_neto), 0),
+        COUNT(*)
+    FROM ventas_backend
+    WHERE tipo_cp_doc = '1'
+      AND serie_cdp NOT LIKE 'B%'
+      AND fecha_emision IS NOT NULL
+    GROUP BY fecha_emision, ruc, moneda, estado1;
+
+    INSERT INTO mantenimiento_vistas (nombre, actualizado_en, duracion_ms)
+    VALUES (
+        'ventas_metricas_diarias',
+        NOW(),
+        (EXTRACT(EPOCH FROM clock_timestamp() - inicio) * 1000)::integer
+    )
+    ON CONFLICT (nombre) DO UPDATE
+        SET actualizado_en = EXCLUDED.actualizado_en,
+            duracion_ms = EXCLUDED.duracion_ms;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 4. refresh_ventas_backend() ahora también mantiene el rollup
+\echo '4. Actualizando refresh_ventas_backend()...'
+CREATE OR REPLACE FUNCTION refresh_ventas_backend()
+RETURNS void AS $$
+DECLARE
+    inicio TIMESTAMPTZ := clock_timestamp();
+BEGIN
+    REFRESH MATERIALIZED VIEW CONCURRENTLY ventas_backend;
+
+    INSERT INTO mantenimiento_vistas (nombre, actualizado_en, duracion_ms)
+    VALUES (
+        'ventas_backend',
+        NOW(),
+        (EXTRACT(EPOCH FROM clock_timestamp() - inicio) * 1000)::integer
+    )
+    ON CONFLICT (nombre) DO UPDATE
+        SET actualizado_en = EXCLUDED.actualizado_en,
+            duracion_ms = EXCLUDED.duracion_ms;
+
+    -- Un error en el rollup no debe deshacer el refresh de la vista:
+    -- el rollup queda desfasado y /api/metricas/resumen usa la vista
+    BEGIN
+        PERFORM rebuild_ventas_metricas_diarias();
+    EXCEPTION WHEN OTHERS THEN
+        RAISE WARNING 'No se pudo reconstruir ventas_metricas_diarias: %', SQLERRM;
+    END;
+
+    RAISE NOTICE 'Vista ventas_backend refrescada a las %', NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION refresh_ventas_backend() IS 'Refresca ventas_backend de forma concurrente y reconstruye ventas_metricas_diarias';
+
+-- 5. Carga inicial
+\echo '5. Carga inicial del rollup...'
+-- Primero la marca de ventas_backend: el rollup se considera vigente
+-- cuando su marca es igual o posterior a la de la vista
+INSERT INTO mantenimiento_vistas (nombre, actualizado_en)
+VALUES ('ventas_backend', NOW())
+ON CONFLICT (nombre) DO NOTHING;
+
+SELECT rebuild_ventas_metricas_diarias();
+
+ANALYZE ventas_metricas_diarias;
+
+\echo ''
+\echo 'Estado del rollup:'
+SELECT
+    COUNT(*) as filas_rollup,
+    SUM(cantidad) as facturas_agregadas,
+    MIN(fecha_emision) as desde,
+    MAX(fecha_emision) as hasta
+FROM ventas_metricas_diarias;
+
+SELECT nombre, actualizado_en, duracion_ms FROM mantenimiento_vistas ORDER BY nombre;
+
+\echo ''
+\echo '=========================================='
+\echo 'ROLLUP DE MÉTRICAS CREADO CON ÉXITO'
+\echo '=========================================='
@@ -0,0 +1,625 @@
+-- ==================================================================================
+-- PASO 6: ventas_backend COMO TABLA CON MANTENIMIENTO INCREMENTAL
+-- ==================================================================================
+-- Descripción: Reemplaza la vista materializada ventas_backend por una tabla con
+--              el mismo nombre y las mismas columnas (VentaBackend y los
+--              repositorios no cambian). La tabla se mantiene con triggers
+--              por sentencia:
+--
+--              - ventas_sire: se recalculan solo las facturas insertadas,
+--                modificadas o eliminadas y las facturas enlazadas a las notas
+--                de crédito afectadas (estado1/estado2 incluidos)
+--              - enrolados: se actualiza usuario_email/usuario_nombre de los RUCs
+--                afectados
+--              - usuarios: se actualiza usuario_nombre si cambió el nombre
+--
+--              La definición de cada fila vive en la vista (no materializada)
+--              ventas_backend_def: la carga inicial y los recálculos usan la
+--              misma consulta. refresh_ventas_backend() ya no hace REFRESH si
+--              ventas_backend es una tabla; solo reconstruye el rollup de métricas.
+--
+-- IMPORTANTE: Requiere 05_metricas_diarias_rollup.sql aplicado.
+--             La tabla nueva se construye aparte y se intercambia al final en
+--             una transacción corta: las lecturas no ven la vista desaparecer.
+--             Lo que cambia en ventas_sire durante la construcción lo anota un
+--             trigger en ventas_backend_pendientes (instalado antes de tomar
+--             la foto) y se recalcula en el intercambio.
+-- Uso: psql -h localhost -U postgres -d crm_sunat -f 06_ventas_backend_incremental.sql
+-- ==================================================================================
+
+\echo '=========================================='
+\echo 'ventas_backend INCREMENTAL'
+\echo '=========================================='
+\echo ''
+
+-- ==================================================================================
+-- 1. DEFINICIÓN DE UNA FILA DE ventas_backend
+-- ==================================================================================
+\echo '1. Vista ventas_backend_def...'
+
+-- SIRE a veces entrega nro_cp_modificado como '123.0': solo se quita ese
+-- sufijo literal (TRIM(TRAILING '.0') también convertía '100.0' en '1')
+CREATE OR REPLACE FUNCTION nro_cp_normalizado(nro TEXT)
+RETURNS TEXT AS $$
+    SELECT regexp_replace(nro, '\.0$', '')
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+-- NC de una factura: la vista, los triggers y ventas_backend_recalcular buscan
+-- por (ruc, nro_cp_normalizado(nro_cp_modificado), nro_doc_identidad)
+\echo '   Índice de NC por número normalizado...'
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_ventas_nc_normalizado
+    ON ventas_sire (ruc, nro_cp_normalizado(nro_cp_modificado), nro_doc_identidad)
+    WHERE tipo_cp_doc = '7';
+
+CREATE OR REPLACE VIEW ventas_backend_def AS
+SELECT
+    v.id,
+    v.ruc,
+    v.razon_social,
+    v.periodo,
+    v.car_sunat,
+    v.fecha_emision,
+    v.fecha_vcto_pago,
+    v.tipo_cp_doc,
+    v.serie_cdp,
+    v.nro_cp_inicial,
+    v.nro_final,
+    v.tipo_doc_identidad,
+    v.nro_doc_identidad,
+    v.apellidos_nombres_razon_social,
+    v.valor_facturado_exportacion,
+    v.bi_gravada,
+    v.dscto_bi,
+    v.igv_ipm,
+    v.dscto_igv_ipm,
+    v.mto_exonerado,
+    v.mto_inafecto,
+    v.isc,
+    v.bi_grav_ivap,
+    v.ivap,
+    v.icbper,
+    v.otros_tributos,
+    v.total_cp,
+    v.moneda,
+    v.tipo_cambio,
+    v.fecha_emision_doc_modificado,
+    v.tipo_cp_modificado,
+    v.serie_cp_modificado,
+    v.nro_cp_modificado,
+    v.id_proyecto_operadores_atribucion,
+    v.tipo_nota,
+    v.est_comp,
+    v.valor_fob_embarcado,
+    v.valor_op_gratuitas,
+    v.tipo_operacion,
+    v.dam_cp,
+    v.clu,
+    v.estado1,
+    v.estado2,
+    v.ultima_actualizacion,
+    e.email as usuario_email,
+    u.nombre as usuario_nombre,
+
+    -- monto_original: total_cp / tipo_cambio (SIN notas de crédito)
+    (CASE WHEN v.tipo_cambio IS NOT NULL AND v.tipo_cambio > 0
+     THEN v.total_cp / v.tipo_cambio
+     ELSE v.total_cp END) as monto_original,
+
+    -- tiene_nota_credito: boolean si tiene NC asociadas
+    (SELECT COUNT(*) > 0
+     FROM ventas_sire nc
+     WHERE nc.ruc = v.ruc
+     AND nc.tipo_cp_doc = '7'
+     AND nro_cp_normalizado(nc.nro_cp_modificado) = v.nro_cp_inicial
+     AND nc.nro_doc_identidad = v.nro_doc_identidad
+    ) as tiene_nota_credito,
+
+    -- nota_credito_monto: suma de NC (negativo)
+    COALESCE((
+        SELECT SUM(
+            CASE WHEN nc.tipo_cambio IS NOT NULL AND nc.tipo_cambio > 0
+            THEN nc.total_cp / nc.tipo_cambio
+            ELSE nc.total_cp END
+        )
+        FROM ventas_sire nc
+        WHERE nc.ruc = v.ruc
+        AND nc.tipo_cp_doc = '7'
+        AND nro_cp_normalizado(nc.nro_cp_modificado) = v.nro_cp_inicial
+        AND nc.nro_doc_identidad = v.nro_doc_identidad
+    ), 0) as nota_credito_monto,
+
+    -- monto_neto: monto_original + nota_credito_monto
+    (CASE WHEN v.tipo_cambio IS NOT NULL AND v.tipo_cambio > 0
+     THEN v.total_cp / v.tipo_cambio
+     ELSE v.total_cp END) + COALESCE((
+        SELECT SUM(
+            CASE WHEN nc.tipo_cambio IS NOT NULL AND nc.tipo_cambio > 0
+            THEN nc.total_cp / nc.tipo_cambio
+            ELSE nc.total_cp END
+        )
+        FROM ventas_sire nc
+        WHERE nc.ruc = v.ruc
+        AND nc.tipo_cp_doc = '7'
+        AND nro_cp_normalizado(nc.nro_cp_modificado) = v.nro_cp_inicial
+        AND nc.nro_doc_identidad = v.nro_doc_identidad
+    ), 0) as monto_neto,
+
+    -- notas_credito_asociadas: string con referencias de NC
+    (SELECT STRING_AGG(nc.serie_cdp || '-' || nc.nro_cp_inicial, ', ' ORDER BY nc.fecha_emision)
+     FROM ventas_sire nc
+     WHERE nc.ruc = v.ruc
+     AND nc.tipo_cp_doc = '7'
+     AND nc.nro_cp_modificado = v.nro_cp_inicial
+     AND nc.nro_doc_identidad = v.nro_doc_identidad
+    ) as notas_credito_asociadas
+
+FROM ventas_sire v
+LEFT JOIN enrolados e ON v.ruc = e.ruc
+LEFT JOIN usuarios u ON e.email = u.email
+WHERE v.tipo_cp_doc = '1'
+    AND v.serie_cdp NOT LIKE 'B%'
+    AND v.apellidos_nombres_razon_social != '-'
+    AND v.apellidos_nombres_razon_social IS NOT NULL;
+
+COMMENT ON VIEW ventas_backend_def IS 'Definición de las filas de ventas_backend (carga inicial y recálculo incremental)';
+
+-- Facturas enlazadas a una NC: (ruc, nro_cp_inicial, nro_doc_identidad) de tipo 1
+\echo '   Índice de búsqueda de facturas por NC...'
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_ventas_factura_lookup
+    ON ventas_sire (ruc, nro_cp_inicial, nro_doc_identidad)
+    WHERE tipo_cp_doc = '1';
+
+-- ==================================================================================
+-- 2. CONSTRUIR LA TABLA NUEVA (la vista actual sigue respondiendo)
+-- ==================================================================================
+\echo '2. Construyendo ventas_backend_nueva...'
+
+-- Facturas a recalcular en el paso 4: las que cambian en ventas_sire desde
+-- antes de la foto. Una marca de agua sobre ultima_actualizacion no alcanza:
+-- NOW() es el inicio de la transacción, y una que empezó antes de la marca pero
+-- hizo commit después de la foto quedaba fuera; tampoco registraba las NC
+-- eliminadas. CREATE TRIGGER espera a las transacciones que ya escriben en
+-- ventas_sire, así que todo cambio no incluido en la foto pasa por el trigger.
+DROP TABLE IF EXISTS ventas_backend_pendientes;
+CREATE UNLOGGED TABLE ventas_backend_pendientes (id BIGINT NOT NULL);
+
+-- Facturas tocadas directamente + facturas de las NC tocadas (viejas y nuevas)
+CREATE OR REPLACE FUNCTION trg_ventas_backend_pendientes()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO ventas_backend_pendientes (id)
+        SELECT t.id FROM nuevas t WHERE t.tipo_cp_doc = '1'
+        UNION
+        SELECT f.id
+        FROM nuevas t
+        JOIN ventas_sire f
+          ON f.ruc = t.ruc
+         AND f.tipo_cp_doc = '1'
+         AND f.nro_doc_identidad = t.nro_doc_identidad
+         AND f.nro_cp_inicial = nro_cp_normalizado(t.nro_cp_modificado)
+        WHERE t.tipo_cp_doc = '7';
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO ventas_backend_pendientes (id)
+        SELECT t.id FROM viejas t WHERE t.tipo_cp_doc = '1'
+        UNION
+        SELECT f.id
+        FROM viejas t
+        JOIN ventas_sire f
+          ON f.ruc = t.ruc
+         AND f.tipo_cp_doc = '1'
+         AND f.nro_doc_identidad = t.nro_doc_identidad
+         AND f.nro_cp_inicial = nro_cp_normalizado(t.nro_cp_modificado)
+        WHERE t.tipo_cp_doc = '7';
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_ventas_backend_pendientes_ins ON ventas_sire;
+DROP TRIGGER IF EXISTS trg_ventas_backend_pendientes_upd ON ventas_sire;
+DROP TRIGGER IF EXISTS trg_ventas_backend_pendientes_del ON ventas_sire;
+CREATE TRIGGER trg_ventas_backend_pendientes_ins
+    AFTER INSERT ON ventas_sire
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ventas_backend_pendientes();
+CREATE TRIGGER trg_ventas_backend_pendientes_upd
+    AFTER UPDATE ON ventas_sire
+    REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ventas_backend_pendientes();
+CREATE TRIGGER trg_ventas_backend_pendientes_del
+    AFTER DELETE ON ventas_sire
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ventas_backend_pendientes();
+
+DROP TABLE IF EXISTS ventas_backend_nueva;
+CREATE TABLE ventas_backend_nueva AS SELECT * FROM ventas_backend_def;
+
+ALTER TABLE ventas_backend_nueva ADD CONSTRAINT ventas_backend_nueva_pkey PRIMARY KEY (id);
+CREATE INDEX idx_ventas_backend_nueva_ruc_periodo ON ventas_backend_nueva(ruc, periodo);
+CREATE INDEX idx_ventas_backend_nueva_tipo_doc ON ventas_backend_nueva(tipo_cp_doc);
+CREATE INDEX idx_ventas_backend_nueva_estado1 ON ventas_backend_nueva(estado1) WHERE estado1 IS NOT NULL;
+CREATE INDEX idx_ventas_backend_nueva_fecha ON ventas_backend_nueva(fecha_emision);
+CREATE INDEX idx_ventas_backend_nueva_cliente ON ventas_backend_nueva(nro_doc_identidad);
+CREATE INDEX idx_ventas_backend_nueva_moneda ON ventas_backend_nueva(moneda);
+CREATE INDEX idx_ventas_backend_nueva_metricas ON ventas_backend_nueva(fecha_emision, moneda, estado1, monto_neto);
+CREATE INDEX idx_ventas_backend_nueva_con_nc ON ventas_backend_nueva(tiene_nota_credito) WHERE tiene_nota_credito = true;
+CREATE INDEX idx_ventas_backend_nueva_usuario_email ON ventas_backend_nueva(usuario_email) WHERE usuario_email IS NOT NULL;
+CREATE INDEX idx_ventas_backend_nueva_fecha_desc ON ventas_backend_nueva(fecha_emision DESC);
+CREATE INDEX idx_ventas_backend_nueva_fecha_id ON ventas_backend_nueva(fecha_emision DESC, id DESC);
+CREATE INDEX idx_ventas_backend_nueva_monto_id ON ventas_backend_nueva(monto_neto DESC, id DESC);
+
+ANALYZE ventas_backend_nueva;
+
+-- ==================================================================================
+-- 3. FUNCIONES DE MANTENIMIENTO
+-- ==================================================================================
+\echo '3. Funciones de mantenimiento...'
+
+-- Recalcula un conjunto de facturas: las que ya no califican desaparecen
+CREATE OR REPLACE FUNCTION ventas_backend_recalcular(p_ids BIGINT[])
+RETURNS void AS $$
+BEGIN
+    IF p_ids IS NULL OR cardinality(p_ids) = 0 THEN
+        RETURN;
+    END IF;
+
+    -- Espera a quien esté escribiendo estas facturas (o recalculándolas): en
+    -- READ COMMITTED la sentencia siguiente toma una foto nueva y ve su commit;
+    -- sin esto la fila se calculaba con la foto anterior y pisaba su cambio
+    PERFORM 1 FROM ventas_sire WHERE id = ANY(p_ids) ORDER BY id FOR UPDATE;
+
+    -- Upsert y luego baja de las que ya no califican: con DELETE + INSERT, dos
+    -- transacciones que recalculan la misma factura chocaban en ventas_backend_pkey
+    -- (el DELETE de la segunda espera, no encuentra nada y su INSERT falla)
+    INSERT INTO ventas_backend
+    SELECT * FROM ventas_backend_def WHERE id = ANY(p_ids)
+    ON CONFLICT (id) DO UPDATE SET
+        ruc = EXCLUDED.ruc,
+        razon_social = EXCLUDED.razon_social,
+        periodo = EXCLUDED.periodo,
+        car_sunat = EXCLUDED.car_sunat,
+        fecha_emision = EXCLUDED.fecha_emision,
+        fecha_vcto_pago = EXCLUDED.fecha_vcto_pago,
+        tipo_cp_doc = EXCLUDED.tipo_cp_doc,
+        serie_cdp = EXCLUDED.serie_cdp,
+        nro_cp_inicial = EXCLUDED.nro_cp_inicial,
+        nro_final = EXCLUDED.nro_final,
+        tipo_doc_identidad = EXCLUDED.tipo_doc_identidad,
+        nro_doc_identidad = EXCLUDED.nro_doc_identidad,
+        apellidos_nombres_razon_social = EXCLUDED.apellidos_nombres_razon_social,
+        valor_facturado_exportacion = EXCLUDED.valor_facturado_exportacion,
+        bi_gravada = EXCLUDED.bi_gravada,
+        dscto_bi = EXCLUDED.dscto_bi,
+        igv_ipm = EXCLUDED.igv_ipm,
+        dscto_igv_ipm = EXCLUDED.dscto_igv_ipm,
+        mto_exonerado = EXCLUDED.mto_exonerado,
+        mto_inafecto = EXCLUDED.mto_inafecto,
+        isc = EXCLUDED.isc,
+        bi_grav_ivap = EXCLUDED.bi_grav_ivap,
+        ivap = EXCLUDED.ivap,
+        icbper = EXCLUDED.icbper,
+        otros_tributos = EXCLUDED.otros_tributos,
+        total_cp = EXCLUDED.total_cp,
+        moneda = EXCLUDED.moneda,
+        tipo_cambio = EXCLUDED.tipo_cambio,
+        fecha_emision_doc_modificado = EXCLUDED.fecha_emision_doc_modificado,
+        tipo_cp_modificado = EXCLUDED.tipo_cp_modificado,
+        serie_cp_modificado = EXCLUDED.serie_cp_modificado,
+        nro_cp_modificado = EXCLUDED.nro_cp_modificado,
+        id_proyecto_operadores_atribucion = EXCLUDED.id_proyecto_operadores_atribucion,
+        tipo_nota = EXCLUDED.tipo_nota,
+        est_comp = EXCLUDED.est_comp,
+        valor_fob_embarcado = EXCLUDED.valor_fob_embarcado,
+        valor_op_gratuitas = EXCLUDED.valor_op_gratuitas,
+        tipo_operacion = EXCLUDED.tipo_operacion,
+        dam_cp = EXCLUDED.dam_cp,
+        clu = EXCLUDED.clu,
+        estado1 = EXCLUDED.estado1,
+        estado2 = EXCLUDED.estado2,
+        ultima_actualizacion = EXCLUDED.ultima_actualizacion,
+        usuario_email = EXCLUDED.usuario_email,
+        usuario_nombre = EXCLUDED.usuario_nombre,
+        monto_original = EXCLUDED.monto_original,
+        tiene_nota_credito = EXCLUDED.tiene_nota_credito,
+        nota_credito_monto = EXCLUDED.nota_credito_monto,
+        monto_neto = EXCLUDED.monto_neto,
+        notas_credito_asociadas = EXCLUDED.notas_credito_asociadas;
+
+    DELETE FROM ventas_backend vb
+    WHERE vb.id = ANY(p_ids)
+      AND NOT EXISTS (SELECT 1 FROM ventas_backend_def d WHERE d.id = vb.id);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Marca ventas_backend como modificada: el rollup de métricas queda desfasado
+-- hasta el próximo refresh_ventas_backend()
+CREATE OR REPLACE FUNCTION ventas_backend_marcar_cambio()
+RETURNS void AS $$
+BEGIN
+    INSERT INTO mantenimiento_vistas (nombre, actualizado_en)
+    VALUES ('ventas_backend', clock_timestamp())
+    ON CONFLICT (nombre) DO UPDATE SET actualizado_en = EXCLUDED.actualizado_en;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ventas_sire: facturas afectadas directamente + facturas de las NC afectadas
+CREATE OR REPLACE FUNCTION trg_ventas_backend_sire()
+RETURNS trigger AS $$
+DECLARE
+    ids BIGINT[] := '{}';
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        ids := ids || ARRAY(
+            SELECT t.id FROM nuevas t WHERE t.tipo_cp_doc = '1'
+            UNION
+            SELECT f.id
+            FROM nuevas t
+            JOIN ventas_sire f
+              ON f.ruc = t.ruc
+             AND f.tipo_cp_doc = '1'
+             AND f.nro_doc_identidad = t.nro_doc_identidad
+             AND f.nro_cp_inicial = nro_cp_normalizado(t.nro_cp_modificado)
+            WHERE t.tipo_cp_doc = '7'
+        );
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        ids := ids || ARRAY(
+            SELECT t.id FROM viejas t WHERE t.tipo_cp_doc = '1'
+            UNION
+            SELECT f.id
+            FROM viejas t
+            JOIN ventas_sire f
+              ON f.ruc = t.ruc
+             AND f.tipo_cp_doc = '1'
+             AND f.nro_doc_identidad = t.nro_doc_identidad
+             AND f.nro_cp_inicial = nro_cp_normalizado(t.nro_cp_modificado)
+            WHERE t.tipo_cp_doc = '7'
+        );
+    END IF;
+
+    IF cardinality(ids) > 0 THEN
+        PERFORM ventas_backend_recalcular(ids);
+        PERFORM ventas_backend_marcar_cambio();
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- enrolados: reasignación de RUCs a usuarios
+CREATE OR REPLACE FUNCTION trg_ventas_backend_enrolados()
+RETURNS trigger AS $$
+DECLARE
+    rucs VARCHAR[] := '{}';
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        rucs := rucs || ARRAY(SELECT ruc FROM nuevas);
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        rucs := rucs || ARRAY(SELECT ruc FROM viejas);
+    END IF;
+
+    UPDATE ventas_backend vb
+    SET usuario_email = x.email,
+        usuario_nombre = x.nombre
+    FROM (
+        SELECT r.ruc, e.email, u.nombre
+        FROM (SELECT DISTINCT unnest(rucs) AS ruc) r
+        LEFT JOIN enrolados e ON e.ruc = r.ruc
+        LEFT JOIN usuarios u ON u.email = e.email
+    ) x
+    WHERE vb.ruc = x.ruc
+      AND (vb.usuario_email IS DISTINCT FROM x.email
+           OR vb.usuario_nombre IS DISTINCT FROM x.nombre);
+
+    IF FOUND THEN
+        PERFORM ventas_backend_marcar_cambio();
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- usuarios: solo importa el nombre (ultimo_ingreso se actualiza cada 30 s)
+CREATE OR REPLACE FUNCTION trg_ventas_backend_usuarios()
+RETURNS trigger AS $$
+DECLARE
+    emails VARCHAR[] := '{}';
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        emails := ARRAY(
+            SELECT n.email
+            FROM nuevas n
+            JOIN viejas o ON o.email = n.email
+            WHERE n.nombre IS DISTINCT FROM o.nombre
+        );
+    ELSIF TG_OP = 'INSERT' THEN
+        emails := ARRAY(SELECT email FROM nuevas);
+    ELSE
+        emails := ARRAY(SELECT email FROM viejas);
+    END IF;
+
+    IF cardinality(emails) = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    UPDATE ventas_backend vb
+    SET usuario_nombre = u.nombre
+    FROM (SELECT DISTINCT unnest(emails) AS email) x
+    LEFT JOIN usuarios u ON u.email = x.email
+    WHERE vb.usuario_email = x.email
+      AND vb.usuario_nombre IS DISTINCT FROM u.nombre;
+
+    IF FOUND THEN
+        PERFORM ventas_backend_marcar_cambio();
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- El REFRESH solo aplica mientras ventas_backend sea vista materializada;
+-- con la tabla incremental solo queda reconstruir el rollup
+CREATE OR REPLACE FUNCTION refresh_ventas_backend()
+RETURNS void AS $$
+DECLARE
+    inicio TIMESTAMPTZ := clock_timestamp();
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'ventas_backend'::regclass) = 'm' THEN
+        REFRESH MATERIALIZED VIEW CONCURRENTLY ventas_backend;
+
+        INSERT INTO mantenimiento_vistas (nombre, actualizado_en, duracion_ms)
+        VALUES (
+            'ventas_backend',
+            NOW(),
+            (EXTRACT(EPOCH FROM clock_timestamp() - inicio) * 1000)::integer
+        )
+        ON CONFLICT (nombre) DO UPDATE
+            SET actualizado_en = EXCLUDED.actualizado_en,
+                duracion_ms = EXCLUDED.duracion_ms;
+    END IF;
+
+    -- Un error en el rollup no debe deshacer el refresh de la vista:
+    -- el rollup queda desfasado y /api/metricas/resumen usa la vista
+    BEGIN
+        PERFORM rebuild_ventas_metricas_diarias();
+    EXCEPTION WHEN OTHERS THEN
+        RAISE WARNING 'No se pudo reconstruir ventas_metricas_diarias: %', SQLERRM;
+    END;
+
+    RAISE NOTICE 'ventas_backend refrescada a las %', NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION refresh_ventas_backend() IS 'Refresca ventas_backend si es vista materializada y reconstruye ventas_metricas_diarias';
+
+-- ==================================================================================
+-- 4. INTERCAMBIO (transacción corta)
+-- ==================================================================================
+\echo '4. Reemplazando la vista materializada por la tabla...'
+
+BEGIN;
+
+-- Bloquea escrituras en las tablas fuente mientras se alinea la tabla nueva
+LOCK TABLE ventas_sire, enrolados, usuarios IN SHARE MODE;
+
+-- Cambios llegados mientras se construía la tabla nueva: facturas anotadas
+-- por trg_ventas_backend_pendientes (altas, cambios, bajas y las de NC
+-- tocadas; las eliminadas no vuelven de ventas_backend_def) y reasignaciones
+-- de usuario
+CREATE TEMP TABLE ventas_backend_cambios ON COMMIT DROP AS
+SELECT DISTINCT id FROM ventas_backend_pendientes;
+
+DELETE FROM ventas_backend_nueva WHERE id IN (SELECT id FROM ventas_backend_cambios);
+INSERT INTO ventas_backend_nueva
+SELECT * FROM ventas_backend_def WHERE id IN (SELECT id FROM ventas_backend_cambios);
+
+UPDATE ventas_backend_nueva n
+SET usuario_email = x.email,
+    usuario_nombre = x.nombre
+FROM (
+    SELECT e.ruc, e.email, u.nombre
+    FROM enrolados e
+    LEFT JOIN usuarios u ON u.email = e.email
+) x
+WHERE n.ruc = x.ruc
+  AND (n.usuario_email IS DISTINCT FROM x.email
+       OR n.usuario_nombre IS DISTINCT FROM x.nombre);
+
+UPDATE ventas_backend_nueva n
+SET usuario_email = NULL,
+    usuario_nombre = NULL
+WHERE n.usuario_email IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM enrolados e WHERE e.ruc = n.ruc);
+
+DROP TRIGGER trg_ventas_backend_pendientes_ins ON ventas_sire;
+DROP TRIGGER trg_ventas_backend_pendientes_upd ON ventas_sire;
+DROP TRIGGER trg_ventas_backend_pendientes_del ON ventas_sire;
+DROP FUNCTION trg_ventas_backend_pendientes();
+DROP TABLE ventas_backend_pendientes;
+
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'ventas_backend'::regclass) = 'm' THEN
+        DROP MATERIALIZED VIEW ventas_backend CASCADE;
+    ELSE
+        DROP TABLE ventas_backend CASCADE;
+    END IF;
+END $$;
+
+ALTER TABLE ventas_backend_nueva RENAME TO ventas_backend;
+ALTER TABLE ventas_backend RENAME CONSTRAINT ventas_backend_nueva_pkey TO ventas_backend_pkey;
+ALTER INDEX idx_ventas_backend_nueva_ruc_periodo RENAME TO idx_ventas_backend_ruc_periodo;
+ALTER INDEX idx_ventas_backend_nueva_tipo_doc RENAME TO idx_ventas_backend_tipo_doc;
+ALTER INDEX idx_ventas_backend_nueva_estado1 RENAME TO idx_ventas_backend_estado1;
+ALTER INDEX idx_ventas_backend_nueva_fecha RENAME TO idx_ventas_backend_fecha;
+ALTER INDEX idx_ventas_backend_nueva_cliente RENAME TO idx_ventas_backend_cliente;
+ALTER INDEX idx_ventas_backend_nueva_moneda RENAME TO idx_ventas_backend_moneda;
+ALTER INDEX idx_ventas_backend_nueva_metricas RENAME TO idx_ventas_backend_metricas;
+ALTER INDEX idx_ventas_backend_nueva_con_nc RENAME TO idx_ventas_backend_con_nc;
+ALTER INDEX idx_ventas_backend_nueva_usuario_email RENAME TO idx_ventas_backend_usuario_email;
+ALTER INDEX idx_ventas_backend_nueva_fecha_desc RENAME TO idx_ventas_backend_fecha_desc;
+ALTER INDEX idx_ventas_backend_nueva_fecha_id RENAME TO idx_ventas_backend_fecha_id;
+ALTER INDEX idx_ventas_backend_nueva_monto_id RENAME TO idx_ventas_backend_monto_id;
+
+COMMENT ON TABLE ventas_backend IS 'Facturas con montos netos de NC precalculados. Mantenida por triggers (ver 06_ventas_backend_incremental.sql)';
+
+-- Triggers por sentencia con tablas de transición (una por evento)
+CREATE TRIGGER trg_ventas_backend_sire_ins
+    AFTER INSERT ON ventas_sire
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ventas_backend_sire();
+CREATE TRIGGER trg_ventas_backend_sire_upd
+    AFTER UPDATE ON ventas_sire
+    REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ventas_backend_sire();
+CREATE TRIGGER trg_ventas_backend_sire_del
+    AFTER DELETE ON ventas_sire
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ventas_backend_sire();
+
+CREATE TRIGGER trg_ventas_backend_enrolados_ins
+    AFTER INSERT ON enrolados
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ventas_backend_enrolados();
+CREATE TRIGGER trg_ventas_backend_enrolados_upd
+    AFTER UPDATE ON enrolados
+    REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ventas_backend_enrolados();
+CREATE TRIGGER trg_ventas_backend_enrolados_del
+    AFTER DELETE ON enrolados
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ventas_backend_enrolados();
+
+CREATE TRIGGER trg_ventas_backend_usuarios_ins
+    AFTER INSERT ON usuarios
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ventas_backend_usuarios();
+CREATE TRIGGER trg_ventas_backend_usuarios_upd
+    AFTER UPDATE ON usuarios
+    REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ventas_backend_usuarios();
+CREATE TRIGGER trg_ventas_backend_usuarios_del
+    AFTER DELETE ON usuarios
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_ventas_backend_usuarios();
+
+SELECT ventas_backend_marcar_cambio();
+
+COMMIT;
+
+\echo '5. Reconstruyendo rollup de métricas...'
+SELECT refresh_ventas_backend();
+
+\echo ''
+\echo 'Estado:'
+SELECT
+    (SELECT relkind FROM pg_class WHERE oid = 'ventas_backend'::regclass) as tipo_relacion,
+    (SELECT COUNT(*) FROM ventas_backend) as filas,
+    (SELECT COUNT(*) FROM pg_trigger WHERE tgname LIKE 'trg_ventas_backend_%') as triggers;
+
+\echo ''
+\echo '=========================================='
+\echo 'ventas_backend INCREMENTAL ACTIVA'
+\echo '=========================================='
@@ -0,0 +1,276 @@
+-- ==================================================================================
+-- PASO 7: NOTAS DE CRÉDITO EN UN SOLO JOIN PRE-AGRUPADO
+-- ==================================================================================
+-- Descripción: ventas_backend_def calculaba tiene_nota_credito,
+--              nota_credito_monto, monto_neto y notas_credito_asociadas con
+--              cuatro subconsultas correlacionadas sobre ventas_sire (hasta
+--              cuatro búsquedas de NC por factura). Ahora:
+--
+--              - Construcción completa (ventas_backend_def): las NC se agregan
+--                UNA vez por (ruc, nro_cp_modificado, nro_doc_identidad) en un
+--                CTE y se unen con LEFT JOIN (hash join, una sola pasada).
+--              - Recálculo incremental (ventas_backend_recalcular): LEFT JOIN
+--                LATERAL con una sola búsqueda por factura, sobre el índice de
+--                expresión idx_ventas_nc_normalizado (creado en 06).
+--
+--              notas_credito_asociadas pasa a usar la misma clave que los
+--              montos (nro_cp_normalizado); en 06 comparaba el número tal cual.
+--
+--              El periodo NO forma parte de la clave: una NC suele emitirse en
+--              un periodo posterior al de la factura que modifica.
+--
+-- IMPORTANTE: Requiere 06_ventas_backend_incremental.sql aplicado (crea
+--             nro_cp_normalizado() e idx_ventas_nc_normalizado, y el trigger
+--             trg_ventas_backend_sire que llama a ventas_backend_recalcular).
+-- Benchmark: python benchmarks/benchmark_ventas_backend_nc.py --dsn ...
+-- Uso: psql -h localhost -U postgres -d crm_sunat -f 07_ventas_backend_nc_join.sql
+-- ==================================================================================
+
+\echo '=========================================='
+\echo 'NOTAS DE CRÉDITO CON JOIN PRE-AGRUPADO'
+\echo '=========================================='
+\echo ''
+
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'ventas_backend'::regclass) <> 'r' THEN
+        RAISE EXCEPTION 'ventas_backend aún es vista materializada: aplicar 06_ventas_backend_incremental.sql primero';
+    END IF;
+END $$;
+
+-- ==================================================================================
+-- 1. VISTAS
+-- ==================================================================================
+\echo '1. Vistas ventas_backend_base y ventas_backend_def...'
+
+DROP VIEW IF EXISTS ventas_backend_def;
+
+-- Columnas de la factura y del usuario asignado (sin NC)
+CREATE OR REPLACE VIEW ventas_backend_base AS
+SELECT
+    v.id,
+    v.ruc,
+    v.razon_social,
+    v.periodo,
+    v.car_sunat,
+    v.fecha_emision,
+    v.fecha_vcto_pago,
+    v.tipo_cp_doc,
+    v.serie_cdp,
+    v.nro_cp_inicial,
+    v.nro_final,
+    v.tipo_doc_identidad,
+    v.nro_doc_identidad,
+    v.apellidos_nombres_razon_social,
+    v.valor_facturado_exportacion,
+    v.bi_gravada,
+    v.dscto_bi,
+    v.igv_ipm,
+    v.dscto_igv_ipm,
+    v.mto_exonerado,
+    v.mto_inafecto,
+    v.isc,
+    v.bi_grav_ivap,
+    v.ivap,
+    v.icbper,
+    v.otros_tributos,
+    v.total_cp,
+    v.moneda,
+    v.tipo_cambio,
+    v.fecha_emision_doc_modificado,
+    v.tipo_cp_modificado,
+    v.serie_cp_modificado,
+    v.nro_cp_modificado,
+    v.id_proyecto_operadores_atribucion,
+    v.tipo_nota,
+    v.est_comp,
+    v.valor_fob_embarcado,
+    v.valor_op_gratuitas,
+    v.tipo_operacion,
+    v.dam_cp,
+    v.clu,
+    v.estado1,
+    v.estado2,
+    v.ultima_actualizacion,
+    e.email as usuario_email,
+    u.nombre as usuario_nombre,
+
+    -- monto_original: total_cp / tipo_cambio (SIN notas de crédito)
+    (CASE WHEN v.tipo_cambio IS NOT NULL AND v.tipo_cambio > 0
+     THEN v.total_cp / v.tipo_cambio
+     ELSE v.total_cp END) as monto_original
+
+FROM ventas_sire v
+LEFT JOIN enrolados e ON v.ruc = e.ruc
+LEFT JOIN usuarios u ON e.email = u.email
+WHERE v.tipo_cp_doc = '1'
+    AND v.serie_cdp NOT LIKE 'B%'
+    AND v.apellidos_nombres_razon_social != '-'
+    AND v.apellidos_nombres_razon_social IS NOT NULL;
+
+COMMENT ON VIEW ventas_backend_base IS 'Columnas de factura de ventas_backend (sin notas de crédito)';
+
+-- Construcción completa: NC agregadas una vez y unidas por hash join
+CREATE VIEW ventas_backend_def AS
+WITH nc AS (
+    SELECT
+        ruc,
+        nro_cp_normalizado(nro_cp_modificado) as nro_cp_modificado,
+        nro_doc_identidad,
+        COUNT(*) as cantidad,
+        SUM(
+            CASE WHEN tipo_cambio IS NOT NULL AND tipo_cambio > 0
+            THEN total_cp / tipo_cambio
+            ELSE total_cp END
+        ) as monto,
+        STRING_AGG(serie_cdp || '-' || nro_cp_inicial, ', ' ORDER BY fecha_emision) as asociadas
+    FROM ventas_sire
+    WHERE tipo_cp_doc = '7'
+    GROUP BY ruc, nro_cp_normalizado(nro_cp_modificado), nro_doc_identidad
+)
+SELECT
+    b.*,
+    COALESCE(nc.cantidad, 0) > 0 as tiene_nota_credito,
+    COALESCE(nc.monto, 0) as nota_credito_monto,
+    b.monto_original + COALESCE(nc.monto, 0) as monto_neto,
+    nc.asociadas as notas_credito_asociadas
+FROM ventas_backend_base b
+LEFT JOIN nc
+    ON nc.ruc = b.ruc
+   AND nc.nro_cp_modificado = b.nro_cp_inicial
+   AND nc.nro_doc_identidad = b.nro_doc_identidad;
+
+COMMENT ON VIEW ventas_backend_def IS 'Definición de las filas de ventas_backend (construcción completa, NC pre-agrupadas)';
+
+-- ==================================================================================
+-- 2. MANTENIMIENTO INCREMENTAL
+-- ==================================================================================
+\echo '2. Función de mantenimiento...'
+
+-- Una búsqueda de NC por factura (el CTE agregaría todas las NC de la BD)
+CREATE OR REPLACE FUNCTION ventas_backend_recalcular(p_ids BIGINT[])
+RETURNS void AS $$
+BEGIN
+    IF p_ids IS NULL OR cardinality(p_ids) = 0 THEN
+        RETURN;
+    END IF;
+
+    -- Espera a quien esté escribiendo estas facturas (o recalculándolas): en
+    -- READ COMMITTED la sentencia siguiente toma una foto nueva y ve su commit;
+    -- sin esto la fila se calculaba con la foto anterior y pisaba su cambio
+    PERFORM 1 FROM ventas_sire WHERE id = ANY(p_ids) ORDER BY id FOR UPDATE;
+
+    -- Upsert y luego baja de las que ya no califican: con DELETE + INSERT, dos
+    -- transacciones que recalculan la misma factura chocaban en ventas_backend_pkey
+    -- (el DELETE de la segunda espera, no encuentra nada y su INSERT falla)
+    INSERT INTO ventas_backend
+    SELECT
+        b.*,
+        nc.cantidad > 0,
+        COALESCE(nc.monto, 0),
+        b.monto_original + COALESCE(nc.monto, 0),
+        nc.asociadas
+    FROM ventas_backend_base b
+    LEFT JOIN LATERAL (
+        SELECT
+            COUNT(*) as cantidad,
+            SUM(
+                CASE WHEN s.tipo_cambio IS NOT NULL AND s.tipo_cambio > 0
+                THEN s.total_cp / s.tipo_cambio
+                ELSE s.total_cp END
+            ) as monto,
+            STRING_AGG(s.serie_cdp || '-' || s.nro_cp_inicial, ', ' ORDER BY s.fecha_emision) as asociadas
+        FROM ventas_sire s
+        WHERE s.ruc = b.ruc
+          AND s.tipo_cp_doc = '7'
+          AND nro_cp_normalizado(s.nro_cp_modificado) = b.nro_cp_inicial
+          AND s.nro_doc_identidad = b.nro_doc_identidad
+    ) nc ON true
+    WHERE b.id = ANY(p_ids)
+    ON CONFLICT (id) DO UPDATE SET
+        ruc = EXCLUDED.ruc,
+        razon_social = EXCLUDED.razon_social,
+        periodo = EXCLUDED.periodo,
+        car_sunat = EXCLUDED.car_sunat,
+        fecha_emision = EXCLUDED.fecha_emision,
+        fecha_vcto_pago = EXCLUDED.fecha_vcto_pago,
+        tipo_cp_doc = EXCLUDED.tipo_cp_doc,
+        serie_cdp = EXCLUDED.serie_cdp,
+        nro_cp_inicial = EXCLUDED.nro_cp_inicial,
+        nro_final = EXCLUDED.nro_final,
+        tipo_doc_identidad = EXCLUDED.tipo_doc_identidad,
+        nro_doc_identidad = EXCLUDED.nro_doc_identidad,
+        apellidos_nombres_razon_social = EXCLUDED.apellidos_nombres_razon_social,
+        valor_facturado_exportacion = EXCLUDED.valor_facturado_exportacion,
+        bi_gravada = EXCLUDED.bi_gravada,
+        dscto_bi = EXCLUDED.dscto_bi,
+        igv_ipm = EXCLUDED.igv_ipm,
+        dscto_igv_ipm = EXCLUDED.dscto_igv_ipm,
+        mto_exonerado = EXCLUDED.mto_exonerado,
+        mto_inafecto = EXCLUDED.mto_inafecto,
+        isc = EXCLUDED.isc,
+        bi_grav_ivap = EXCLUDED.bi_grav_ivap,
+        ivap = EXCLUDED.ivap,
+        icbper = EXCLUDED.icbper,
+        otros_tributos = EXCLUDED.otros_tributos,
+        total_cp = EXCLUDED.total_cp,
+        moneda = EXCLUDED.moneda,
+        tipo_cambio = EXCLUDED.tipo_cambio,
+        fecha_emision_doc_modificado = EXCLUDED.fecha_emision_doc_modificado,
+        tipo_cp_modificado = EXCLUDED.tipo_cp_modificado,
+        serie_cp_modificado = EXCLUDED.serie_cp_modificado,
+        nro_cp_modificado = EXCLUDED.nro_cp_modificado,
+        id_proyecto_operadores_atribucion = EXCLUDED.id_proyecto_operadores_atribucion,
+        tipo_nota = EXCLUDED.tipo_nota,
+        est_comp = EXCLUDED.est_comp,
+        valor_fob_embarcado = EXCLUDED.valor_fob_embarcado,
+        valor_op_gratuitas = EXCLUDED.valor_op_gratuitas,
+        tipo_operacion = EXCLUDED.tipo_operacion,
+        dam_cp = EXCLUDED.dam_cp,
+        clu = EXCLUDED.clu,
+        estado1 = EXCLUDED.estado1,
+        estado2 = EXCLUDED.estado2,
+        ultima_actualizacion = EXCLUDED.ultima_actualizacion,
+        usuario_email = EXCLUDED.usuario_email,
+        usuario_nombre = EXCLUDED.usuario_nombre,
+        monto_original = EXCLUDED.monto_original,
+        tiene_nota_credito = EXCLUDED.tiene_nota_credito,
+        nota_credito_monto = EXCLUDED.nota_credito_monto,
+        monto_neto = EXCLUDED.monto_neto,
+        notas_credito_asociadas = EXCLUDED.notas_credito_asociadas;
+
+    -- Las NC no deciden si una factura califica: basta ventas_backend_base
+    DELETE FROM ventas_backend vb
+    WHERE vb.id = ANY(p_ids)
+      AND NOT EXISTS (SELECT 1 FROM ventas_backend_base b WHERE b.id = vb.id);
+END;
+$$ LANGUAGE plpgsql;
+
+-- ==================================================================================
+-- 3. ALINEAR LAS FILAS EXISTENTES
+-- ==================================================================================
+\echo '3. Actualizando facturas cuyas NC asociadas cambian...'
+
+\timing on
+UPDATE ventas_backend t
+SET tiene_nota_credito = d.tiene_nota_credito,
+    nota_credito_monto = d.nota_credito_monto,
+    monto_neto = d.monto_neto,
+    notas_credito_asociadas = d.notas_credito_asociadas
+FROM ventas_backend_def d
+WHERE t.id = d.id
+  AND (t.tiene_nota_credito IS DISTINCT FROM d.tiene_nota_credito
+       OR t.nota_credito_monto IS DISTINCT FROM d.nota_credito_monto
+       OR t.monto_neto IS DISTINCT FROM d.monto_neto
+       OR t.notas_credito_asociadas IS DISTINCT FROM d.notas_credito_asociadas);
+\timing off
+
+SELECT ventas_backend_marcar_cambio();
+SELECT refresh_ventas_backend();
+
+ANALYZE ventas_backend;
+
+\echo ''
+\echo '=========================================='
+\echo 'JOIN DE NOTAS DE CRÉDITO APLICADO'
+\echo '=========================================='
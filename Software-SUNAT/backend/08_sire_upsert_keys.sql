@@ -0,0 +1,84 @@
+-- ==================================================================================
+-- PASO 8: CLAVE ÚNICA DE COMPROBANTE EN ventas_sire / compras_sire
+-- ==================================================================================
+-- Descripción: La carga masiva (ingesta/cargador.py) hace
+--              INSERT ... ON CONFLICT sobre
+--              (ruc, periodo, serie_cdp, nro_cp_inicial, tipo_cp_doc), así
+--              volver a cargar un periodo actualiza las filas en lugar de
+--              duplicarlas. ON CONFLICT necesita un índice único con esa clave.
+--              serie_cdp va con COALESCE porque un índice único no considera
+--              iguales dos NULL.
+--
+--              Si ya hay comprobantes duplicados el script se detiene y lista
+--              algunos: hay que depurarlos antes (conservando estado1/estado2).
+-- IMPORTANTE: CREATE INDEX CONCURRENTLY no puede ejecutarse dentro de una
+--             transacción (no usar psql --single-transaction). Si se
+--             interrumpe deja un índice INVALID: borrarlo y volver a ejecutar.
+-- Uso: psql -h localhost -U postgres -d crm_sunat -v ON_ERROR_STOP=1 -f 08_sire_upsert_keys.sql
+-- ==================================================================================
+
+\echo '=========================================='
+\echo 'CREANDO CLAVES ÚNICAS DE COMPROBANTES SIRE'
+\echo '=========================================='
+\echo ''
+
+-- 1. Duplicados existentes
+\echo '1. Buscando comprobantes duplicados...'
+SELECT 'ventas_sire' AS tabla, ruc, periodo, serie_cdp, nro_cp_inicial, tipo_cp_doc, COUNT(*) AS copias
+FROM ventas_sire
+GROUP BY ruc, periodo, COALESCE(serie_cdp, ''), serie_cdp, nro_cp_inicial, tipo_cp_doc
+HAVING COUNT(*) > 1
+UNION ALL
+SELECT 'compras_sire', ruc, periodo, serie_cdp, nro_cp_inicial, tipo_cp_doc, COUNT(*)
+FROM compras_sire
+GROUP BY ruc, periodo, COALESCE(serie_cdp, ''), serie_cdp, nro_cp_inicial, tipo_cp_doc
+HAVING COUNT(*) > 1
+LIMIT 20;
+
+DO $$
+DECLARE
+    dup_ventas BIGINT;
+    dup_compras BIGINT;
+BEGIN
+    SELECT COUNT(*) INTO dup_ventas FROM (
+        SELECT 1 FROM ventas_sire
+        GROUP BY ruc, periodo, COALESCE(serie_cdp, ''), nro_cp_inicial, tipo_cp_doc
+        HAVING COUNT(*) > 1
+    ) d;
+    SELECT COUNT(*) INTO dup_compras FROM (
+        SELECT 1 FROM compras_sire
+        GROUP BY ruc, periodo, COALESCE(serie_cdp, ''), nro_cp_inicial, tipo_cp_doc
+        HAVING COUNT(*) > 1
+    ) d;
+    IF dup_ventas > 0 OR dup_compras > 0 THEN
+        RAISE EXCEPTION 'Hay comprobantes duplicados (ventas_sire: %, compras_sire: %). Depurarlos antes de crear la clave única.',
+            dup_ventas, dup_compras;
+    END IF;
+END $$;
+
+-- 2. Índices únicos
+\echo '2. Índice único en ventas_sire...'
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_ventas_sire_comprobante
+    ON ventas_sire (ruc, periodo, (COALESCE(serie_cdp, '')), nro_cp_inicial, tipo_cp_doc);
+
+\echo '3. Índice único en compras_sire...'
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_compras_sire_comprobante
+    ON compras_sire (ruc, periodo, (COALESCE(serie_cdp, '')), nro_cp_inicial, tipo_cp_doc);
+
+ANALYZE ventas_sire;
+ANALYZE compras_sire;
+
+\echo ''
+\echo 'Claves únicas creadas:'
+SELECT
+    c.relname AS indice,
+    i.indisvalid AS valido,
+    pg_size_pretty(pg_relation_size(c.oid)) AS tamaño
+FROM pg_index i
+JOIN pg_class c ON c.oid = i.indexrelid
+WHERE c.relname IN ('uq_ventas_sire_comprobante', 'uq_compras_sire_comprobante');
+
+\echo ''
+\echo '=========================================='
+\echo 'CLAVES ÚNICAS SIRE CREADAS CON ÉXITO'
+\echo '=========================================='
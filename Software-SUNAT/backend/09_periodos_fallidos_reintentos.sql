@@ -0,0 +1,43 @@
+-- ==================================================================================
+-- PASO 9: REINTENTOS CON BACKOFF EN periodos_fallidos
+-- ==================================================================================
+-- Descripción: El programador de ingesta (ingesta/programador.py) registra cada
+--              descarga/carga fallida en periodos_fallidos y la reintenta con
+--              backoff exponencial hasta que queda resuelta. Agrega el contador
+--              de intentos y la hora del próximo reintento.
+-- Uso: psql -h localhost -U postgres -d crm_sunat -f 09_periodos_fallidos_reintentos.sql
+-- ==================================================================================
+
+\echo '=========================================='
+\echo 'REINTENTOS EN periodos_fallidos'
+\echo '=========================================='
+\echo ''
+
+\echo '1. Columnas intentos / proximo_intento...'
+ALTER TABLE periodos_fallidos
+    ADD COLUMN IF NOT EXISTS intentos INTEGER NOT NULL DEFAULT 1,
+    ADD COLUMN IF NOT EXISTS proximo_intento TIMESTAMP;
+
+COMMENT ON COLUMN periodos_fallidos.proximo_intento IS 'Cuándo reintentar (backoff exponencial)';
+
+-- Los fallos registrados antes de este paso se reintentan en la próxima corrida
+UPDATE periodos_fallidos
+SET proximo_intento = NOW()
+WHERE resuelto = FALSE AND proximo_intento IS NULL;
+
+\echo '2. Índice de pendientes...'
+CREATE INDEX IF NOT EXISTS idx_periodos_fallidos_pendientes
+    ON periodos_fallidos (proximo_intento)
+    WHERE resuelto = FALSE;
+
+\echo ''
+\echo 'Pendientes de reintento:'
+SELECT tipo, COUNT(*) AS pendientes, MIN(proximo_intento) AS proximo
+FROM periodos_fallidos
+WHERE resuelto = FALSE
+GROUP BY tipo;
+
+\echo ''
+\echo '=========================================='
+\echo 'REINTENTOS CONFIGURADOS CON ÉXITO'
+\echo '=========================================='
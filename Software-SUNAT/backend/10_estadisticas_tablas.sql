@@ -0,0 +1,207 @@
+-- ==================================================================================
+-- PASO 10: TOTALES DE /api/estadisticas/resumen MANTENIDOS POR TRIGGERS
+-- ==================================================================================
+-- Descripción: /api/estadisticas/resumen hacía COUNT/SUM sobre ventas_sire y
+--              compras_sire completas (más un COUNT de enrolados) en cada
+--              llamada. estadisticas_tablas guarda filas y SUM(total_cp) por
+--              tabla, y triggers por sentencia aplican solo la diferencia de
+--              cada INSERT/UPDATE/DELETE usando las tablas de transición:
+--
+--              - La ingesta SIRE (ingesta/cargador.py) hace un solo upsert por
+--                archivo, así que actualiza cada fila de estadísticas una vez
+--                por archivo.
+--              - Los cambios de estado1/estado2 no cambian filas ni total_cp y
+--                no tocan estadisticas_tablas (no compiten por su bloqueo).
+--              - TRUNCATE deja la tabla en cero.
+--
+--              recalcular_estadisticas_tablas() vuelve a contar todo (carga
+--              inicial o conciliación manual). El endpoint acepta ?exact=true
+--              para contar en vivo sin usar esta tabla.
+--
+-- Uso: psql -h localhost -U postgres -d crm_sunat -f 10_estadisticas_tablas.sql
+-- ==================================================================================
+
+\echo '=========================================='
+\echo 'ESTADÍSTICAS MANTENIDAS POR TRIGGERS'
+\echo '=========================================='
+\echo ''
+
+BEGIN;
+
+-- 1. Tabla de totales
+\echo '1. Tabla estadisticas_tablas...'
+CREATE TABLE IF NOT EXISTS estadisticas_tablas (
+    tabla VARCHAR(50) PRIMARY KEY,
+    filas BIGINT NOT NULL DEFAULT 0,
+    monto_total NUMERIC NOT NULL DEFAULT 0,
+    actualizado_en TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE estadisticas_tablas IS 'Filas y SUM(total_cp) de ventas_sire, compras_sire y enrolados. Mantenida por triggers (ver 10_estadisticas_tablas.sql)';
+
+-- 2. Recuento completo
+\echo '2. Función recalcular_estadisticas_tablas()...'
+CREATE OR REPLACE FUNCTION recalcular_estadisticas_tablas()
+RETURNS void AS $$
+BEGIN
+    -- Bloquea escrituras concurrentes mientras cuenta: un trigger que aplique
+    -- su diferencia sobre el recuento recién guardado la contaría dos veces
+    LOCK TABLE ventas_sire, compras_sire, enrolados IN SHARE MODE;
+
+    INSERT INTO estadisticas_tablas (tabla, filas, monto_total, actualizado_en)
+    SELECT 'ventas_sire', COUNT(*), COALESCE(SUM(total_cp), 0), NOW() FROM ventas_sire
+    UNION ALL
+    SELECT 'compras_sire', COUNT(*), COALESCE(SUM(total_cp), 0), NOW() FROM compras_sire
+    UNION ALL
+    SELECT 'enrolados', COUNT(*), 0, NOW() FROM enrolados
+    ON CONFLICT (tabla) DO UPDATE
+    SET filas = EXCLUDED.filas,
+        monto_total = EXCLUDED.monto_total,
+        actualizado_en = EXCLUDED.actualizado_en;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION recalcular_estadisticas_tablas() IS 'Recuenta estadisticas_tablas desde cero';
+
+-- 3. Aplicar una diferencia
+CREATE OR REPLACE FUNCTION estadisticas_aplicar(p_tabla TEXT, p_filas BIGINT, p_monto NUMERIC)
+RETURNS void AS $$
+BEGIN
+    IF p_filas = 0 AND p_monto = 0 THEN
+        RETURN;
+    END IF;
+    UPDATE estadisticas_tablas
+    SET filas = filas + p_filas,
+        monto_total = monto_total + p_monto,
+        actualizado_en = NOW()
+    WHERE tabla = p_tabla;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 4. Triggers
+\echo '3. Triggers...'
+
+-- ventas_sire / compras_sire: filas y SUM(total_cp)
+CREATE OR REPLACE FUNCTION trg_estadisticas_sire()
+RETURNS trigger AS $$
+DECLARE
+    filas BIGINT := 0;
+    monto NUMERIC := 0;
+    parcial_filas BIGINT;
+    parcial_monto NUMERIC;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        UPDATE estadisticas_tablas
+        SET filas = 0, monto_total = 0, actualizado_en = NOW()
+        WHERE tabla = TG_TABLE_NAME;
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT COUNT(*), COALESCE(SUM(total_cp), 0) INTO parcial_filas, parcial_monto FROM nuevas;
+        filas := filas + parcial_filas;
+        monto := monto + parcial_monto;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT COUNT(*), COALESCE(SUM(total_cp), 0) INTO parcial_filas, parcial_monto FROM viejas;
+        filas := filas - parcial_filas;
+        monto := monto - parcial_monto;
+    END IF;
+
+    PERFORM estadisticas_aplicar(TG_TABLE_NAME, filas, monto);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- enrolados: solo filas
+CREATE OR REPLACE FUNCTION trg_estadisticas_enrolados()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        UPDATE estadisticas_tablas
+        SET filas = 0, actualizado_en = NOW()
+        WHERE tabla = TG_TABLE_NAME;
+    ELSIF TG_OP = 'INSERT' THEN
+        PERFORM estadisticas_aplicar(TG_TABLE_NAME, (SELECT COUNT(*) FROM nuevas), 0);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM estadisticas_aplicar(TG_TABLE_NAME, -(SELECT COUNT(*) FROM viejas), 0);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_estadisticas_ventas_ins ON ventas_sire;
+DROP TRIGGER IF EXISTS trg_estadisticas_ventas_upd ON ventas_sire;
+DROP TRIGGER IF EXISTS trg_estadisticas_ventas_del ON ventas_sire;
+DROP TRIGGER IF EXISTS trg_estadisticas_ventas_trunc ON ventas_sire;
+DROP TRIGGER IF EXISTS trg_estadisticas_compras_ins ON compras_sire;
+DROP TRIGGER IF EXISTS trg_estadisticas_compras_upd ON compras_sire;
+DROP TRIGGER IF EXISTS trg_estadisticas_compras_del ON compras_sire;
+DROP TRIGGER IF EXISTS trg_estadisticas_compras_trunc ON compras_sire;
+DROP TRIGGER IF EXISTS trg_estadisticas_enrolados_ins ON enrolados;
+DROP TRIGGER IF EXISTS trg_estadisticas_enrolados_del ON enrolados;
+DROP TRIGGER IF EXISTS trg_estadisticas_enrolados_trunc ON enrolados;
+
+-- Triggers por sentencia con tablas de transición (una por evento)
+CREATE TRIGGER trg_estadisticas_ventas_ins
+    AFTER INSERT ON ventas_sire
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_estadisticas_sire();
+CREATE TRIGGER trg_estadisticas_ventas_upd
+    AFTER UPDATE ON ventas_sire
+    REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_estadisticas_sire();
+CREATE TRIGGER trg_estadisticas_ventas_del
+    AFTER DELETE ON ventas_sire
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_estadisticas_sire();
+CREATE TRIGGER trg_estadisticas_ventas_trunc
+    AFTER TRUNCATE ON ventas_sire
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_estadisticas_sire();
+
+CREATE TRIGGER trg_estadisticas_compras_ins
+    AFTER INSERT ON compras_sire
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_estadisticas_sire();
+CREATE TRIGGER trg_estadisticas_compras_upd
+    AFTER UPDATE ON compras_sire
+    REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_estadisticas_sire();
+CREATE TRIGGER trg_estadisticas_compras_del
+    AFTER DELETE ON compras_sire
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_estadisticas_sire();
+CREATE TRIGGER trg_estadisticas_compras_trunc
+    AFTER TRUNCATE ON compras_sire
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_estadisticas_sire();
+
+-- Un UPDATE de enrolados no cambia la cantidad de filas
+CREATE TRIGGER trg_estadisticas_enrolados_ins
+    AFTER INSERT ON enrolados
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_estadisticas_enrolados();
+CREATE TRIGGER trg_estadisticas_enrolados_del
+    AFTER DELETE ON enrolados
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_estadisticas_enrolados();
+CREATE TRIGGER trg_estadisticas_enrolados_trunc
+    AFTER TRUNCATE ON enrolados
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_estadisticas_enrolados();
+
+-- 5. Carga inicial (dentro de la misma transacción que crea los triggers)
+\echo '4. Recuento inicial...'
+\timing on
+SELECT recalcular_estadisticas_tablas();
+\timing off
+
+COMMIT;
+
+\echo ''
+\echo 'Estado:'
+SELECT tabla, filas, monto_total, actualizado_en FROM estadisticas_tablas ORDER BY tabla;
+
+\echo ''
+\echo '=========================================='
+\echo 'ESTADÍSTICAS MANTENIDAS CON ÉXITO'
+\echo '=========================================='
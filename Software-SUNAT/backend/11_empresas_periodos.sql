@@ -0,0 +1,166 @@
+-- ==================================================================================
+-- PASO 11: DIMENSIÓN empresas_periodos PARA EL SELECTOR DE EMPRESAS
+-- ==================================================================================
+-- Descripción: /api/ventas/empresas hacía GROUP BY ruc con MAX(razon_social)
+--              sobre ventas_sire (sin periodo: todas las facturas históricas)
+--              para llenar un dropdown. empresas_periodos guarda una fila por
+--              (ruc, periodo) con la razón social, y triggers por sentencia la
+--              mantienen con cada carga:
+--
+--              - INSERT / UPDATE: agrega los (ruc, periodo) nuevos y sube la
+--                razón social si llega una mayor (misma regla que el MAX).
+--              - DELETE / UPDATE que cambia ruc, periodo o razon_social:
+--                recalcula solo los (ruc, periodo) afectados (índice
+--                idx_ventas_ruc_periodo).
+--              - Los cambios de estado1/estado2 no tocan la tabla.
+--
+-- Uso: psql -h localhost -U postgres -d crm_sunat -f 11_empresas_periodos.sql
+-- ==================================================================================
+
+\echo '=========================================='
+\echo 'DIMENSIÓN empresas_periodos'
+\echo '=========================================='
+\echo ''
+
+BEGIN;
+
+-- 1. Tabla
+\echo '1. Tabla empresas_periodos...'
+CREATE TABLE IF NOT EXISTS empresas_periodos (
+    ruc VARCHAR(11) NOT NULL,
+    periodo VARCHAR(6) NOT NULL,
+    razon_social VARCHAR(500) NOT NULL,
+    PRIMARY KEY (ruc, periodo)
+);
+
+CREATE INDEX IF NOT EXISTS idx_empresas_periodos_periodo ON empresas_periodos (periodo);
+
+COMMENT ON TABLE empresas_periodos IS 'RUC y razón social (MAX) por periodo con ventas en ventas_sire. Mantenida por triggers (ver 11_empresas_periodos.sql)';
+
+-- 2. Recalcular pares (ruc, periodo)
+\echo '2. Funciones de mantenimiento...'
+CREATE OR REPLACE FUNCTION empresas_periodos_recalcular(p_rucs TEXT[], p_periodos TEXT[])
+RETURNS void AS $$
+BEGIN
+    -- Pares sin facturas válidas: se eliminan
+    DELETE FROM empresas_periodos e
+    USING unnest(p_rucs, p_periodos) AS a(ruc, periodo)
+    WHERE e.ruc = a.ruc AND e.periodo = a.periodo;
+
+    -- Otra transacción puede haber insertado el mismo par sin commit todavía
+    -- (el DELETE no lo ve): sin ON CONFLICT la espera termina en unique_violation
+    INSERT INTO empresas_periodos (ruc, periodo, razon_social)
+    SELECT v.ruc, v.periodo, MAX(v.razon_social)
+    FROM (SELECT DISTINCT ruc, periodo FROM unnest(p_rucs, p_periodos) AS a(ruc, periodo)) a
+    JOIN ventas_sire v ON v.ruc = a.ruc AND v.periodo = a.periodo
+    WHERE v.razon_social IS NOT NULL
+      AND v.razon_social NOT IN ('', '-')
+    GROUP BY v.ruc, v.periodo
+    ON CONFLICT (ruc, periodo) DO UPDATE
+    SET razon_social = EXCLUDED.razon_social;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_empresas_periodos()
+RETURNS trigger AS $$
+DECLARE
+    rucs TEXT[];
+    periodos TEXT[];
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        DELETE FROM empresas_periodos;
+        RETURN NULL;
+    END IF;
+
+    -- Filas que pueden haber quitado un (ruc, periodo) o bajado su razón social
+    IF TG_OP = 'DELETE' THEN
+        SELECT array_agg(ruc), array_agg(periodo) INTO rucs, periodos
+        FROM (SELECT DISTINCT ruc, periodo FROM viejas) t;
+    ELSIF TG_OP = 'UPDATE' THEN
+        SELECT array_agg(ruc), array_agg(periodo) INTO rucs, periodos
+        FROM (
+            SELECT DISTINCT o.ruc, o.periodo
+            FROM viejas o
+            JOIN nuevas n ON n.id = o.id
+            WHERE (o.ruc, o.periodo, o.razon_social) IS DISTINCT FROM (n.ruc, n.periodo, n.razon_social)
+        ) t;
+    END IF;
+
+    IF rucs IS NOT NULL THEN
+        PERFORM empresas_periodos_recalcular(rucs, periodos);
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO empresas_periodos AS e (ruc, periodo, razon_social)
+        SELECT ruc, periodo, MAX(razon_social)
+        FROM nuevas
+        WHERE ruc IS NOT NULL
+          AND periodo IS NOT NULL
+          AND razon_social IS NOT NULL
+          AND razon_social NOT IN ('', '-')
+        GROUP BY ruc, periodo
+        ON CONFLICT (ruc, periodo) DO UPDATE
+        SET razon_social = EXCLUDED.razon_social
+        WHERE EXCLUDED.razon_social > e.razon_social;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 3. Triggers
+\echo '3. Triggers...'
+DROP TRIGGER IF EXISTS trg_empresas_periodos_ins ON ventas_sire;
+DROP TRIGGER IF EXISTS trg_empresas_periodos_upd ON ventas_sire;
+DROP TRIGGER IF EXISTS trg_empresas_periodos_del ON ventas_sire;
+DROP TRIGGER IF EXISTS trg_empresas_periodos_trunc ON ventas_sire;
+
+-- Triggers por sentencia con tablas de transición (una por evento)
+CREATE TRIGGER trg_empresas_periodos_ins
+    AFTER INSERT ON ventas_sire
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_empresas_periodos();
+CREATE TRIGGER trg_empresas_periodos_upd
+    AFTER UPDATE ON ventas_sire
+    REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_empresas_periodos();
+CREATE TRIGGER trg_empresas_periodos_del
+    AFTER DELETE ON ventas_sire
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_empresas_periodos();
+CREATE TRIGGER trg_empresas_periodos_trunc
+    AFTER TRUNCATE ON ventas_sire
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_empresas_periodos();
+
+-- 4. Carga inicial (bloquea escrituras en ventas_sire hasta el COMMIT)
+\echo '4. Carga inicial...'
+LOCK TABLE ventas_sire IN SHARE MODE;
+
+\timing on
+DELETE FROM empresas_periodos;
+INSERT INTO empresas_periodos (ruc, periodo, razon_social)
+SELECT ruc, periodo, MAX(razon_social)
+FROM ventas_sire
+WHERE ruc IS NOT NULL
+  AND periodo IS NOT NULL
+  AND razon_social IS NOT NULL
+  AND razon_social NOT IN ('', '-')
+GROUP BY ruc, periodo;
+\timing off
+
+COMMIT;
+
+ANALYZE empresas_periodos;
+
+\echo ''
+\echo 'Estado:'
+SELECT
+    COUNT(*) AS filas,
+    COUNT(DISTINCT ruc) AS empresas,
+    COUNT(DISTINCT periodo) AS periodos
+FROM empresas_periodos;
+
+\echo ''
+\echo '=========================================='
+\echo 'empresas_periodos CREADA CON ÉXITO'
+\echo '=========================================='
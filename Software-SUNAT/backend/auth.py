@@ -3,25 +3,152 @@ Módulo de autenticación Firebase para el backend de Software-SUNAT.
 Proporciona middleware para verificar tokens JWT de Firebase.
 """
 
+import copy
+import hashlib
+import os
+import threading
+import time
 from typing import Optional
-from fastapi import Header, HTTPException, Depends
+from fastapi import Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event, inspect as sa_inspect
 from sqlalchemy.orm import Session
 import firebase_admin
 from firebase_admin import credentials, auth
 import logging
 
-from database import get_db
+from cache import TTLCache
+from database import SessionLocal
+import empresas_cache
+from last_seen import last_seen_tracker
 from models import Enrolado, Usuario
 
-# Inicializar Firebase Admin SDK
-try:
-    if not firebase_admin._apps:
-        # Usar Application Default Credentials (funciona en local y GCP)
-        firebase_admin.initialize_app(credentials.ApplicationDefault())
-    logging.info("Firebase Admin SDK inicializado correctamente")
-except Exception as e:
-    logging.warning(f"No se pudo inicializar Firebase Admin SDK: {e}")
-    logging.warning("La autenticación Firebase no estará disponible")
+logger = logging.getLogger(__name__)
+
+# ==================== FIREBASE ADMIN SDK ====================
+
+_firebase_lock = threading.Lock()
+
+
+def inicializar_firebase() -> None:
+    """
+    Inicializa Firebase Admin SDK la primera vez que se necesita (no al
+    importar: no suma al arranque en frío). main.py lo llama en segundo plano
+    al arrancar para que el primer request no lo pague.
+    """
+    if firebase_admin._apps:
+        return
+    with _firebase_lock:
+        if firebase_admin._apps:
+            return
+        try:
+            # Usar Application Default Credentials (funciona en local y GCP)
+            firebase_admin.initialize_app(credentials.ApplicationDefault())
+            logger.info("Firebase Admin SDK inicializado correctamente")
+        except Exception as e:
+            logger.warning("No se pudo inicializar Firebase Admin SDK: %s", e)
+            logger.warning("La autenticación Firebase no estará disponible")
+
+
+# ==================== CACHÉ DE TOKENS Y CONTEXTOS ====================
+
+# Tope de vida de una entrada aunque el token siga vigente: los cambios de rol o
+# de enrolados hechos desde OTRA instancia solo se ven al expirar la entrada.
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "300"))
+AUTH_CACHE_MAXSIZE = int(os.getenv("AUTH_CACHE_MAXSIZE", "2048"))
+
+# hash(token) -> {"claims": dict, "context": dict | None}
+_token_cache = TTLCache(maxsize=AUTH_CACHE_MAXSIZE, ttl=AUTH_CACHE_TTL)
+
+
+def _hash_token(token: str) -> str:
+    """Clave de caché: nunca se guarda el token en claro"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _ttl_para_claims(claims: dict) -> float:
+    """TTL de la entrada: hasta que expire el token, con tope AUTH_CACHE_TTL"""
+    exp = claims.get("exp")
+    if not exp:
+        return AUTH_CACHE_TTL
+    return min(float(exp) - time.time(), AUTH_CACHE_TTL)
+
+
+def _verificar_token_cacheado(token: str) -> dict:
+    """
+    Verifica un ID token de Firebase reutilizando la verificación previa si el
+    mismo token ya fue validado y aún no expiró.
+
+    Raises:
+        auth.InvalidIdTokenError (y demás errores de firebase_admin) si el token no es válido
+    """
+    key = _hash_token(token)
+    entry = _token_cache.get(key)
+    if entry is not None:
+        return entry["claims"]
+
+    inicializar_firebase()
+    claims = auth.verify_id_token(token)
+    _token_cache.set(key, {"claims": claims, "context": None}, ttl=_ttl_para_claims(claims))
+    return claims
+
+
+def invalidar_cache_usuarios() -> None:
+    """
+    Descarta todos los contextos cacheados.
+    Llamar cuando cambien roles de usuarios o la asignación de enrolados.
+    """
+    _token_cache.clear()
+    # El selector de empresas depende de la asignación de enrolados
+    empresas_cache.invalidate()
+    logger.info("Caché de contextos de usuario invalidada")
+
+
+def get_auth_cache_stats() -> dict:
+    """Contadores de aciertos/fallos de la caché de autenticación"""
+    return _token_cache.stats()
+
+
+def _afecta_contexto_usuarios(session: Session) -> bool:
+    """True si la sesión tiene cambios pendientes que alteran algún contexto cacheado"""
+    for obj in session.new:
+        if isinstance(obj, Enrolado):
+            return True
+    for obj in session.deleted:
+        if isinstance(obj, (Enrolado, Usuario)):
+            return True
+    for obj in session.dirty:
+        if isinstance(obj, Enrolado) and sa_inspect(obj).attrs.email.history.has_changes():
+            return True
+        if isinstance(obj, Usuario) and sa_inspect(obj).attrs.rol.history.has_changes():
+            return True
+    return False
+
+
+@event.listens_for(Session, "before_flush")
+def _marcar_cambios_de_acceso(session, flush_context, instances):
+    if _afecta_contexto_usuarios(session):
+        session.info["invalidar_contextos"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _marcar_updates_masivos(orm_execute_state):
+    # UPDATE/DELETE masivos (ej. /admin/assign-all-enrolados) no pasan por el flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ in (Enrolado, Usuario):
+            orm_execute_state.session.info["invalidar_contextos"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidar_tras_commit(session):
+    if session.info.pop("invalidar_contextos", False):
+        invalidar_cache_usuarios()
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_marca_tras_rollback(session):
+    session.info.pop("invalidar_contextos", None)
 
 
 async def get_current_user_email(
@@ -47,7 +174,7 @@ async def get_current_user_email(
 
     try:
         token = authorization.split("Bearer ")[1]
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = await run_in_threadpool(_verificar_token_cacheado, token)
         email = decoded_token.get('email')
 
         if not email:
@@ -58,13 +185,15 @@ async def get_current_user_email(
 
         return email
 
+    except HTTPException:
+        raise
     except auth.InvalidIdTokenError:
         raise HTTPException(
             status_code=401,
             detail="Token de Firebase inválido o expirado"
         )
     except Exception as e:
-        logging.error(f"Error verificando token Firebase: {e}")
+        logger.error("Error verificando token Firebase: %s", e)
         raise HTTPException(
             status_code=401,
             detail=f"Error al verificar autenticación: {str(e)}"
@@ -95,13 +224,11 @@ def get_or_create_user(user_email: str, user_name: str, db: Session) -> Usuario:
         db.add(usuario)
         db.commit()
         db.refresh(usuario)
-        logging.info(f"Nuevo usuario registrado: {user_email} con rol 'usuario'")
+        logger.info("Nuevo usuario registrado: %s con rol 'usuario'", user_email)
     else:
-        # Actualizar último ingreso
-        from datetime import datetime, timezone
-        usuario.ultimo_ingreso = datetime.now(timezone.utc)
-        db.commit()
-        logging.info(f"Usuario {user_email} autenticado (rol: {usuario.rol})")
+        # Último ingreso: se anota en memoria y se persiste en lote (ver last_seen.py)
+        last_seen_tracker.touch(user_email)
+        logger.debug("Usuario %s autenticado (rol: %s)", user_email, usuario.rol)
 
     return usuario
 
@@ -121,25 +248,115 @@ def get_authorized_rucs(user_email: str, user_rol: str, db: Session) -> Optional
     """
     # Admin ve TODOS los RUCs
     if user_rol == 'admin':
-        logging.info(f"Usuario {user_email} es ADMIN - acceso a todos los RUCs")
+        logger.debug("Usuario %s es ADMIN - acceso a todos los RUCs", user_email)
         return None
 
     # Usuario normal: filtrar por enrolados.email
     enrolados = db.query(Enrolado).filter(Enrolado.email == user_email).all()
 
     if not enrolados:
-        logging.warning(f"Usuario {user_email} no tiene enrolados asociados")
+        logger.warning("Usuario %s no tiene enrolados asociados", user_email)
         return []
 
     rucs = [enrolado.ruc for enrolado in enrolados]
-    logging.info(f"Usuario {user_email} tiene acceso a {len(rucs)} RUCs: {rucs}")
+    logger.debug("Usuario %s tiene acceso a %d RUCs", user_email, len(rucs))
 
     return rucs
 
 
+def _obtener_nombre_firebase(email: str) -> str:
+    """Nombre visible del usuario en Firebase (llamada de red: usar solo si el token no lo trae)"""
+    try:
+        from firebase_admin import auth as firebase_auth
+        inicializar_firebase()
+        user_record = firebase_auth.get_user_by_email(email)
+        return user_record.display_name or email.split('@')[0]
+    except Exception:
+        return email.split('@')[0]
+
+
+def _contexto_cacheado(token: str) -> Optional[dict]:
+    """Contexto cacheado para el token (solo memoria, sin I/O), o None"""
+    entry = _token_cache.get(_hash_token(token))
+    if entry is None or entry["context"] is None:
+        return None
+    last_seen_tracker.touch(entry["context"]["email"])
+    # Copia: los endpoints no deben poder alterar la entrada cacheada
+    return copy.deepcopy(entry["context"])
+
+
+def _resolver_contexto(token: str, db: Session) -> Optional[dict]:
+    """
+    Resuelve el contexto completo del usuario para un token ya extraído del header.
+
+    El contexto se cachea por hash del token hasta que el token expira (con tope
+    AUTH_CACHE_TTL), así las llamadas en paralelo del dashboard no repiten la
+    verificación, la consulta a Firebase ni las consultas de usuario/enrolados.
+
+    Returns:
+        dict con email, nombre, rol y authorized_rucs, o None si el token no trae email
+
+    Raises:
+        Errores de firebase_admin si el token no es válido
+    """
+    context = _contexto_cacheado(token)
+    if context is not None:
+        return context
+
+    key = _hash_token(token)
+    entry = _token_cache.get(key)
+    if entry is not None:
+        claims = entry["claims"]
+    else:
+        inicializar_firebase()
+        claims = auth.verify_id_token(token)
+
+    email = claims.get('email')
+    if not email:
+        return None
+
+    user_name = claims.get('name') or _obtener_nombre_firebase(email)
+    usuario = get_or_create_user(email, user_name, db)
+
+    # Obtener RUCs autorizados según rol
+    authorized_rucs = get_authorized_rucs(email, usuario.rol, db)
+
+    context = {
+        "email": email,
+        "nombre": usuario.nombre,
+        "rol": usuario.rol,
+        "authorized_rucs": authorized_rucs  # None si es admin, lista si es usuario
+    }
+    _token_cache.set(
+        key, {"claims": claims, "context": context}, ttl=_ttl_para_claims(claims)
+    )
+
+    return copy.deepcopy(context)
+
+
+def _resolver_contexto_con_sesion(token: str) -> Optional[dict]:
+    db = SessionLocal()
+    try:
+        return _resolver_contexto(token, db)
+    finally:
+        db.close()
+
+
+async def _obtener_contexto(token: str) -> Optional[dict]:
+    """
+    Contexto del usuario sin bloquear el event loop: un acierto de caché se
+    resuelve en memoria; si no, la verificación del token (red) y las consultas
+    de usuario/enrolados corren en el threadpool con una sesión propia, que se
+    cierra antes de que empiece el endpoint.
+    """
+    context = _contexto_cacheado(token)
+    if context is not None:
+        return context
+    return await run_in_threadpool(_resolver_contexto_con_sesion, token)
+
+
 async def get_user_context(
-    email: str = Depends(get_current_user_email),
-    db: Session = Depends(get_db)
+    authorization: Optional[str] = Header(None),
 ) -> dict:
     """
     Dependencia combinada que retorna el contexto completo del usuario:
@@ -148,6 +365,8 @@ async def get_user_context(
     - rol: Rol del usuario ('admin' o 'usuario')
     - authorized_rucs: Lista de RUCs a los que tiene acceso (None si es admin)
 
+    El contexto se cachea por token (ver _resolver_contexto).
+
     Uso en endpoints:
         @app.get("/api/ventas")
         def get_ventas(user_context: dict = Depends(get_user_context)):
@@ -155,33 +374,37 @@ async def get_user_context(
             rol = user_context["rol"]
             rucs = user_context["authorized_rucs"]  # None si es admin
     """
-    # Obtener o crear usuario (con rol)
-    # Intentar extraer nombre del token de Firebase
-    try:
-        from firebase_admin import auth as firebase_auth
-        user_record = firebase_auth.get_user_by_email(email)
-        user_name = user_record.display_name or email.split('@')[0]
-    except Exception:
-        user_name = email.split('@')[0]
-
-    usuario = get_or_create_user(email, user_name, db)
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(
+            status_code=401,
+            detail="Token de autorización no proporcionado o inválido"
+        )
 
-    # Obtener RUCs autorizados según rol
-    authorized_rucs = get_authorized_rucs(email, usuario.rol, db)
+    try:
+        context = await _obtener_contexto(authorization.split("Bearer ")[1])
+    except auth.InvalidIdTokenError:
+        raise HTTPException(
+            status_code=401,
+            detail="Token de Firebase inválido o expirado"
+        )
+    except Exception as e:
+        logger.error("Error verificando token Firebase: %s", e)
+        raise HTTPException(
+            status_code=401,
+            detail=f"Error al verificar autenticación: {str(e)}"
+        )
 
-    logging.info(f"✅ Usuario autenticado: {email}, rol: {usuario.rol}, RUCs: {authorized_rucs}")
+    if context is None:
+        raise HTTPException(
+            status_code=401,
+            detail="Token válido pero sin email asociado"
+        )
 
-    return {
-        "email": email,
-        "nombre": usuario.nombre,
-        "rol": usuario.rol,
-        "authorized_rucs": authorized_rucs  # None si es admin, lista si es usuario
-    }
+    return context
 
 
 async def get_optional_user_context(
     authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
 ) -> Optional[dict]:
     """
     Dependencia de autenticación OPCIONAL.
@@ -200,38 +423,16 @@ async def get_optional_user_context(
     """
     # Si no hay header de autorización, retornar None (acceso público)
     if not authorization or not authorization.startswith("Bearer "):
-        logging.info("Acceso público sin autenticación")
+        logger.debug("Acceso público sin autenticación")
         return None
 
     try:
-        # Validar token y obtener email
-        token = authorization.split("Bearer ")[1]
-        decoded_token = auth.verify_id_token(token)
-        email = decoded_token.get('email')
-
-        if not email:
-            logging.warning("Token válido pero sin email")
-            return None
-
-        # Obtener contexto de usuario
-        try:
-            from firebase_admin import auth as firebase_auth
-            user_record = firebase_auth.get_user_by_email(email)
-            user_name = user_record.display_name or email.split('@')[0]
-        except Exception:
-            user_name = email.split('@')[0]
-
-        usuario = get_or_create_user(email, user_name, db)
-        authorized_rucs = get_authorized_rucs(email, usuario.rol, db)
-
-        return {
-            "email": email,
-            "nombre": usuario.nombre,
-            "rol": usuario.rol,
-            "authorized_rucs": authorized_rucs
-        }
+        context = await _obtener_contexto(authorization.split("Bearer ")[1])
+        if context is None:
+            logger.warning("Token válido pero sin email")
+        return context
 
     except Exception as e:
         # Si hay error en validación de token, permitir acceso público
-        logging.warning(f"Error al validar token (permitiendo acceso público): {e}")
+        logger.warning("Error al validar token (permitiendo acceso público): %s", e)
         return None
@@ -0,0 +1,148 @@
+"""
+Benchmark: serialización de una página de /api/ventas por el camino Pydantic
+(VentaResponse.from_orm_with_calculation por fila + PaginatedResponse +
+JSONResponse) vs. ventas_serializer.ventas_page_json.
+
+No necesita base de datos: genera filas sintéticas con la misma forma que las
+que devuelve VentaBackendRepository (Decimal, fechas, nombres con tildes, NC
+positivas y negativas, tipo_cambio nulo). Antes de medir verifica que ambos
+caminos producen exactamente los mismos bytes.
+
+Uso:
+    python benchmarks/benchmark_ventas_serializer.py --filas 10000 --repeticiones 5
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schemas import PaginatedResponse, PaginationMetadata, VentaResponse  # noqa: E402
+from ventas_serializer import ventas_page_json  # noqa: E402
+
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+Fila = namedtuple("Fila", [
+    "id", "ruc", "razon_social", "periodo", "car_sunat", "fecha_emision",
+    "tipo_cp_doc", "serie_cdp", "nro_cp_inicial", "nro_doc_identidad",
+    "apellidos_nombres_razon_social", "total_cp", "moneda", "tipo_cambio",
+    "estado1", "estado2", "nota_credito_monto", "monto_neto",
+    "usuario_nombre", "usuario_email",
+])
+
+ESTADOS = [None, "Sin gestión", "Gestionando", "Ganada", "Perdida"]
+
+
+def generar_filas(cantidad: int, semilla: int = 7) -> list:
+    rnd = random.Random(semilla)
+    filas = []
+    for i in range(cantidad):
+        total = Decimal(rnd.randint(0, 5_000_000)) / 100
+        moneda = "USD" if i % 5 == 0 else "PEN"
+        if i % 50 == 0:
+            tipo_cambio = None
+        elif moneda == "USD":
+            tipo_cambio = Decimal("3.7") + Decimal(rnd.randint(0, 999)) / 10000
+        else:
+            tipo_cambio = Decimal("1.000")
+        if i % 10 == 0:
+            nc = -total * Decimal(rnd.choice([1, 2])) / 2
+        elif i % 97 == 0:
+            nc = -total - 10  # NC mayor al total: monto_neto se corta en 0
+        else:
+            nc = Decimal("0")
+        estado1 = ESTADOS[i % len(ESTADOS)]
+        filas.append(Fila(
+            id=i + 1,
+            ruc=f"20{i % 400:09d}",
+            razon_social=f"Compañía Ñandú {i % 400} S.A.C.",
+            periodo="202409",
+            car_sunat=None if i % 3 else f"CAR{i:010d}",
+            fecha_emision=date(2024, 9, 1) + timedelta(days=i % 30),
+            tipo_cp_doc="1",
+            serie_cdp=f"F{i % 9:03d}",
+            nro_cp_inicial=str(i),
+            nro_doc_identidad=f"10{i % 9999:09d}",
+            apellidos_nombres_razon_social=f"Cliente «{i}» Peña",
+            total_cp=total,
+            moneda=moneda,
+            tipo_cambio=tipo_cambio,
+            estado1=estado1,
+            estado2="Por Tasa" if estado1 == "Perdida" else None,
+            nota_credito_monto=nc,
+            monto_neto=total + nc,
+            usuario_nombre=None if i % 7 == 0 else "Ana Núñez",
+            usuario_email=None if i % 7 == 0 else "ana@example.com",
+        ))
+    return filas
+
+
+def camino_pydantic(filas: list, pagination: PaginationMetadata) -> bytes:
+    items = [
+        VentaResponse.from_orm_with_calculation(
+            venta, venta.usuario_nombre, venta.usuario_email, venta.nota_credito_monto
+        )
+        for venta in filas
+    ]
+    respuesta = PaginatedResponse[VentaResponse](items=items, pagination=pagination)
+    return JSONResponse(jsonable_encoder(respuesta)).body
+
+
+def camino_directo(filas: list, pagination: PaginationMetadata) -> bytes:
+    return ventas_page_json(filas, pagination)
+
+
+def medir(fn, filas, pagination, repeticiones: int) -> float:
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fn(filas, pagination)
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--filas", type=int, default=10000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    filas = generar_filas(args.filas)
+    pagination = PaginationMetadata.create(
+        total=1_700_000, page=3, page_size=args.filas, has_next=True,
+        next_cursor="eyJmIjoiMjAyNC0wOS0wMSJ9", total_is_estimate=True,
+    )
+
+    antes = camino_pydantic(filas, pagination)
+    despues = camino_directo(filas, pagination)
+    if antes != despues:
+        for i, (a, b) in enumerate(zip(antes, despues)):
+            if a != b:
+                break
+        print("❌ Las salidas difieren cerca del byte", i)
+        print("   pydantic:", antes[max(0, i - 80):i + 80])
+        print("   directo: ", despues[max(0, i - 80):i + 80])
+        sys.exit(1)
+    print(f"✅ Salidas idénticas ({len(antes):,} bytes, {args.filas:,} filas)")
+
+    t_antes = medir(camino_pydantic, filas, pagination, args.repeticiones)
+    t_despues = medir(camino_directo, filas, pagination, args.repeticiones)
+
+    print(f"\n{'Camino':<12}{'Mejor (ms)':>12}{'µs/fila':>10}")
+    print(f"{'pydantic':<12}{t_antes * 1000:>12.1f}{t_antes * 1e6 / args.filas:>10.2f}")
+    print(f"{'directo':<12}{t_despues * 1000:>12.1f}{t_despues * 1e6 / args.filas:>10.2f}")
+    print(f"\nAceleración: {t_antes / t_despues:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
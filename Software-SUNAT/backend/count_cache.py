@@ -0,0 +1,174 @@
+"""
+Conteos de facturas cacheados para /api/ventas y /api/ventas/count.
+
+Contar el conjunto filtrado completo de ventas_backend (hasta ~1.7M filas para
+un admin sin filtro de RUC) en cada cambio de página es el paso más caro de la
+paginación. Este módulo:
+
+- Cachea conteos exactos por firma normalizada de filtros.
+- Se invalida cuando se refresca ventas_backend (invalidate_counts).
+- Cuando no hay conteo en caché, la página NO espera el COUNT: responde con
+  la estimación del planner de PostgreSQL y calcula el conteo exacto en segundo
+  plano para las siguientes páginas (en la réplica de lectura si hay una).
+- Durante DB_REPLICA_LECTURA_PROPIA_S segundos después de invalidar, la réplica
+  puede no tener aún la carga: el conteo en segundo plano va al primario y los
+  totales leídos en el request (que puede ir a la réplica) no se cachean.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Optional, Tuple
+
+from cache import TTLCache
+from database import DB_REPLICA_LECTURA_PROPIA_S, SessionLectura, SessionLocal, engine_replica
+
+logger = logging.getLogger(__name__)
+
+# Tope de vida de un conteo aunque nadie invalide (refrescos hechos desde otra instancia)
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "600"))
+
+COUNT_MODES = ("auto", "exact", "estimate")
+
+_counts = TTLCache(maxsize=4096, ttl=COUNT_CACHE_TTL)
+_version = 0
+_invalidado_en = float("-inf")
+_lock = threading.Lock()
+_en_curso: set = set()
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="count-cache")
+
+
+def filter_signature(**filtros) -> tuple:
+    """
+    Firma canónica de un conjunto de filtros: el orden de las listas, los
+    duplicados y la diferencia entre None y lista vacía en filtros opcionales
+    no generan entradas distintas. authorized_rucs conserva la diferencia entre
+    None (admin, sin filtro) y [] (sin acceso).
+    """
+    firma = []
+    for nombre in sorted(filtros):
+        valor = filtros[nombre]
+        if isinstance(valor, (list, tuple, set)):
+            valor = tuple(sorted(set(valor)))
+            if not valor and nombre != "authorized_rucs":
+                valor = None
+        elif isinstance(valor, date):
+            valor = valor.isoformat()
+        elif valor == "":
+            valor = None
+        firma.append((nombre, valor))
+    return tuple(firma)
+
+
+def get_cached_count(firma: tuple) -> Optional[int]:
+    """Conteo exacto cacheado para la firma, o None"""
+    return _counts.get((_version, firma))
+
+
+def store_count(firma: tuple, total: int, version: Optional[int] = None) -> None:
+    """Guarda un conteo exacto (se descarta si hubo una invalidación entretanto)"""
+    with _lock:
+        if version is not None and version != _version:
+            return
+        _counts.set((_version, firma), total)
+
+
+def invalidate_counts() -> None:
+    """Invalida todos los conteos. Llamar después de refrescar ventas_backend."""
+    global _version, _invalidado_en
+    with _lock:
+        _version += 1
+        _invalidado_en = time.monotonic()
+    _counts.clear()
+
+
+def _replica_al_dia() -> bool:
+    """False si hay réplica y la última invalidación cae dentro de su lag tolerado"""
+    return engine_replica is None or time.monotonic() - _invalidado_en >= DB_REPLICA_LECTURA_PROPIA_S
+
+
+def _contar_en_segundo_plano(firma: tuple, filtros: dict, version: int) -> None:
+    from repositories.venta_backend_repository import VentaBackendRepository
+
+    # Se guarda como exacto por COUNT_CACHE_TTL: recién invalidado, contar en el primario
+    db = SessionLectura() if _replica_al_dia() else SessionLocal()
+    try:
+        total = VentaBackendRepository(db).get_ventas_count(**filtros)
+        store_count(firma, total, version=version)
+    except Exception as e:
+        logger.error(f"Error calculando conteo exacto en segundo plano: {e}")
+    finally:
+        db.close()
+        with _lock:
+            _en_curso.discard((version, firma))
+
+
+def schedule_exact_count(firma: tuple, filtros: dict) -> None:
+    """Calcula el conteo exacto en segundo plano (una sola vez por firma)"""
+    with _lock:
+        clave = (_version, firma)
+        if clave in _en_curso:
+            return
+        _en_curso.add(clave)
+        version = _version
+    _executor.submit(_contar_en_segundo_plano, firma, filtros, version)
+
+
+async def resolve_total_async(
+    repo,
+    filtros: dict,
+    count_mode: str = "auto",
+    minimo: int = 0,
+    exacto: bool = False,
+) -> Tuple[int, bool]:
+    """
+    Resuelve el total de facturas para una respuesta paginada. El conteo
+    exacto en segundo plano (count_mode='auto') usa una sesión sync propia.
+
+    Args:
+        repo: AsyncVentaBackendRepository de la sesión del request
+        filtros: Filtros de get_ventas_count
+        count_mode: 'auto' (caché o estimación + conteo en segundo plano),
+                    'exact' (caché o COUNT exacto bloqueante),
+                    'estimate' (caché o estimación del planner)
+        minimo: Cota inferior conocida (filas ya vistas hasta la página actual)
+        exacto: True si `minimo` ya es el total exacto (última página alcanzada)
+
+    Returns:
+        Tuple (total, es_estimado)
+    """
+    firma = filter_signature(**filtros)
+
+    total = get_cached_count(firma)
+    if total is not None:
+        return total, False
+
+    # La sesión del request puede leer de la réplica
+    guardar = _replica_al_dia()
+
+    if exacto:
+        if guardar:
+            store_count(firma, minimo)
+        return minimo, False
+
+    if count_mode == "exact":
+        total = await repo.get_ventas_count(**filtros)
+        if guardar:
+            store_count(firma, total)
+        return total, False
+
+    estimado = max(await repo.estimate_ventas_count(**filtros), minimo)
+    if count_mode == "auto":
+        schedule_exact_count(firma, filtros)
+    return estimado, True
+
+
+def stats() -> dict:
+    """Estadísticas de la caché de conteos"""
+    data = _counts.stats()
+    data["version"] = _version
+    data["conteos_en_curso"] = len(_en_curso)
+    return data
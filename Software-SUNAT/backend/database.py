@@ -1,56 +1,92 @@
 from dotenv import load_dotenv
 import os
-from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 import logging
-from google.cloud.sql.connector import Connector
 
-load_dotenv() 
+from engine_factory import conector_cloud_sql, crear_engine, crear_sessionmaker_enrutado
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
 
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_NAME = os.getenv("DB_NAME")
-CLOUD_SQL_CONNECTION_NAME = os.getenv("CLOUD_SQL_CONNECTION_NAME") 
+CLOUD_SQL_CONNECTION_NAME = os.getenv("CLOUD_SQL_CONNECTION_NAME")
+# Postgres directo (p. ej. local), sin Cloud SQL Connector
+DATABASE_URL = os.getenv("DATABASE_URL")
+# Réplica de lectura opcional (mismo usuario y base); sin ninguna de las dos,
+# las lecturas van al primario
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+CLOUD_SQL_REPLICA_CONNECTION_NAME = os.getenv("CLOUD_SQL_REPLICA_CONNECTION_NAME")
+# Lag tolerado de la réplica: tras una escritura, lo que se lea de ella durante
+# estos segundos puede no incluirla (ver replica_routing.py)
+DB_REPLICA_LECTURA_PROPIA_S = float(os.getenv("DB_REPLICA_LECTURA_PROPIA_S", "10"))
+
+# Conexiones que se abren en segundo plano al arrancar (0 = ninguna)
+DB_POOL_PREWARM = int(os.getenv("DB_POOL_PREWARM", "2"))
+
+_conectar = conector_cloud_sql()
 
-if not CLOUD_SQL_CONNECTION_NAME:
-    raise ValueError("ERROR: La variable de entorno CLOUD_SQL_CONNECTION_NAME no está definida.")
-if not DB_USER:
-    raise ValueError("ERROR: La variable de entorno DB_USER no está definida.")
-if not DB_PASSWORD:
-    raise ValueError("ERROR: La variable de entorno DB_PASSWORD no está definida.")
-if not DB_NAME:
-    raise ValueError("ERROR: La variable de entorno DB_NAME no está definida.")
 
-print(f"[INFO] Configurando conexión para: {CLOUD_SQL_CONNECTION_NAME}")
+def validar_variables(variable_instancia: str, instancia: str) -> None:
+    """Falla con un mensaje claro si falta alguna variable de Cloud SQL"""
+    for nombre, valor in (
+        (variable_instancia, instancia),
+        ("DB_USER", DB_USER),
+        ("DB_PASSWORD", DB_PASSWORD),
+        ("DB_NAME", DB_NAME),
+    ):
+        if not valor:
+            raise ValueError(f"ERROR: La variable de entorno {nombre} no está definida.")
 
-connector = Connector()
 
 def getconn():
-    """Función helper para el conector"""
-    conn = connector.connect(
+    """
+    Función helper para el conector.
+
+    No se conecta nada al importar este módulo: el pool llama a getconn al abrir
+    la primera conexión, y recién ahí se validan las variables de Cloud SQL.
+    """
+    validar_variables("CLOUD_SQL_CONNECTION_NAME", CLOUD_SQL_CONNECTION_NAME)
+    return _conectar(
         CLOUD_SQL_CONNECTION_NAME,
-        "pg8000",
         user=DB_USER,
         password=DB_PASSWORD,
         db=DB_NAME
     )
-    return conn
 
-engine = create_engine(
-    "postgresql+pg8000://",
-    creator=getconn,
-    pool_pre_ping=True,
-    pool_recycle=3600,
-)
+
+def getconn_replica():
+    """Igual que getconn, contra la instancia réplica"""
+    validar_variables("CLOUD_SQL_REPLICA_CONNECTION_NAME", CLOUD_SQL_REPLICA_CONNECTION_NAME)
+    return _conectar(
+        CLOUD_SQL_REPLICA_CONNECTION_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        db=DB_NAME
+    )
+
+
+if DATABASE_URL:
+    logger.info("Usando DATABASE_URL (sin Cloud SQL Connector)")
+    engine = crear_engine("sunat", url=DATABASE_URL)
+else:
+    logger.info(f"Configurando conexión para: {CLOUD_SQL_CONNECTION_NAME}")
+    engine = crear_engine("sunat", creator=getconn)
+
+if DATABASE_REPLICA_URL:
+    engine_replica = crear_engine("sunat-replica", url=DATABASE_REPLICA_URL)
+elif CLOUD_SQL_REPLICA_CONNECTION_NAME:
+    logger.info(f"Réplica de lectura: {CLOUD_SQL_REPLICA_CONNECTION_NAME}")
+    engine_replica = crear_engine("sunat-replica", creator=getconn_replica)
+else:
+    engine_replica = None
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-try:
-    with engine.connect() as connection:
-        connection.execute(text("SELECT 1"))
-    print("[INFO] Conexión a la base de datos verificada con éxito.")
-except Exception as e:
-    print(f"[ERROR] No se pudo verificar la conexión a la base de datos: {e}")
+# Lecturas a la réplica, escrituras al primario (ver replica_routing.py)
+SessionLectura = crear_sessionmaker_enrutado(engine, engine_replica)
 
 def get_db():
     """
@@ -60,4 +96,4 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
@@ -0,0 +1,85 @@
+"""
+Engine y sesiones async (asyncpg) para los endpoints de lectura intensiva.
+
+Los endpoints `async def` que usan get_async_db no ocupan un hilo del
+threadpool de FastAPI (40 por defecto) mientras esperan a PostgreSQL: una
+instancia puede tener cientos de requests de lectura en vuelo, limitados solo
+por el pool de conexiones. El resto de la API sigue con database.py (pg8000).
+
+Usa las mismas variables que database.py (DATABASE_URL o Cloud SQL) y la misma
+configuración de pool (engine_factory.ConfigPool): son dos pools distintos, así
+que el total de conexiones por instancia es el doble de DB_POOL_SIZE +
+DB_MAX_OVERFLOW.
+"""
+
+import logging
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database import (
+    CLOUD_SQL_CONNECTION_NAME,
+    CLOUD_SQL_REPLICA_CONNECTION_NAME,
+    DATABASE_REPLICA_URL,
+    DATABASE_URL,
+    DB_NAME,
+    DB_PASSWORD,
+    DB_USER,
+    validar_variables,
+)
+from engine_factory import (
+    conector_cloud_sql_async,
+    crear_async_sessionmaker_enrutado,
+    crear_engine_async,
+)
+
+logger = logging.getLogger(__name__)
+
+_conectar = conector_cloud_sql_async()
+
+
+async def getconn_async():
+    """Abre una conexión asyncpg por el Cloud SQL Connector"""
+    validar_variables("CLOUD_SQL_CONNECTION_NAME", CLOUD_SQL_CONNECTION_NAME)
+    return await _conectar(
+        CLOUD_SQL_CONNECTION_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        db=DB_NAME,
+    )
+
+
+async def getconn_replica_async():
+    """Igual que getconn_async, contra la instancia réplica"""
+    validar_variables("CLOUD_SQL_REPLICA_CONNECTION_NAME", CLOUD_SQL_REPLICA_CONNECTION_NAME)
+    return await _conectar(
+        CLOUD_SQL_REPLICA_CONNECTION_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        db=DB_NAME,
+    )
+
+
+if DATABASE_URL:
+    async_engine = crear_engine_async("sunat-async", url=DATABASE_URL)
+else:
+    async_engine = crear_engine_async("sunat-async", async_creator=getconn_async)
+
+if DATABASE_REPLICA_URL:
+    async_engine_replica = crear_engine_async("sunat-replica-async", url=DATABASE_REPLICA_URL)
+elif CLOUD_SQL_REPLICA_CONNECTION_NAME:
+    async_engine_replica = crear_engine_async("sunat-replica-async", async_creator=getconn_replica_async)
+else:
+    async_engine_replica = None
+
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+# Lecturas a la réplica, escrituras al primario (ver replica_routing.py)
+AsyncSessionLectura = crear_async_sessionmaker_enrutado(async_engine, async_engine_replica)
+
+
+async def get_async_db():
+    """
+    Dependency para obtener sesión async de base de datos (para FastAPI).
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,70 @@
+"""
+Lista de empresas de /api/ventas/empresas cacheada en memoria.
+
+El selector de empresas se pide en cada carga del frontend con pocas
+combinaciones distintas de (periodo, RUCs autorizados, usuarios filtrados).
+La lista sale de empresas_periodos (11_empresas_periodos.sql) y se cachea por
+esa firma hasta EMPRESAS_CACHE_TTL segundos; se descarta entera cuando se
+refresca ventas_backend (nueva carga) o cambian asignaciones de enrolados.
+
+La lista se calcula con la sesión del request, que puede leer de la réplica:
+durante DB_REPLICA_LECTURA_PROPIA_S segundos después de invalidar no se guarda
+(la réplica puede devolver la lista de antes del cambio).
+"""
+
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+from cache import TTLCache
+from database import DB_REPLICA_LECTURA_PROPIA_S, engine_replica
+
+logger = logging.getLogger(__name__)
+
+EMPRESAS_CACHE_TTL = float(os.getenv("EMPRESAS_CACHE_TTL", "300"))
+
+_empresas = TTLCache(maxsize=1024, ttl=EMPRESAS_CACHE_TTL)
+_invalidado_en = float("-inf")
+
+
+def _firma(
+    periodo: Optional[str],
+    authorized_rucs: Optional[List[str]],
+    usuario_emails: Optional[List[str]],
+) -> tuple:
+    return (
+        periodo or None,
+        None if authorized_rucs is None else tuple(sorted(set(authorized_rucs))),
+        tuple(sorted(set(usuario_emails))) if usuario_emails else None,
+    )
+
+
+def get_empresas(
+    calcular: Callable[[], List[Dict[str, str]]],
+    periodo: Optional[str] = None,
+    authorized_rucs: Optional[List[str]] = None,
+    usuario_emails: Optional[List[str]] = None,
+) -> List[Dict[str, str]]:
+    """
+    Lista cacheada para la firma; si no está, llama a `calcular()` y la guarda.
+    """
+    firma = _firma(periodo, authorized_rucs, usuario_emails)
+    empresas = _empresas.get(firma)
+    if empresas is None:
+        empresas = calcular()
+        if engine_replica is None or time.monotonic() - _invalidado_en >= DB_REPLICA_LECTURA_PROPIA_S:
+            _empresas.set(firma, empresas)
+    return empresas
+
+
+def invalidate() -> None:
+    """Descarta todas las listas cacheadas"""
+    global _invalidado_en
+    _invalidado_en = time.monotonic()
+    _empresas.clear()
+
+
+def stats() -> dict:
+    """Estadísticas de la caché (para /debug)"""
+    return _empresas.stats()
@@ -0,0 +1,236 @@
+"""
+Exportación de ventas y compras a CSV / XLSX en streaming.
+
+Los endpoints /api/ventas/export y /api/compras/export recorren el resultado
+con un cursor del lado del servidor (iter_ventas / iter_compras) y lo codifican
+por bloques dentro de un StreamingResponse, así la memoria del proceso no crece
+con la cantidad de filas.
+
+- CSV: se envía un bloque cada EXPORT_CHUNK_ROWS filas.
+- XLSX: es un zip, no se puede enviar antes de cerrarlo. openpyxl en modo
+  write_only escribe las filas a un archivo temporal en disco (no las guarda
+  en memoria) y al terminar se envía el archivo por bloques.
+
+Los generadores abren su propia sesión: la sesión del request (get_db) se
+cierra antes de que StreamingResponse empiece a consumir el generador.
+"""
+
+import csv
+import io
+import logging
+import os
+import tempfile
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, List, Sequence, Tuple
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import text
+
+from database import SessionLocal
+from repositories.compra_repository import CompraRepository
+from repositories.venta_backend_repository import VentaBackendRepository
+from ventas_serializer import venta_a_dict
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("csv", "xlsx")
+
+# Filas por bloque (CSV) y por lote del cursor del servidor
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "2000"))
+
+# Límite de filas por hoja de Excel (1.048.576 menos el encabezado)
+_XLSX_MAX_FILAS = 1_048_575
+_XLSX_BLOQUE_BYTES = 64 * 1024
+
+_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# (encabezado, clave) en el orden de VentaResponse
+COLUMNAS_VENTAS: List[Tuple[str, str]] = [
+    ("ID", "id"),
+    ("RUC", "ruc"),
+    ("Razón social", "razon_social"),
+    ("Periodo", "periodo"),
+    ("CAR SUNAT", "car_sunat"),
+    ("Fecha emisión", "fecha_emision"),
+    ("Tipo CP", "tipo_cp_doc"),
+    ("Serie", "serie_cdp"),
+    ("Número", "nro_cp_inicial"),
+    ("Doc. cliente", "nro_doc_identidad"),
+    ("Cliente", "apellidos_nombres_razon_social"),
+    ("Total CP", "total_cp"),
+    ("Moneda", "moneda"),
+    ("Tipo de cambio", "tipo_cambio"),
+    ("Monto original", "monto_original"),
+    ("Usuario", "usuario_nombre"),
+    ("Email usuario", "usuario_email"),
+    ("Nota de crédito", "nota_credito_monto"),
+    ("Monto neto", "monto_neto"),
+    ("Tiene NC", "tiene_nota_credito"),
+    ("Estado", "estado1"),
+    ("Motivo", "estado2"),
+]
+
+# (encabezado, columna) en el orden de CompraResponse
+COLUMNAS_COMPRAS: List[Tuple[str, str]] = [
+    ("ID", "id"),
+    ("RUC", "ruc"),
+    ("Razón social", "razon_social"),
+    ("Periodo", "periodo"),
+    ("CAR SUNAT", "car_sunat"),
+    ("Fecha emisión", "fecha_emision"),
+    ("Tipo CP", "tipo_cp_doc"),
+    ("Serie", "serie_cdp"),
+    ("Número", "nro_cp_inicial"),
+    ("Doc. proveedor", "nro_doc_identidad"),
+    ("Proveedor", "apellidos_nombres_razon_social"),
+    ("Total CP", "total_cp"),
+    ("Moneda", "moneda"),
+    ("Tipo de cambio", "tipo_cambio"),
+]
+
+
+# La transacción de una exportación dura lo que tarde el cliente en descargar:
+# los timeouts de sesión del pool (DB_STATEMENT_TIMEOUT_MS,
+# DB_IDLE_IN_TX_TIMEOUT_MS) la cortarían. SET LOCAL vuelve al valor del pool
+# al terminar la transacción.
+_SIN_TIMEOUTS_SQL = (
+    text("SET LOCAL statement_timeout = 0"),
+    text("SET LOCAL idle_in_transaction_session_timeout = 0"),
+)
+
+
+def _abrir_sesion():
+    db = SessionLocal()
+    try:
+        for sentencia in _SIN_TIMEOUTS_SQL:
+            db.execute(sentencia)
+    except Exception:
+        db.close()
+        raise
+    return db
+
+
+def _filas_ventas(filtros: dict, sort_by: str) -> Iterator[list]:
+    db = _abrir_sesion()
+    try:
+        repo = VentaBackendRepository(db)
+        for venta in repo.iter_ventas(sort_by=sort_by, chunk_size=EXPORT_CHUNK_ROWS, **filtros):
+            # Mismos cálculos (monto_original, monto_neto) que /api/ventas
+            data = venta_a_dict(venta)
+            data["fecha_emision"] = venta.fecha_emision
+            yield [data[clave] for _, clave in COLUMNAS_VENTAS]
+    finally:
+        db.close()
+
+
+def _filas_compras(filtros: dict) -> Iterator[list]:
+    db = _abrir_sesion()
+    try:
+        repo = CompraRepository(db)
+        for compra in repo.iter_compras(chunk_size=EXPORT_CHUNK_ROWS, **filtros):
+            yield [
+                float(valor) if clave in ("total_cp", "tipo_cambio") and valor is not None
+                else valor
+                for (_, clave), valor in zip(COLUMNAS_COMPRAS, compra)
+            ]
+    finally:
+        db.close()
+
+
+def _csv_stream(encabezados: Sequence[str], filas: Iterable[list]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM: Excel abre el CSV como UTF-8 (tildes y ñ)
+    buffer.write("\ufeff")
+    writer.writerow(encabezados)
+
+    pendientes = 0
+    for fila in filas:
+        writer.writerow(fila)
+        pendientes += 1
+        if pendientes >= EXPORT_CHUNK_ROWS:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            pendientes = 0
+
+    yield buffer.getvalue().encode("utf-8")
+
+
+def _xlsx_stream(titulo: str, encabezados: Sequence[str], filas: Iterable[list]) -> Iterator[bytes]:
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    hoja = None
+    en_hoja = _XLSX_MAX_FILAS
+    numero = 0
+    for fila in filas:
+        if en_hoja >= _XLSX_MAX_FILAS:
+            numero += 1
+            hoja = wb.create_sheet(titulo if numero == 1 else f"{titulo} ({numero})")
+            hoja.append(list(encabezados))
+            en_hoja = 0
+        hoja.append(fila)
+        en_hoja += 1
+
+    if hoja is None:
+        wb.create_sheet(titulo).append(list(encabezados))
+
+    with tempfile.TemporaryFile() as archivo:
+        wb.save(archivo)
+        archivo.seek(0)
+        while True:
+            bloque = archivo.read(_XLSX_BLOQUE_BYTES)
+            if not bloque:
+                break
+            yield bloque
+
+
+def _respuesta(
+    nombre: str,
+    formato: str,
+    encabezados: Sequence[str],
+    filas: Callable[[], Iterator[list]],
+) -> StreamingResponse:
+    if formato == "xlsx":
+        contenido = _xlsx_stream(nombre.capitalize(), encabezados, filas())
+    else:
+        contenido = _csv_stream(encabezados, filas())
+
+    archivo = f"{nombre}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}"
+    return StreamingResponse(
+        contenido,
+        media_type=_MEDIA_TYPES[formato],
+        headers={"Content-Disposition": f'attachment; filename="{archivo}"'},
+    )
+
+
+def exportar_ventas(filtros: dict, formato: str = "csv", sort_by: str = "fecha") -> StreamingResponse:
+    """
+    StreamingResponse con las facturas de ventas_backend que cumplen `filtros`
+    (mismos filtros que VentaBackendRepository.get_ventas_paginadas).
+    """
+    logger.info("Exportando ventas (%s) con filtros %s", formato, filtros)
+    return _respuesta(
+        "ventas",
+        formato,
+        [encabezado for encabezado, _ in COLUMNAS_VENTAS],
+        lambda: _filas_ventas(filtros, sort_by),
+    )
+
+
+def exportar_compras(filtros: dict, formato: str = "csv") -> StreamingResponse:
+    """
+    StreamingResponse con las compras que cumplen `filtros`
+    (mismos filtros que CompraRepository.get_compras_paginadas).
+    """
+    logger.info("Exportando compras (%s) con filtros %s", formato, filtros)
+    return _respuesta(
+        "compras",
+        formato,
+        [encabezado for encabezado, _ in COLUMNAS_COMPRAS],
+        lambda: _filas_compras(filtros),
+    )
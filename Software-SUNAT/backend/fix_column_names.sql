@@ -127,6 +127,9 @@ CREATE INDEX idx_ventas_backend_metricas ON ventas_backend(fecha_emision, moneda
 CREATE INDEX idx_ventas_backend_con_nc ON ventas_backend(tiene_nota_credito) WHERE tiene_nota_credito = true;
 CREATE INDEX idx_ventas_backend_usuario_email ON ventas_backend(usuario_email) WHERE usuario_email IS NOT NULL;
 CREATE INDEX idx_ventas_backend_fecha_desc ON ventas_backend(fecha_emision DESC);
+-- Paginación por cursor (keyset) de /api/ventas
+CREATE INDEX idx_ventas_backend_fecha_id ON ventas_backend(fecha_emision DESC, id DESC);
+CREATE INDEX idx_ventas_backend_monto_id ON ventas_backend(monto_neto DESC, id DESC);
 -- Función de refresh
 CREATE OR REPLACE FUNCTION refresh_ventas_backend()
 RETURNS void AS $$
@@ -0,0 +1,477 @@
+"""
+Índices de la base: una sola lista declarada, aplicada con CREATE INDEX
+CONCURRENTLY y verificada con EXPLAIN sobre las consultas reales de los
+repositorios.
+
+El DDL de índices estaba repartido entre 03_implement_optimizations.sql,
+fix_column_names.sql, fix_ventas_backend_view.sql, setup_database.sql y
+create_index.py, con versiones que no coinciden (algunas filtran
+tipo_cp_doc = '01' y las consultas usan '1'). INDICES es la referencia: cada
+entrada dice qué consulta la usa, y REEMPLAZADOS lista los que ya no sirven.
+
+Los índices de ventas_backend llevan tipo_cp_doc como primera columna en vez
+de un WHERE tipo_cp_doc = '1': /api/ventas va por asyncpg, que usa sentencias
+preparadas, y con el plan genérico el planner no puede probar el predicado de
+un índice parcial contra un parámetro. Las columnas INCLUDE dejan que el
+conteo y los filtros por RUC, moneda y usuario se resuelvan sin ir a la tabla
+(index-only scan).
+
+- estado: declarados que faltan o quedaron inválidos, reemplazados que siguen
+  existiendo y no declarados
+- aplicar: crea los que faltan (CONCURRENTLY: no bloquea escrituras), recrea
+  los inválidos (un CONCURRENTLY interrumpido deja el índice INVALID) y, con
+  --eliminar-reemplazados, borra REEMPLAZADOS cuando todos los declarados
+  están válidos
+- verificar: ejecuta las consultas de VentaBackendRepository y VentaRepository
+  con valores tomados de la base, captura el SQL que emiten y corre EXPLAIN
+  sobre cada sentencia; termina con código 1 si alguna recorre ventas_backend
+  o ventas_sire con Seq Scan. En una base chica el planner prefiere Seq Scan
+  aunque el índice exista: --forzar-indices desactiva enable_seqscan, y
+  entonces un Seq Scan significa que ningún índice sirve a esa consulta.
+
+Uso:
+    python indices.py estado
+    python indices.py aplicar [--eliminar-reemplazados]
+    python indices.py verificar [--forzar-indices]
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import event, text
+
+load_dotenv()
+
+from database import SessionLocal, engine  # noqa: E402
+from engine_factory import sin_statement_timeout  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# Tablas grandes: un Seq Scan sobre ellas en una consulta de repositorio es una regresión
+TABLAS_VERIFICADAS = ("ventas_backend", "ventas_sire")
+
+
+@dataclass(frozen=True)
+class Indice:
+    """Índice declarado (columnas admite expresiones y DESC)"""
+
+    nombre: str
+    tabla: str
+    columnas: str
+    include: Tuple[str, ...] = ()
+    where: Optional[str] = None
+    unico: bool = False
+    uso: str = ""
+
+    def ddl(self) -> str:
+        sql = (
+            f"CREATE {'UNIQUE ' if self.unico else ''}INDEX CONCURRENTLY IF NOT EXISTS "
+            f"{self.nombre} ON {self.tabla} ({self.columnas})"
+        )
+        if self.include:
+            sql += f" INCLUDE ({', '.join(self.include)})"
+        if self.where:
+            sql += f" WHERE {self.where}"
+        return sql
+
+
+INDICES: Tuple[Indice, ...] = (
+    # ---- ventas_backend (VentaBackendRepository / AsyncVentaBackendRepository) ----
+    Indice(
+        "idx_ventas_backend_tipo_fecha_id", "ventas_backend",
+        "tipo_cp_doc, fecha_emision DESC, id DESC",
+        include=("ruc", "moneda", "usuario_email"),
+        uso="/api/ventas sort_by=fecha (offset y keyset) y /api/ventas/count por rango de fechas",
+    ),
+    Indice(
+        "idx_ventas_backend_tipo_monto_id", "ventas_backend",
+        "tipo_cp_doc, monto_neto DESC, id DESC",
+        include=("fecha_emision", "ruc", "moneda", "usuario_email"),
+        uso="/api/ventas sort_by=monto (offset y keyset)",
+    ),
+    Indice(
+        "idx_ventas_backend_ruc_fecha_id", "ventas_backend",
+        "ruc, tipo_cp_doc, fecha_emision DESC, id DESC",
+        include=("moneda", "usuario_email"),
+        uso="usuarios con RUCs autorizados y filtro rucs_empresa: página y conteo",
+    ),
+    Indice(
+        "idx_ventas_backend_usuario_fecha_id", "ventas_backend",
+        "usuario_email, tipo_cp_doc, fecha_emision DESC, id DESC",
+        include=("ruc", "moneda"),
+        uso="filtro usuario_emails (incluye UNASSIGNED: usuario_email IS NULL)",
+    ),
+    Indice(
+        "idx_ventas_backend_ruc_periodo", "ventas_backend", "ruc, periodo",
+        uso="filtro periodo por empresa y trigger de enrolados (recalcula por RUC)",
+    ),
+    Indice(
+        "idx_ventas_backend_metricas_fecha", "ventas_backend", "fecha_emision",
+        include=("ruc", "moneda", "estado1", "tipo_cp_doc", "serie_cdp", "monto_neto"),
+        uso="/api/metricas/resumen sobre ventas_backend cuando el rollup está desactualizado",
+    ),
+    # ---- ventas_metricas_diarias (05) ----
+    Indice(
+        "idx_metricas_diarias_fecha", "ventas_metricas_diarias", "fecha_emision, moneda",
+        uso="/api/metricas/resumen (admin)",
+    ),
+    Indice(
+        "idx_metricas_diarias_ruc_fecha", "ventas_metricas_diarias", "ruc, fecha_emision",
+        uso="/api/metricas/resumen con RUCs autorizados o rucs_empresa",
+    ),
+    # ---- ventas_sire (VentaRepository, triggers de 06/07, ingesta de 08) ----
+    Indice(
+        "uq_ventas_sire_comprobante", "ventas_sire",
+        "ruc, periodo, (COALESCE(serie_cdp, '')), nro_cp_inicial, tipo_cp_doc",
+        unico=True,
+        uso="INSERT ... ON CONFLICT de la ingesta (08)",
+    ),
+    Indice(
+        "idx_ventas_ruc_periodo", "ventas_sire", "ruc, periodo",
+        uso="VentaRepository por empresa y periodo (/api/metricas/{periodo}, clientes-con-facturas)",
+    ),
+    Indice(
+        "idx_ventas_fecha", "ventas_sire", "fecha_emision",
+        uso="VentaRepository.get_ventas_paginadas por rango de fechas",
+    ),
+    Indice(
+        "idx_ventas_factura_lookup", "ventas_sire", "ruc, nro_cp_inicial, nro_doc_identidad",
+        where="tipo_cp_doc = '1'",
+        uso="trigger de ventas_backend: facturas enlazadas a una NC (06)",
+    ),
+    Indice(
+        "idx_ventas_nc_normalizado", "ventas_sire",
+        "ruc, nro_cp_normalizado(nro_cp_modificado), nro_doc_identidad",
+        where="tipo_cp_doc = '7'",
+        uso="ventas_backend_def y ventas_backend_recalcular: NC de cada factura (06/07)",
+    ),
+    # ---- compras_sire ----
+    Indice(
+        "uq_compras_sire_comprobante", "compras_sire",
+        "ruc, periodo, (COALESCE(serie_cdp, '')), nro_cp_inicial, tipo_cp_doc",
+        unico=True,
+        uso="INSERT ... ON CONFLICT de la ingesta (08)",
+    ),
+    Indice("idx_compras_ruc_periodo", "compras_sire", "ruc, periodo", uso="/api/compras por empresa y periodo"),
+    Indice("idx_compras_fecha", "compras_sire", "fecha_emision", uso="/api/compras por rango de fechas"),
+    # ---- otras ----
+    Indice("idx_empresas_periodos_periodo", "empresas_periodos", "periodo", uso="/api/ventas/empresas?periodo="),
+    Indice(
+        "idx_periodos_fallidos_pendientes", "periodos_fallidos", "proximo_intento",
+        where="resuelto = FALSE",
+        uso="reintentos vencidos de la ingesta (09)",
+    ),
+)
+
+# Índices que quedaron de scripts anteriores -> por qué sobran
+REEMPLAZADOS: Dict[str, str] = {
+    "idx_ventas_backend_fecha": "cubierto por idx_ventas_backend_metricas_fecha",
+    "idx_ventas_backend_fecha_desc": "cubierto por idx_ventas_backend_tipo_fecha_id",
+    "idx_ventas_backend_fecha_id": "reemplazado por idx_ventas_backend_tipo_fecha_id",
+    "idx_ventas_backend_monto_id": "reemplazado por idx_ventas_backend_tipo_monto_id",
+    "idx_ventas_backend_usuario_email": "parcial (IS NOT NULL) no sirve a UNASSIGNED: idx_ventas_backend_usuario_fecha_id",
+    "idx_ventas_backend_metricas": "reemplazado por idx_ventas_backend_metricas_fecha",
+    "idx_ventas_backend_metrics": "setup_database.sql: columna total_neto ya no existe",
+    "idx_ventas_backend_tipo_doc": "un solo valor en ventas_backend: no filtra nada",
+    "idx_ventas_backend_moneda": "dos valores: no filtra nada",
+    "idx_ventas_backend_estado1": "ninguna consulta filtra por estado1",
+    "idx_ventas_backend_estado2": "ninguna consulta filtra por estado2",
+    "idx_ventas_backend_cliente": "ninguna consulta de ventas_backend filtra por cliente",
+    "idx_ventas_backend_con_nc": "ninguna consulta filtra por tiene_nota_credito (y la versión de 03 usa '01')",
+    "idx_ventas_backend_anulada": "setup_database.sql: tipo_cp_doc = '01' nunca coincide",
+    "idx_ventas_backend_id": "duplica ventas_backend_pkey (era para REFRESH CONCURRENTLY)",
+    "ventas_backend_id_idx": "duplica ventas_backend_pkey (create_index.py)",
+    "idx_ventas_nc_lookup": "reemplazado por idx_ventas_nc_normalizado",
+    "idx_ventas_metricas": "las métricas por fecha leen ventas_metricas_diarias (05); rangos: idx_ventas_fecha",
+    "idx_ventas_cliente": "duplica ix_ventas_sire_nro_doc_identidad (models.py)",
+    "idx_ventas_tipo_doc": "baja selectividad",
+    "idx_ventas_moneda": "baja selectividad",
+    "idx_compras_proveedor": "duplica ix_compras_sire_nro_doc_identidad (models.py)",
+}
+
+_EXISTENTES_SQL = text("""
+    SELECT c.relname AS indice, t.relname AS tabla, i.indisvalid AS valido,
+           i.indisprimary OR i.indisunique AND EXISTS (
+               SELECT 1 FROM pg_constraint k WHERE k.conindid = i.indexrelid
+           ) AS de_restriccion
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    JOIN pg_class t ON t.oid = i.indrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = current_schema()
+""")
+
+_TABLAS_SQL = text("""
+    SELECT c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = current_schema() AND c.relkind IN ('r', 'm', 'p')
+""")
+
+
+def _indices_de_modelos() -> set:
+    """Índices de models.py (index=True e Index(...)): los crea create_all, no este módulo"""
+    from models import Base
+
+    return {indice.name for tabla in Base.metadata.tables.values() for indice in tabla.indexes}
+
+
+@dataclass
+class EstadoIndices:
+    faltantes: List[Indice] = field(default_factory=list)
+    invalidos: List[Indice] = field(default_factory=list)
+    sin_tabla: List[Indice] = field(default_factory=list)
+    reemplazados: List[str] = field(default_factory=list)
+    no_declarados: List[Tuple[str, str]] = field(default_factory=list)
+
+    @property
+    def completo(self) -> bool:
+        return not self.faltantes and not self.invalidos
+
+
+def estado(conn) -> EstadoIndices:
+    """Compara INDICES y REEMPLAZADOS con los índices del esquema actual"""
+    existentes = {fila.indice: fila for fila in conn.execute(_EXISTENTES_SQL)}
+    tablas = {fila[0] for fila in conn.execute(_TABLAS_SQL)}
+    declarados = {indice.nombre for indice in INDICES} | _indices_de_modelos()
+
+    resultado = EstadoIndices()
+    for indice in INDICES:
+        if indice.tabla not in tablas:
+            resultado.sin_tabla.append(indice)
+        elif indice.nombre not in existentes:
+            resultado.faltantes.append(indice)
+        elif not existentes[indice.nombre].valido:
+            resultado.invalidos.append(indice)
+    resultado.reemplazados = sorted(nombre for nombre in REEMPLAZADOS if nombre in existentes)
+    resultado.no_declarados = sorted(
+        (fila.tabla, nombre)
+        for nombre, fila in existentes.items()
+        if nombre not in declarados
+        and nombre not in REEMPLAZADOS
+        and not fila.de_restriccion
+    )
+    return resultado
+
+
+def aplicar(eliminar_reemplazados: bool = False) -> List[str]:
+    """
+    Crea los índices declarados que faltan y recrea los inválidos, de a uno y
+    sin transacción (CREATE INDEX CONCURRENTLY no corre dentro de una).
+
+    Returns:
+        Lista de acciones ejecutadas
+
+    Raises:
+        Exception: Si falla un CREATE/DROP (los anteriores quedan aplicados)
+    """
+    acciones = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        actual = estado(conn)
+        for indice in actual.sin_tabla:
+            logger.warning("Se omite %s: no existe la tabla %s", indice.nombre, indice.tabla)
+
+        # Un índice grande puede superar DB_STATEMENT_TIMEOUT_MS
+        with sin_statement_timeout(conn):
+            for indice in actual.invalidos:
+                conn.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {indice.nombre}")
+                acciones.append(f"DROP {indice.nombre} (inválido)")
+            for indice in actual.invalidos + actual.faltantes:
+                inicio = time.perf_counter()
+                conn.exec_driver_sql(indice.ddl())
+                logger.info("%s creado en %.1f s", indice.nombre, time.perf_counter() - inicio)
+                acciones.append(f"CREATE {indice.nombre}")
+
+            if eliminar_reemplazados:
+                # Solo con el reemplazo ya válido: nunca dejar una consulta sin índice
+                if not estado(conn).completo:
+                    raise RuntimeError("Quedan índices declarados sin crear: no se eliminan los reemplazados")
+                for nombre in actual.reemplazados:
+                    conn.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {nombre}")
+                    logger.info("%s eliminado (%s)", nombre, REEMPLAZADOS[nombre])
+                    acciones.append(f"DROP {nombre}")
+    return acciones
+
+
+# ==================== VERIFICACIÓN CON EXPLAIN ====================
+
+
+@dataclass
+class ResultadoExplain:
+    consulta: str
+    seq_scans: List[str]
+    indices: List[str]
+    costo: float
+
+    @property
+    def ok(self) -> bool:
+        return not self.seq_scans
+
+
+def _nodos(plan: dict):
+    yield plan
+    for hijo in plan.get("Plans", ()):
+        yield from _nodos(hijo)
+
+
+def analizar_plan(consulta: str, plan) -> ResultadoExplain:
+    """Seq Scans sobre TABLAS_VERIFICADAS e índices usados en un EXPLAIN (FORMAT JSON)"""
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    raiz = plan[0]["Plan"]
+    seq_scans, indices = [], []
+    for nodo in _nodos(raiz):
+        if nodo["Node Type"] == "Seq Scan" and nodo.get("Relation Name") in TABLAS_VERIFICADAS:
+            seq_scans.append(nodo["Relation Name"])
+        if "Index Name" in nodo and nodo["Index Name"] not in indices:
+            indices.append(nodo["Index Name"])
+    return ResultadoExplain(consulta, seq_scans, indices, raiz["Total Cost"])
+
+
+def _muestra(db) -> dict:
+    """Valores reales para los filtros: última fecha, el usuario con más RUCs y las empresas más grandes"""
+    ultima = db.execute(text("SELECT max(fecha_emision) FROM ventas_backend")).scalar()
+    if ultima is None:
+        raise RuntimeError("ventas_backend está vacía: no hay consultas que verificar")
+    email, rucs = db.execute(text("""
+        SELECT email, array_agg(ruc ORDER BY ruc) FROM enrolados
+        WHERE email IS NOT NULL
+        GROUP BY email ORDER BY count(*) DESC, email LIMIT 1
+    """)).one()
+    rucs_empresa = [fila[0] for fila in db.execute(text("""
+        SELECT ruc FROM ventas_backend WHERE fecha_emision >= :desde
+        GROUP BY ruc ORDER BY count(*) DESC, ruc LIMIT 3
+    """), {"desde": ultima.replace(day=1)})]
+    return {
+        "mes": {"fecha_desde": ultima.replace(day=1), "fecha_hasta": ultima},
+        "dias_30": {"fecha_desde": ultima - timedelta(days=30), "fecha_hasta": ultima},
+        "periodo": ultima.strftime("%Y%m"),
+        "email": email,
+        "rucs_autorizados": list(rucs),
+        "rucs_empresa": rucs_empresa,
+    }
+
+
+def _consultas(db, m: dict) -> List[Tuple[str, Callable[[], object]]]:
+    """Llamadas a los repositorios con las combinaciones de filtros y orden del dashboard"""
+    from repositories.venta_backend_repository import VentaBackendRepository
+    from repositories.venta_repository import VentaRepository
+
+    backend = VentaBackendRepository(db)
+    legacy = VentaRepository(db)
+    mes, dias_30 = m["mes"], m["dias_30"]
+
+    def keyset_segunda_pagina(sort_by: str):
+        _, cursor = backend.get_ventas_keyset(sort_by=sort_by, **mes)
+        if cursor:
+            backend.get_ventas_keyset(cursor=cursor, sort_by=sort_by, **mes)
+
+    return [
+        ("pagina_fecha", lambda: backend.get_ventas_pagina(**mes)),
+        ("pagina_monto", lambda: backend.get_ventas_pagina(sort_by="monto", **mes)),
+        ("pagina_fecha_usd_pagina_5", lambda: backend.get_ventas_pagina(page=5, moneda="USD", **dias_30)),
+        ("keyset_fecha", lambda: keyset_segunda_pagina("fecha")),
+        ("keyset_monto", lambda: keyset_segunda_pagina("monto")),
+        ("pagina_rucs_autorizados", lambda: backend.get_ventas_pagina(authorized_rucs=m["rucs_autorizados"], **mes)),
+        ("pagina_rucs_empresa", lambda: backend.get_ventas_pagina(rucs_empresa=m["rucs_empresa"], **dias_30)),
+        ("pagina_usuario", lambda: backend.get_ventas_pagina(usuario_emails=[m["email"]], **mes)),
+        ("pagina_sin_asignar", lambda: backend.get_ventas_pagina(usuario_emails=["UNASSIGNED", m["email"]], **mes)),
+        ("count_fecha", lambda: backend.get_ventas_count(**mes)),
+        ("count_rucs_autorizados", lambda: backend.get_ventas_count(authorized_rucs=m["rucs_autorizados"], **mes)),
+        ("count_usuario", lambda: backend.get_ventas_count(usuario_emails=[m["email"]], **dias_30)),
+        ("pagina_periodo_empresa", lambda: backend.get_ventas_pagina(
+            periodo=m["periodo"], rucs_empresa=m["rucs_empresa"][:1])),
+        ("legacy_metricas_periodo_rucs", lambda: legacy.get_metricas_periodo(
+            periodo=m["periodo"], authorized_rucs=m["rucs_autorizados"])),
+    ]
+
+
+def verificar(forzar_indices: bool = False) -> List[ResultadoExplain]:
+    """
+    Ejecuta cada consulta de _consultas, captura las sentencias SELECT que
+    emite y corre EXPLAIN (FORMAT JSON) sobre cada una con los mismos parámetros.
+    """
+    resultados = []
+    db = SessionLocal()
+    try:
+        if forzar_indices:
+            db.execute(text("SET LOCAL enable_seqscan = off"))
+        muestra = _muestra(db)
+        for nombre, llamar in _consultas(db, muestra):
+            capturadas = []
+
+            def capturar(conn, cursor, statement, parameters, context, executemany):
+                if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+                    capturadas.append((statement, parameters))
+
+            event.listen(engine, "before_cursor_execute", capturar)
+            try:
+                llamar()
+            finally:
+                event.remove(engine, "before_cursor_execute", capturar)
+
+            for numero, (statement, parameters) in enumerate(capturadas, start=1):
+                plan = db.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()
+                etiqueta = nombre if len(capturadas) == 1 else f"{nombre}#{numero}"
+                resultados.append(analizar_plan(etiqueta, plan))
+    finally:
+        db.rollback()
+        db.close()
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Índices declarados: estado, aplicación y verificación")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    subcomandos.add_parser("estado", help="Diferencias entre INDICES y la base")
+    aplicar_parser = subcomandos.add_parser("aplicar", help="CREATE INDEX CONCURRENTLY de los que faltan")
+    aplicar_parser.add_argument(
+        "--eliminar-reemplazados", action="store_true", help="DROP INDEX CONCURRENTLY de REEMPLAZADOS"
+    )
+    verificar_parser = subcomandos.add_parser("verificar", help="EXPLAIN de las consultas de los repositorios")
+    verificar_parser.add_argument(
+        "--forzar-indices", action="store_true", help="enable_seqscan = off (bases chicas)"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.comando == "estado":
+        with engine.connect() as conn:
+            actual = estado(conn)
+        for indice in actual.faltantes:
+            print(f"FALTA      {indice.tabla}.{indice.nombre}  ({indice.uso})")
+        for indice in actual.invalidos:
+            print(f"INVÁLIDO   {indice.tabla}.{indice.nombre}")
+        for indice in actual.sin_tabla:
+            print(f"SIN TABLA  {indice.tabla}.{indice.nombre}")
+        for nombre in actual.reemplazados:
+            print(f"SOBRA      {nombre}  ({REEMPLAZADOS[nombre]})")
+        for tabla, nombre in actual.no_declarados:
+            print(f"NO DECL.   {tabla}.{nombre}")
+        if actual.completo:
+            print(f"Los {len(INDICES) - len(actual.sin_tabla)} índices declarados existen y son válidos")
+        sys.exit(0 if actual.completo else 1)
+
+    if args.comando == "aplicar":
+        acciones = aplicar(eliminar_reemplazados=args.eliminar_reemplazados)
+        print("\n".join(acciones) if acciones else "Nada que aplicar")
+        return
+
+    resultados = verificar(forzar_indices=args.forzar_indices)
+    for r in resultados:
+        detalle = f"SEQ SCAN en {', '.join(r.seq_scans)}" if r.seq_scans else ", ".join(r.indices) or "—"
+        print(f"{'OK ' if r.ok else 'ERR'} {r.consulta:<34} costo {r.costo:>12.1f}  {detalle}")
+    fallidas = [r for r in resultados if not r.ok]
+    if fallidas:
+        print(f"\n{len(fallidas)} consulta(s) con Seq Scan sobre {', '.join(TABLAS_VERIFICADAS)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+"""
+Ingesta de archivos SIRE (ventas / compras) a la base de datos.
+"""
+
+from ingesta.cargador import ResultadoCarga, cargar_archivo
+from ingesta.sire_csv import TABLAS, leer_filas
+
+__all__ = ["ResultadoCarga", "cargar_archivo", "leer_filas", "TABLAS"]
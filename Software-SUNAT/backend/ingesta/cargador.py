@@ -0,0 +1,211 @@
+"""
+Carga masiva de archivos SIRE en ventas_sire / compras_sire.
+
+1. Las filas normalizadas (sire_csv.leer_filas) se envían con
+   COPY ... FROM STDIN a una tabla temporal con las mismas columnas que la
+   tabla destino, sin pasar por el ORM ni por INSERTs fila a fila.
+2. Un solo INSERT ... SELECT ... ON CONFLICT pasa la tabla temporal a la
+   tabla destino usando la clave (ruc, periodo, serie_cdp, nro_cp_inicial,
+   tipo_cp_doc) del índice único de 08_sire_upsert_keys.sql.
+
+El UPDATE solo toca las columnas del archivo: estado1 / estado2 (gestión del
+CRM) nunca se sobrescriben. Las filas que llegan idénticas no se actualizan,
+así los triggers de ventas_backend (06) solo recalculan lo que cambió. Los
+de estadisticas_tablas (10) y empresas_periodos (11) se actualizan una vez
+por archivo.
+
+Todo ocurre en una transacción: si algo falla no queda una carga a medias.
+Funciona con pg8000 (Cloud SQL Connector) y con psycopg2 (Postgres local).
+"""
+
+import csv
+import io
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional
+
+from ingesta.sire_csv import (
+    CLAVE_COMPROBANTE,
+    CLAVE_COMPROBANTE_SQL,
+    Rechazos,
+    TablaSire,
+    leer_filas,
+)
+
+logger = logging.getLogger(__name__)
+
+# Bytes por bloque enviado en el COPY
+_COPY_BLOQUE_BYTES = 256 * 1024
+
+
+@dataclass
+class ResultadoCarga:
+    """Resumen de la carga de un archivo"""
+
+    archivo: str
+    tabla: str
+    filas_leidas: int = 0
+    insertadas: int = 0
+    actualizadas: int = 0
+    sin_cambios: int = 0
+    rechazadas: int = 0
+    errores: List[str] = field(default_factory=list)
+    segundos_copy: float = 0.0
+    segundos_upsert: float = 0.0
+
+    @property
+    def segundos(self) -> float:
+        return self.segundos_copy + self.segundos_upsert
+
+    @property
+    def filas_por_segundo(self) -> float:
+        return self.filas_leidas / self.segundos if self.segundos > 0 else 0.0
+
+    def resumen(self) -> str:
+        return (
+            f"{self.archivo} → {self.tabla}: {self.filas_leidas:,} filas "
+            f"({self.insertadas:,} nuevas, {self.actualizadas:,} actualizadas, "
+            f"{self.sin_cambios:,} sin cambios, {self.rechazadas:,} rechazadas) "
+            f"en {self.segundos:.1f}s [COPY {self.segundos_copy:.1f}s, upsert {self.segundos_upsert:.1f}s] "
+            f"= {self.filas_por_segundo:,.0f} filas/s"
+        )
+
+
+class _CsvStream(io.RawIOBase):
+    """Archivo de solo lectura que codifica filas como CSV a medida que el COPY lee"""
+
+    def __init__(self, filas: Iterator[list]):
+        self._filas = filas
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+        self._pendiente = b""
+        self.filas = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def _llenar(self, minimo: int) -> None:
+        while len(self._pendiente) < minimo:
+            for fila in self._filas:
+                self._writer.writerow(fila)
+                self.filas += 1
+                if self._buffer.tell() >= _COPY_BLOQUE_BYTES:
+                    break
+            else:
+                if not self._buffer.tell():
+                    return
+            self._pendiente += self._buffer.getvalue().encode("utf-8")
+            self._buffer.seek(0)
+            self._buffer.truncate()
+
+    def readinto(self, destino) -> int:
+        datos = self.read(len(destino))
+        destino[: len(datos)] = datos
+        return len(datos)
+
+    def read(self, size: int = -1) -> bytes:
+        self._llenar(size if size and size > 0 else _COPY_BLOQUE_BYTES)
+        if size is None or size < 0:
+            datos, self._pendiente = self._pendiente, b""
+        else:
+            datos, self._pendiente = self._pendiente[:size], self._pendiente[size:]
+        return datos
+
+
+def _copy(cursor, sql: str, stream: _CsvStream) -> None:
+    if hasattr(cursor, "copy_expert"):
+        # psycopg2
+        cursor.copy_expert(sql, stream, size=_COPY_BLOQUE_BYTES)
+    else:
+        # pg8000
+        cursor.execute(sql, stream=stream)
+
+
+def _sql_upsert(tabla: TablaSire, staging: str) -> str:
+    columnas = ", ".join(tabla.columnas)
+    clave = CLAVE_COMPROBANTE_SQL
+    actualizables = [c for c in tabla.columnas if c not in CLAVE_COMPROBANTE]
+    asignaciones = ",\n            ".join(f"{c} = EXCLUDED.{c}" for c in actualizables)
+    actuales = ", ".join(f"t.{c}" for c in actualizables)
+    nuevos = ", ".join(f"EXCLUDED.{c}" for c in actualizables)
+    # DISTINCT ON: si el archivo repite un comprobante gana la última línea
+    # (ON CONFLICT no admite afectar dos veces la misma fila)
+    return f"""
+        WITH cargadas AS (
+            INSERT INTO {tabla.tabla} AS t ({columnas}, ultima_actualizacion)
+            SELECT DISTINCT ON ({clave}) {columnas}, NOW()
+            FROM {staging}
+            ORDER BY {clave}, _linea DESC
+            ON CONFLICT ({clave}) DO UPDATE SET
+            {asignaciones},
+            ultima_actualizacion = EXCLUDED.ultima_actualizacion
+            WHERE ({actuales}) IS DISTINCT FROM ({nuevos})
+            RETURNING (xmax = 0) AS insertada
+        )
+        SELECT
+            COUNT(*) FILTER (WHERE insertada),
+            COUNT(*) FILTER (WHERE NOT insertada),
+            (SELECT COUNT(DISTINCT ROW({clave})) FROM {staging})
+        FROM cargadas
+    """
+
+
+def cargar_archivo(engine, ruta: str, tipo: Optional[str] = None) -> ResultadoCarga:
+    """
+    Carga un archivo SIRE (CSV, TXT o ZIP) en ventas_sire o compras_sire.
+
+    Args:
+        engine: Engine de SQLAlchemy (pg8000 o psycopg2)
+        ruta: Archivo descargado de SIRE
+        tipo: 'ventas' o 'compras'; None = detectar por cantidad de columnas
+
+    Returns:
+        ResultadoCarga con conteos y filas por segundo
+
+    Raises:
+        ValueError: Si el archivo no es un SIRE de ventas/compras
+    """
+    rechazos = Rechazos()
+    tabla, filas = leer_filas(ruta, tipo=tipo, rechazos=rechazos)
+    resultado = ResultadoCarga(archivo=ruta, tabla=tabla.tabla)
+    staging = f"_staging_{tabla.tabla}"
+    columnas = ", ".join(tabla.columnas)
+
+    conexion = engine.raw_connection()
+    try:
+        cursor = conexion.cursor()
+        cursor.execute(
+            f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+            f"SELECT {columnas} FROM {tabla.tabla} WITH NO DATA"
+        )
+        # Orden de llegada, para quedarse con la última línea repetida
+        cursor.execute(f"ALTER TABLE {staging} ADD COLUMN _linea BIGSERIAL")
+
+        inicio = time.perf_counter()
+        stream = _CsvStream(filas)
+        _copy(cursor, f"COPY {staging} ({columnas}) FROM STDIN WITH (FORMAT csv)", stream)
+        resultado.segundos_copy = time.perf_counter() - inicio
+        resultado.filas_leidas = stream.filas
+
+        inicio = time.perf_counter()
+        cursor.execute(_sql_upsert(tabla, staging))
+        insertadas, actualizadas, distintas = cursor.fetchone()
+        resultado.segundos_upsert = time.perf_counter() - inicio
+
+        conexion.commit()
+    except Exception:
+        conexion.rollback()
+        raise
+    finally:
+        filas.close()
+        conexion.close()
+
+    resultado.insertadas = insertadas
+    resultado.actualizadas = actualizadas
+    resultado.sin_cambios = distintas - insertadas - actualizadas
+    resultado.rechazadas = rechazos.cantidad
+    resultado.errores = rechazos.ejemplos
+
+    logger.info(resultado.resumen())
+    return resultado
@@ -0,0 +1,42 @@
+"""
+Engine de SQLAlchemy para los procesos de ingesta.
+
+Con un DSN se conectan a cualquier Postgres (por ejemplo uno local para probar
+con ingesta/fixtures), sin DSN usan el Cloud SQL Connector con las variables
+DB_* del .env. El pool es el de engine_factory, sin statement_timeout ni
+idle_in_transaction_session_timeout: el COPY y el upsert de un periodo grande
+duran más que cualquier request.
+"""
+
+import os
+from dataclasses import replace
+from typing import Optional
+
+import engine_factory
+
+
+def _config_ingesta() -> engine_factory.ConfigPool:
+    return replace(
+        engine_factory.ConfigPool.desde_env(),
+        statement_timeout_ms=0,
+        idle_in_transaction_timeout_ms=0,
+    )
+
+
+def crear_engine(dsn: Optional[str] = None):
+    """Engine para `dsn`, o para Cloud SQL si no se indica"""
+    config = _config_ingesta()
+    if dsn:
+        return engine_factory.crear_engine("ingesta", url=dsn, config=config)
+
+    conectar = engine_factory.conector_cloud_sql()
+
+    def getconn():
+        return conectar(
+            os.getenv("CLOUD_SQL_CONNECTION_NAME"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            db=os.getenv("DB_NAME"),
+        )
+
+    return engine_factory.crear_engine("ingesta", creator=getconn, config=config)
@@ -0,0 +1,48 @@
+"""
+Descarga de archivos SIRE para el programador de ingesta.
+
+Un fetcher es una función `(ruc, periodo, tipo, destino) -> ruta` que deja en
+`destino` el archivo SIRE (CSV, TXT o ZIP) de ese RUC, periodo ('YYYYMM') y
+tipo ('ventas' / 'compras') y retorna su ruta. Si no puede, lanza una
+excepción: el mensaje queda como motivo en periodos_fallidos.
+
+El programador recibe el fetcher como referencia 'modulo:funcion' (se importa
+dentro de cada proceso del pool), así la descarga real desde SUNAT y un stub
+local son intercambiables con INGESTA_FETCHER o --fetcher.
+"""
+
+import glob
+import importlib
+import os
+from typing import Callable
+
+Fetcher = Callable[[str, str, str, str], str]
+
+FETCHER_POR_DEFECTO = os.getenv("INGESTA_FETCHER", "ingesta.fetchers:descargar_desde_directorio")
+
+# Carpeta del fetcher local (archivos descargados a mano o por otro proceso)
+INGESTA_DIRECTORIO = os.getenv("INGESTA_DIRECTORIO", "descargas_sire")
+
+_EXTENSIONES = ("zip", "csv", "txt")
+
+
+def cargar_fetcher(referencia: str) -> Fetcher:
+    """Importa un fetcher desde 'paquete.modulo:funcion'"""
+    modulo, _, nombre = referencia.partition(":")
+    if not modulo or not nombre:
+        raise ValueError(f"Fetcher inválido {referencia!r}: se espera 'modulo:funcion'")
+    return getattr(importlib.import_module(modulo), nombre)
+
+
+def descargar_desde_directorio(ruc: str, periodo: str, tipo: str, destino: str) -> str:
+    """
+    Fetcher local: toma `{tipo}_{ruc}_{periodo}.(zip|csv|txt)` de
+    INGESTA_DIRECTORIO. `destino` no se usa (el archivo ya está en disco).
+    """
+    for extension in _EXTENSIONES:
+        candidatos = glob.glob(os.path.join(INGESTA_DIRECTORIO, f"{tipo}_{ruc}_{periodo}.{extension}"))
+        if candidatos:
+            return candidatos[0]
+    raise FileNotFoundError(
+        f"No hay archivo {tipo}_{ruc}_{periodo}.(zip|csv|txt) en {INGESTA_DIRECTORIO}"
+    )
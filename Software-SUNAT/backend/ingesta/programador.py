@@ -0,0 +1,396 @@
+"""
+Programador de ingesta SIRE: reparte la descarga + carga de cada
+(RUC, periodo, tipo) en un pool de procesos.
+
+- Cada tarea corre en un proceso del pool: el fetcher deja el archivo SIRE en
+  disco y cargador.cargar_archivo lo carga (COPY + upsert). El parseo del CSV
+  es CPU de Python, por eso procesos y no hilos.
+- Como máximo `max_por_ruc` tareas del mismo RUC a la vez (SUNAT limita las
+  sesiones por contribuyente) y `workers` en total.
+- Una tarea fallida queda en periodos_fallidos con el motivo y la hora del
+  próximo intento (backoff exponencial). Dentro de la corrida se reintenta
+  hasta `reintentos_corrida` veces si la espera no pasa de
+  `espera_max_corrida`; el resto lo retoma una corrida posterior
+  (tareas_pendientes) hasta que queda resuelto.
+- Si un proceso del pool muere (OOM, señal), las tareas que estaban en curso
+  fallan con BrokenProcessPool: se registran como cualquier fallo y el pool
+  se vuelve a crear para seguir con el resto.
+- Al final, si se cargaron ventas, se hace UNA sola pasada de mantenimiento
+  (refresh_ventas_backend() y ANALYZE) en lugar de una por archivo.
+"""
+
+import heapq
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from ingesta.cargador import ResultadoCarga, cargar_archivo
+from ingesta.conexion import crear_engine
+from ingesta.fetchers import FETCHER_POR_DEFECTO, cargar_fetcher
+from models import Enrolado, PeriodoFallido
+import response_cache
+
+logger = logging.getLogger(__name__)
+
+INGESTA_WORKERS = int(os.getenv("INGESTA_WORKERS", "4"))
+INGESTA_MAX_POR_RUC = int(os.getenv("INGESTA_MAX_POR_RUC", "1"))
+# Backoff: BASE, 2*BASE, 4*BASE, ... hasta MAX (segundos)
+INGESTA_BACKOFF_BASE = float(os.getenv("INGESTA_BACKOFF_BASE", "60"))
+INGESTA_BACKOFF_MAX = float(os.getenv("INGESTA_BACKOFF_MAX", str(24 * 3600)))
+INGESTA_REINTENTOS_CORRIDA = int(os.getenv("INGESTA_REINTENTOS_CORRIDA", "2"))
+# Un reintento con más espera que esto no se hace en la corrida: queda para la próxima
+INGESTA_ESPERA_MAX_CORRIDA = float(os.getenv("INGESTA_ESPERA_MAX_CORRIDA", "300"))
+
+TIPOS = ("ventas", "compras")
+
+# Mismo candado que ventas_backend_refresh: no se solapa con un refresh de la API
+_ADVISORY_LOCK_SQL = text("SELECT pg_advisory_lock(hashtext('ventas_backend_refresh'))")
+_ADVISORY_UNLOCK_SQL = text("SELECT pg_advisory_unlock(hashtext('ventas_backend_refresh'))")
+
+
+@dataclass(frozen=True)
+class Tarea:
+    """Un archivo SIRE a descargar y cargar"""
+
+    ruc: str
+    periodo: str
+    tipo: str
+
+    def __str__(self) -> str:
+        return f"{self.tipo} {self.ruc} {self.periodo}"
+
+
+@dataclass
+class ResumenCorrida:
+    """Resultado de ProgramadorIngesta.ejecutar"""
+
+    tareas: int = 0
+    exitosas: int = 0
+    fallidas: int = 0
+    reintentos: int = 0
+    filas: int = 0
+    insertadas: int = 0
+    actualizadas: int = 0
+    segundos: float = 0.0
+    mantenimiento: bool = False
+    errores: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def filas_por_segundo(self) -> float:
+        return self.filas / self.segundos if self.segundos > 0 else 0.0
+
+
+def rango_periodos(desde: str, hasta: str) -> List[str]:
+    """Periodos 'YYYYMM' de `desde` a `hasta` (inclusive)"""
+    anio, mes = int(desde[:4]), int(desde[4:6])
+    periodos = []
+    while f"{anio:04d}{mes:02d}" <= hasta:
+        periodos.append(f"{anio:04d}{mes:02d}")
+        anio, mes = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+    return periodos
+
+
+# ---- Proceso del pool -------------------------------------------------------
+
+_engine_proceso = None
+
+
+def _procesar_tarea(tarea: Tarea, fetcher_ref: str, dsn: Optional[str]) -> ResultadoCarga:
+    """Descarga y carga una tarea (corre en un proceso del pool)"""
+    global _engine_proceso
+    if _engine_proceso is None:
+        _engine_proceso = crear_engine(dsn)
+
+    fetcher = cargar_fetcher(fetcher_ref)
+    with tempfile.TemporaryDirectory(prefix="sire_") as destino:
+        ruta = fetcher(tarea.ruc, tarea.periodo, tarea.tipo, destino)
+        return cargar_archivo(_engine_proceso, ruta, tipo=tarea.tipo)
+
+
+# ---- Programador ------------------------------------------------------------
+
+
+class ProgramadorIngesta:
+    """
+    Ejecuta tareas de ingesta en paralelo con tope por RUC, registro de
+    fallos en periodos_fallidos y reintentos con backoff.
+
+    Args:
+        dsn: Postgres destino (None = Cloud SQL con las variables DB_*)
+        fetcher: Referencia 'modulo:funcion' del fetcher (ver ingesta/fetchers.py)
+    """
+
+    def __init__(
+        self,
+        dsn: Optional[str] = None,
+        fetcher: str = FETCHER_POR_DEFECTO,
+        workers: int = INGESTA_WORKERS,
+        max_por_ruc: int = INGESTA_MAX_POR_RUC,
+        backoff_base: float = INGESTA_BACKOFF_BASE,
+        backoff_max: float = INGESTA_BACKOFF_MAX,
+        reintentos_corrida: int = INGESTA_REINTENTOS_CORRIDA,
+        espera_max_corrida: float = INGESTA_ESPERA_MAX_CORRIDA,
+    ):
+        self.dsn = dsn
+        self.fetcher = fetcher
+        self.workers = max(1, workers)
+        self.max_por_ruc = max(1, max_por_ruc)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.reintentos_corrida = reintentos_corrida
+        self.espera_max_corrida = espera_max_corrida
+        self.engine = crear_engine(dsn)
+        # Falla aquí y no en cada proceso si la referencia es inválida
+        cargar_fetcher(fetcher)
+
+    # -- Selección de tareas --
+
+    def tareas_nuevas(
+        self,
+        periodos: Sequence[str],
+        tipos: Sequence[str] = TIPOS,
+        rucs: Optional[Sequence[str]] = None,
+    ) -> List[Tarea]:
+        """Enrolados (o `rucs`) × periodos × tipos"""
+        with Session(self.engine) as db:
+            query = db.query(Enrolado.ruc).order_by(Enrolado.id)
+            if rucs:
+                query = query.filter(Enrolado.ruc.in_(list(rucs)))
+            enrolados = [ruc for (ruc,) in query.all()]
+        # Periodo por periodo: los RUC se intercalan y el tope por RUC no frena el pool
+        return [
+            Tarea(ruc, periodo, tipo)
+            for periodo in periodos
+            for tipo in tipos
+            for ruc in enrolados
+        ]
+
+    def tareas_pendientes(self, tipos: Sequence[str] = TIPOS) -> List[Tarea]:
+        """Fallos no resueltos cuyo próximo intento ya venció"""
+        with Session(self.engine) as db:
+            filas = (
+                db.query(PeriodoFallido.ruc, PeriodoFallido.periodo, PeriodoFallido.tipo)
+                .filter(
+                    PeriodoFallido.resuelto.is_(False),
+                    PeriodoFallido.tipo.in_(list(tipos)),
+                    (PeriodoFallido.proximo_intento.is_(None))
+                    | (PeriodoFallido.proximo_intento <= datetime.now()),
+                )
+                .group_by(PeriodoFallido.ruc, PeriodoFallido.periodo, PeriodoFallido.tipo)
+                .order_by(func.min(PeriodoFallido.proximo_intento))
+                .all()
+            )
+        return [Tarea(ruc, periodo, tipo) for ruc, periodo, tipo in filas]
+
+    # -- periodos_fallidos --
+
+    def _backoff(self, intentos: int) -> float:
+        return min(self.backoff_base * 2 ** (intentos - 1), self.backoff_max)
+
+    def _registrar_fallo(self, tarea: Tarea, motivo: str) -> int:
+        """Registra el fallo y programa el próximo intento. Retorna el número de intentos."""
+        ahora = datetime.now()
+        with Session(self.engine) as db:
+            fallo = (
+                db.query(PeriodoFallido)
+                .filter(
+                    PeriodoFallido.ruc == tarea.ruc,
+                    PeriodoFallido.periodo == tarea.periodo,
+                    PeriodoFallido.tipo == tarea.tipo,
+                    PeriodoFallido.resuelto.is_(False),
+                )
+                .order_by(PeriodoFallido.id.desc())
+                .first()
+            )
+            if fallo is None:
+                fallo = PeriodoFallido(
+                    ruc=tarea.ruc, periodo=tarea.periodo, tipo=tarea.tipo, intentos=0
+                )
+                db.add(fallo)
+            fallo.intentos = (fallo.intentos or 0) + 1
+            fallo.motivo = motivo[:2000]
+            fallo.fecha_fallo = ahora
+            fallo.proximo_intento = ahora + timedelta(seconds=self._backoff(fallo.intentos))
+            db.commit()
+            return fallo.intentos
+
+    def _marcar_resuelto(self, tarea: Tarea) -> None:
+        with Session(self.engine) as db:
+            db.query(PeriodoFallido).filter(
+                PeriodoFallido.ruc == tarea.ruc,
+                PeriodoFallido.periodo == tarea.periodo,
+                PeriodoFallido.tipo == tarea.tipo,
+                PeriodoFallido.resuelto.is_(False),
+            ).update(
+                {PeriodoFallido.resuelto: True, PeriodoFallido.proximo_intento: None},
+                synchronize_session=False,
+            )
+            db.commit()
+
+    # -- Ejecución --
+
+    def ejecutar(self, tareas: Iterable[Tarea]) -> ResumenCorrida:
+        """Ejecuta las tareas (sin duplicados) y la pasada de mantenimiento final"""
+        pendientes = deque(dict.fromkeys(tareas))
+        resumen = ResumenCorrida(tareas=len(pendientes))
+        if not pendientes:
+            return resumen
+
+        inicio = time.monotonic()
+        esperando: list = []  # heap (listo_en, secuencia, tarea) de reintentos
+        secuencia = 0
+        en_curso = {}
+        por_ruc: Counter = Counter()
+        intentos_corrida: Counter = Counter()
+        tablas_cambiadas = set()
+
+        logger.info(
+            f"Ingesta: {len(pendientes)} tareas, {self.workers} procesos, "
+            f"máx. {self.max_por_ruc} por RUC"
+        )
+
+        def terminar(futuro) -> bool:
+            """Registra el resultado de un futuro. Retorna True si el pool se rompió."""
+            nonlocal secuencia
+            tarea = en_curso.pop(futuro)
+            por_ruc[tarea.ruc] -= 1
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                motivo = f"{type(e).__name__}: {e}"
+                intentos = self._registrar_fallo(tarea, motivo)
+                intentos_corrida[tarea] += 1
+                demora = self._backoff(intentos)
+                if (
+                    intentos_corrida[tarea] <= self.reintentos_corrida
+                    and demora <= self.espera_max_corrida
+                ):
+                    secuencia += 1
+                    heapq.heappush(esperando, (time.monotonic() + demora, secuencia, tarea))
+                    resumen.reintentos += 1
+                    logger.warning(f"Falló {tarea} (intento {intentos}), reintento en {demora:.0f}s: {motivo}")
+                else:
+                    resumen.fallidas += 1
+                    resumen.errores[str(tarea)] = motivo
+                    logger.error(
+                        f"Falló {tarea} (intento {intentos}, próximo en {demora:.0f}s): {motivo}"
+                    )
+                return isinstance(e, BrokenProcessPool)
+
+            self._marcar_resuelto(tarea)
+            resumen.exitosas += 1
+            resumen.filas += resultado.filas_leidas
+            resumen.insertadas += resultado.insertadas
+            resumen.actualizadas += resultado.actualizadas
+            if resultado.insertadas or resultado.actualizadas:
+                tablas_cambiadas.add(resultado.tabla)
+            logger.info(f"{tarea}: {resultado.resumen()}")
+            return False
+
+        contexto = multiprocessing.get_context("spawn")
+
+        def nuevo_pool() -> ProcessPoolExecutor:
+            return ProcessPoolExecutor(max_workers=self.workers, mp_context=contexto)
+
+        pool = nuevo_pool()
+        try:
+            while pendientes or esperando or en_curso:
+                ahora = time.monotonic()
+                while esperando and esperando[0][0] <= ahora:
+                    pendientes.append(heapq.heappop(esperando)[2])
+
+                # Lanzar lo que quepa respetando el tope por RUC
+                for _ in range(len(pendientes)):
+                    if len(en_curso) >= self.workers:
+                        break
+                    tarea = pendientes.popleft()
+                    if por_ruc[tarea.ruc] >= self.max_por_ruc:
+                        pendientes.append(tarea)
+                        continue
+                    try:
+                        futuro = pool.submit(_procesar_tarea, tarea, self.fetcher, self.dsn)
+                    except BrokenProcessPool:
+                        # Un proceso murió sin tarea asignada: se rehace el pool
+                        pendientes.appendleft(tarea)
+                        pool.shutdown(wait=False)
+                        pool = nuevo_pool()
+                        logger.warning("Pool de procesos roto: se creó uno nuevo")
+                        break
+                    en_curso[futuro] = tarea
+                    por_ruc[tarea.ruc] += 1
+
+                if not en_curso:
+                    if esperando:
+                        time.sleep(max(esperando[0][0] - time.monotonic(), 0))
+                    continue
+
+                espera = esperando[0][0] - time.monotonic() if esperando else None
+                hechos, _ = wait(
+                    list(en_curso),
+                    timeout=max(espera, 0) if espera is not None else None,
+                    return_when=FIRST_COMPLETED,
+                )
+
+                roto = False
+                for futuro in hechos:
+                    roto = terminar(futuro) or roto
+                if roto:
+                    # Murió un proceso del pool: las demás tareas en curso
+                    # terminan con el mismo error, se registran y se rehace el pool
+                    for futuro in wait(list(en_curso))[0]:
+                        terminar(futuro)
+                    pool.shutdown(wait=False)
+                    pool = nuevo_pool()
+                    logger.warning("Pool de procesos roto: se creó uno nuevo")
+        finally:
+            pool.shutdown()
+            # Lo ya cargado necesita el mantenimiento aunque la corrida se corte
+            resumen.segundos = time.monotonic() - inicio
+            if tablas_cambiadas:
+                resumen.mantenimiento = self._mantenimiento(tablas_cambiadas)
+        return resumen
+
+    def _mantenimiento(self, tablas: Iterable[str]) -> bool:
+        """Una sola pasada al final de la corrida: ANALYZE y refresh de ventas_backend"""
+        try:
+            with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                for tabla in sorted(tablas):
+                    conn.execute(text(f"ANALYZE {tabla}"))
+                if "ventas_sire" in tablas:
+                    # Los triggers (06) ya actualizaron ventas_backend; el refresh
+                    # reconstruye el rollup de métricas y registra la hora
+                    conn.execute(_ADVISORY_LOCK_SQL)
+                    try:
+                        conn.execute(text("SELECT refresh_ventas_backend()"))
+                        conn.execute(text("ANALYZE ventas_backend"))
+                    finally:
+                        conn.execute(_ADVISORY_UNLOCK_SQL)
+                    # Con RESPONSE_CACHE_REDIS_URL invalida las respuestas
+                    # cacheadas de la API (en memoria no alcanza a otro proceso)
+                    response_cache.bump_version()
+            logger.info(f"Mantenimiento post-ingesta completado ({', '.join(sorted(tablas))})")
+            return True
+        except Exception as e:
+            logger.error(f"Error en el mantenimiento post-ingesta: {e}")
+            return False
+
+
+def periodos_recientes(meses: int, hasta: Optional[str] = None) -> List[str]:
+    """Los últimos `meses` periodos hasta `hasta` (por defecto el mes actual)"""
+    hoy = datetime.now()
+    hasta = hasta or f"{hoy.year:04d}{hoy.month:02d}"
+    anio, mes = int(hasta[:4]), int(hasta[4:6])
+    for _ in range(meses - 1):
+        anio, mes = (anio - 1, 12) if mes == 1 else (anio, mes - 1)
+    return rango_periodos(f"{anio:04d}{mes:02d}", hasta)
@@ -0,0 +1,255 @@
+"""
+Lectura de los archivos SIRE de SUNAT (RVIE ventas / RCE compras).
+
+Los archivos que se descargan de SIRE (CSV separado por comas, o TXT separado
+por '|', sueltos o dentro de un ZIP) traen las columnas en el mismo orden que
+VentaSire (40) y CompraSire (80) en models.py, así que el mapeo es por posición
+y los tipos salen del modelo:
+
+- Date: 'dd/mm/aaaa' (formato SUNAT) o 'aaaa-mm-dd'
+- Numeric: sin separador de miles; vacío → NULL
+- String: se recorta; vacío → NULL. Los números de comprobante se leen como
+  texto, nunca como float (evita el sufijo '.0' que rompía el cruce de NC)
+- Códigos y números de comprobante (tipo_cp_doc, nro_cp_inicial, ...) sin
+  ceros a la izquierda: SUNAT envía '01' / '07' y la BD guarda '1' / '7',
+  que es lo que filtran ventas_backend y los endpoints
+
+Las filas se leen y normalizan de a una (generador): la memoria no depende del
+tamaño del archivo.
+"""
+
+import csv
+import io
+import logging
+import zipfile
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import IO, Callable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import Date, Numeric, String
+
+from models import CompraSire, VentaSire
+
+logger = logging.getLogger(__name__)
+
+# Columnas que no vienen en el archivo
+_COLUMNAS_NO_ARCHIVO = {"id", "ultima_actualizacion", "estado1", "estado2"}
+
+# Clave de negocio de un comprobante
+CLAVE_COMPROBANTE = ("ruc", "periodo", "serie_cdp", "nro_cp_inicial", "tipo_cp_doc")
+# Expresiones del índice único de 08_sire_upsert_keys.sql: COALESCE porque un
+# índice único no considera iguales dos NULL y serie_cdp puede venir vacía
+CLAVE_COMPROBANTE_SQL = "ruc, periodo, (COALESCE(serie_cdp, '')), nro_cp_inicial, tipo_cp_doc"
+# Partes de la clave que no pueden venir vacías (serie_cdp puede ser NULL)
+_CLAVE_OBLIGATORIA = ("ruc", "periodo", "nro_cp_inicial", "tipo_cp_doc")
+
+# Columnas numéricas guardadas como texto sin ceros a la izquierda
+_COLUMNAS_CODIGO = {
+    "tipo_cp_doc",
+    "tipo_cp_modificado",
+    "tipo_doc_identidad",
+    "nro_cp_inicial",
+    "nro_final",
+    "nro_cp_modificado",
+}
+
+# Errores de filas rechazadas que se muestran en el log
+MAX_ERRORES_LOG = 20
+
+
+@dataclass(frozen=True)
+class TablaSire:
+    """Columnas del archivo SIRE de un tipo (ventas o compras), en orden"""
+
+    tipo: str
+    tabla: str
+    columnas: Tuple[str, ...]
+    conversores: Tuple[Callable[[str], object], ...] = field(repr=False)
+
+
+def _parse_fecha(valor: str) -> Optional[date]:
+    if "/" in valor:
+        return datetime.strptime(valor, "%d/%m/%Y").date()
+    return date.fromisoformat(valor[:10])
+
+
+def _parse_numero(valor: str) -> Decimal:
+    try:
+        return Decimal(valor.replace(",", ""))
+    except InvalidOperation:
+        raise ValueError(f"número inválido: {valor!r}")
+
+
+def _parse_texto(largo: Optional[int]) -> Callable[[str], str]:
+    def convertir(valor: str) -> str:
+        if largo is not None and len(valor) > largo:
+            raise ValueError(f"texto de {len(valor)} caracteres (máximo {largo}): {valor[:30]!r}")
+        return valor
+
+    return convertir
+
+
+def _parse_codigo(largo: Optional[int]) -> Callable[[str], str]:
+    convertir_texto = _parse_texto(largo)
+
+    def convertir(valor: str) -> str:
+        return str(int(valor)) if valor.isdigit() else convertir_texto(valor)
+
+    return convertir
+
+
+def _tabla_desde_modelo(tipo: str, modelo) -> TablaSire:
+    columnas = []
+    conversores = []
+    for columna in modelo.__table__.columns:
+        if columna.name in _COLUMNAS_NO_ARCHIVO:
+            continue
+        columnas.append(columna.name)
+        if isinstance(columna.type, Date):
+            conversores.append(_parse_fecha)
+        elif isinstance(columna.type, Numeric):
+            conversores.append(_parse_numero)
+        elif columna.name in _COLUMNAS_CODIGO:
+            conversores.append(_parse_codigo(columna.type.length))
+        elif isinstance(columna.type, String):
+            conversores.append(_parse_texto(columna.type.length))
+        else:
+            conversores.append(_parse_texto(None))
+    return TablaSire(tipo, modelo.__tablename__, tuple(columnas), tuple(conversores))
+
+
+TABLAS = {
+    "ventas": _tabla_desde_modelo("ventas", VentaSire),
+    "compras": _tabla_desde_modelo("compras", CompraSire),
+}
+
+
+def tabla_por_columnas(cantidad: int) -> Optional[TablaSire]:
+    """Tipo de archivo según la cantidad de columnas (40 ventas, 80 compras)"""
+    for tabla in TABLAS.values():
+        if len(tabla.columnas) == cantidad:
+            return tabla
+    return None
+
+
+@dataclass
+class Rechazos:
+    """Filas descartadas durante la lectura"""
+
+    cantidad: int = 0
+    ejemplos: List[str] = field(default_factory=list)
+
+    def agregar(self, linea: int, motivo: str) -> None:
+        self.cantidad += 1
+        if len(self.ejemplos) < MAX_ERRORES_LOG:
+            self.ejemplos.append(f"línea {linea}: {motivo}")
+            logger.warning(f"Fila SIRE rechazada (línea {linea}): {motivo}")
+
+
+def _abrir_binario(ruta: str) -> Tuple[IO[bytes], Optional[zipfile.ZipFile]]:
+    """Abre el archivo; si es ZIP, el primer .csv/.txt de adentro"""
+    if zipfile.is_zipfile(ruta):
+        archivo_zip = zipfile.ZipFile(ruta)
+        nombres = [
+            n for n in archivo_zip.namelist()
+            if n.lower().endswith((".csv", ".txt")) and not n.endswith("/")
+        ]
+        if not nombres:
+            archivo_zip.close()
+            raise ValueError(f"{ruta}: el ZIP no contiene archivos .csv ni .txt")
+        if len(nombres) > 1:
+            logger.warning(f"{ruta}: el ZIP trae {len(nombres)} archivos, se usa {nombres[0]}")
+        return archivo_zip.open(nombres[0]), archivo_zip
+    return open(ruta, "rb"), None
+
+
+def _detectar_codificacion(inicio: bytes) -> str:
+    # Los TXT de SUNAT a veces vienen en latin-1
+    try:
+        inicio.decode("utf-8")
+        return "utf-8-sig"
+    except UnicodeDecodeError as e:
+        # Un carácter multibyte cortado al final de la muestra no cuenta
+        if e.start >= len(inicio) - 3:
+            return "utf-8-sig"
+        return "latin-1"
+
+
+def leer_filas(
+    ruta: str,
+    tipo: Optional[str] = None,
+    rechazos: Optional[Rechazos] = None,
+) -> Tuple[TablaSire, Iterator[list]]:
+    """
+    Abre un archivo SIRE y devuelve su tabla destino y un generador de filas
+    normalizadas (valores Python en el orden de TablaSire.columnas).
+
+    Args:
+        ruta: CSV, TXT o ZIP descargado de SIRE
+        tipo: 'ventas' o 'compras'; None = detectar por cantidad de columnas
+        rechazos: Acumulador de filas descartadas (opcional)
+
+    Raises:
+        ValueError: Si el encabezado no corresponde a ningún tipo (o al indicado)
+    """
+    rechazos = rechazos if rechazos is not None else Rechazos()
+    binario, archivo_zip = _abrir_binario(ruta)
+    try:
+        codificacion = _detectar_codificacion(binario.peek(64 * 1024)[: 64 * 1024])
+        texto = io.TextIOWrapper(binario, encoding=codificacion, newline="")
+
+        encabezado = texto.readline()
+        delimitador = "|" if encabezado.count("|") > encabezado.count(",") else ","
+        columnas_archivo = next(csv.reader([encabezado], delimiter=delimitador))
+        # El TXT de SUNAT termina cada línea con '|'
+        if columnas_archivo and columnas_archivo[-1] == "":
+            columnas_archivo = columnas_archivo[:-1]
+
+        tabla = TABLAS.get(tipo) if tipo else tabla_por_columnas(len(columnas_archivo))
+        if tabla is None or len(columnas_archivo) != len(tabla.columnas):
+            raise ValueError(
+                f"{ruta}: {len(columnas_archivo)} columnas en el encabezado; "
+                f"se esperaban 40 (ventas) u 80 (compras)"
+                + (f" para tipo={tipo}" if tipo else "")
+            )
+    except Exception:
+        binario.close()
+        if archivo_zip is not None:
+            archivo_zip.close()
+        raise
+
+    return tabla, _filas(texto, delimitador, tabla, rechazos, archivo_zip)
+
+
+def _filas(texto, delimitador, tabla: TablaSire, rechazos: Rechazos, archivo_zip) -> Iterator[list]:
+    total_columnas = len(tabla.columnas)
+    posiciones_clave = [tabla.columnas.index(c) for c in _CLAVE_OBLIGATORIA]
+    try:
+        for numero, valores in enumerate(csv.reader(texto, delimiter=delimitador), start=2):
+            if not valores or (len(valores) == 1 and not valores[0].strip()):
+                continue
+            if len(valores) == total_columnas + 1 and valores[-1] == "":
+                valores = valores[:-1]
+            if len(valores) != total_columnas:
+                rechazos.agregar(numero, f"{len(valores)} columnas (se esperaban {total_columnas})")
+                continue
+
+            fila = []
+            try:
+                for valor, convertir in zip(valores, tabla.conversores):
+                    valor = valor.strip()
+                    fila.append(convertir(valor) if valor else None)
+            except ValueError as e:
+                rechazos.agregar(numero, str(e))
+                continue
+
+            if any(fila[i] is None for i in posiciones_clave):
+                rechazos.agregar(numero, "falta RUC, periodo, tipo o número de comprobante")
+                continue
+
+            yield fila
+    finally:
+        texto.close()
+        if archivo_zip is not None:
+            archivo_zip.close()
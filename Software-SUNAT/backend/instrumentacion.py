@@ -0,0 +1,334 @@
+"""
+Métricas Prometheus por ruta y log de consultas lentas.
+
+MetricasMiddleware abre una medición por request (contextvar) y al terminar
+registra, con la plantilla de la ruta como etiqueta (/api/ventas/{venta_id}/estado,
+no el id):
+
+- sunat_http_request_duration_seconds: latencia total
+- sunat_http_db_seconds / sunat_http_db_queries: tiempo y cantidad de
+  consultas, medidos con before/after_cursor_execute en todos los engines de
+  engine_factory (sync, asyncpg y réplicas)
+- sunat_http_db_rows: filas leídas de la base. En los engines síncronos se
+  toma el rowcount del SELECT (psycopg2 y pg8000 lo informan al ejecutar); los
+  cursores del lado del servidor (yield_per) dan -1 y el rowcount de asyncpg
+  depende de la versión de SQLAlchemy, así que esas filas las registra quien
+  consume el resultado (registrar_filas / contar_filas)
+- sunat_http_serialization_seconds: codificación JSON de la respuesta
+  (RespuestaJSONMedida, ventas_serializer)
+
+Además sunat_db_query_seconds mide cada consulta también fuera de un request
+(ingesta, tareas en segundo plano). Las métricas se exponen en /metrics, y
+los mismos tiempos salen en la línea de resumen por request (logger
+`instrumentacion.requests`).
+
+Las consultas que tardan DB_SLOW_QUERY_MS o más se registran en el logger
+`instrumentacion.consultas_lentas` con la sentencia (con placeholders) y los
+parámetros reemplazados por su tipo: nunca se escriben RUCs, emails ni montos.
+"""
+
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
+
+from fastapi.responses import JSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.responses import Response
+from starlette.routing import Match
+
+from logging_config import registrar_request
+
+logger = logging.getLogger(__name__)
+logger_consultas_lentas = logging.getLogger(f"{__name__}.consultas_lentas")
+logger_requests = logging.getLogger(f"{__name__}.requests")
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# 0 = no registrar consultas lentas
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "500"))
+# Largo máximo de la sentencia en el log
+DB_SLOW_QUERY_MAX_CHARS = 2000
+
+# Rutas que no se miden (el propio /metrics y los de diagnóstico)
+RUTAS_EXCLUIDAS = ("/metrics", "/health")
+
+_BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_BUCKETS_CONSULTAS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+_BUCKETS_FILAS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+REQUEST_SEGUNDOS = Histogram(
+    "sunat_http_request_duration_seconds",
+    "Latencia de los requests HTTP",
+    ["method", "route", "status"],
+    buckets=_BUCKETS_SEGUNDOS,
+)
+REQUEST_DB_SEGUNDOS = Histogram(
+    "sunat_http_db_seconds",
+    "Tiempo en base de datos por request",
+    ["route"],
+    buckets=_BUCKETS_SEGUNDOS,
+)
+REQUEST_DB_CONSULTAS = Histogram(
+    "sunat_http_db_queries",
+    "Consultas a base de datos por request",
+    ["route"],
+    buckets=_BUCKETS_CONSULTAS,
+)
+REQUEST_DB_FILAS = Histogram(
+    "sunat_http_db_rows",
+    "Filas devueltas por la base de datos por request",
+    ["route"],
+    buckets=_BUCKETS_FILAS,
+)
+REQUEST_SERIALIZACION_SEGUNDOS = Histogram(
+    "sunat_http_serialization_seconds",
+    "Tiempo de serialización JSON de la respuesta",
+    ["route"],
+    buckets=_BUCKETS_SEGUNDOS,
+)
+CONSULTA_SEGUNDOS = Histogram(
+    "sunat_db_query_seconds",
+    "Duración de cada consulta SQL",
+    ["engine"],
+    buckets=_BUCKETS_SEGUNDOS,
+)
+CONSULTAS_LENTAS = Counter(
+    "sunat_db_slow_queries_total",
+    "Consultas SQL que superaron DB_SLOW_QUERY_MS",
+    ["engine"],
+)
+
+
+@dataclass
+class MedicionRequest:
+    """Acumuladores de un request (los llenan los hooks de SQLAlchemy)"""
+
+    db_segundos: float = 0.0
+    consultas: int = 0
+    filas: int = 0
+    serializacion_segundos: float = 0.0
+
+
+# La contextvar se copia al threadpool de los endpoints sync y a los greenlets
+# de SQLAlchemy async: todos mutan el mismo objeto MedicionRequest
+_medicion: ContextVar[Optional[MedicionRequest]] = ContextVar("medicion_request", default=None)
+
+
+def medicion_actual() -> Optional[MedicionRequest]:
+    """Medición del request en curso (None fuera de un request)"""
+    return _medicion.get()
+
+
+@contextmanager
+def medir_serializacion():
+    """Suma el tiempo del bloque a la serialización del request en curso"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        medicion = _medicion.get()
+        if medicion is not None:
+            medicion.serializacion_segundos += time.perf_counter() - inicio
+
+
+def registrar_filas(filas: int) -> None:
+    """
+    Suma filas leídas al request en curso. Para los resultados que el hook no
+    cuenta: consultas async y cursores del lado del servidor.
+    """
+    medicion = _medicion.get()
+    if medicion is not None:
+        medicion.filas += filas
+
+
+def contar_filas(filas: Iterable) -> Iterator:
+    """Itera `filas` (p. ej. un yield_per) y registra cuántas se leyeron"""
+    leidas = 0
+    try:
+        for fila in filas:
+            leidas += 1
+            yield fila
+    finally:
+        registrar_filas(leidas)
+
+
+class RespuestaJSONMedida(JSONResponse):
+    """JSONResponse que mide json.dumps (default_response_class de la app)"""
+
+    def render(self, content) -> bytes:
+        with medir_serializacion():
+            return super().render(content)
+
+
+# ==================== HOOKS DE SQLALCHEMY ====================
+
+
+def _redactar(parametros) -> object:
+    """Reemplaza cada valor por su tipo (las listas, por tipo y largo)"""
+    if parametros is None:
+        return None
+    if isinstance(parametros, dict):
+        return {clave: _redactar_valor(valor) for clave, valor in parametros.items()}
+    if isinstance(parametros, (list, tuple)):
+        # executemany: una lista de juegos de parámetros
+        if parametros and isinstance(parametros[0], (dict, list, tuple)):
+            return f"<{len(parametros)} juegos de parámetros>"
+        return [_redactar_valor(valor) for valor in parametros]
+    return _redactar_valor(parametros)
+
+
+def _redactar_valor(valor) -> str:
+    if valor is None:
+        return "NULL"
+    if isinstance(valor, (list, tuple, set, frozenset)):
+        return f"<{type(valor).__name__}[{len(valor)}]>"
+    return f"<{type(valor).__name__}>"
+
+
+def instrumentar_engine(engine: Engine, nombre: str) -> None:
+    """
+    Mide cada consulta del engine (para un AsyncEngine, pasar engine.sync_engine).
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_inicios_consulta", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _despues(conn, cursor, statement, parameters, context, executemany):
+        inicios = conn.info.get("_inicios_consulta")
+        if not inicios:
+            return
+        duracion = time.perf_counter() - inicios.pop()
+
+        CONSULTA_SEGUNDOS.labels(engine=nombre).observe(duracion)
+
+        medicion = _medicion.get()
+        if medicion is not None:
+            medicion.db_segundos += duracion
+            medicion.consultas += 1
+            # rowcount de un SELECT = filas devueltas; async y cursores del
+            # lado del servidor (-1) los cubre registrar_filas al consumirlos
+            if (
+                not conn.dialect.is_async
+                and cursor.description is not None
+                and cursor.rowcount > 0
+            ):
+                medicion.filas += cursor.rowcount
+
+        if DB_SLOW_QUERY_MS and duracion * 1000 >= DB_SLOW_QUERY_MS:
+            CONSULTAS_LENTAS.labels(engine=nombre).inc()
+            sentencia = " ".join(statement.split())
+            if len(sentencia) > DB_SLOW_QUERY_MAX_CHARS:
+                sentencia = sentencia[:DB_SLOW_QUERY_MAX_CHARS] + "..."
+            logger_consultas_lentas.warning(
+                "[%s] %.0f ms: %s | parámetros: %s",
+                nombre,
+                duracion * 1000,
+                sentencia,
+                _redactar(parameters),
+                extra={"engine": nombre, "duracion_ms": round(duracion * 1000, 2)},
+            )
+
+    # Una consulta que falla no llega a after_cursor_execute
+    @event.listens_for(engine, "handle_error")
+    def _error(contexto_error):
+        conn = contexto_error.connection
+        if conn is not None and conn.info.get("_inicios_consulta"):
+            conn.info["_inicios_consulta"].pop()
+
+
+# ==================== MIDDLEWARE Y /metrics ====================
+
+
+def _etiqueta_ruta(scope) -> str:
+    # FastAPI deja la ruta resuelta en el scope
+    ruta = scope.get("route")
+    if ruta is None:
+        # Respondido antes del router (caché de respuestas, preflight CORS)
+        router = getattr(scope.get("app"), "router", None)
+        for candidata in getattr(router, "routes", ()):
+            coincidencia, _ = candidata.matches(scope)
+            if coincidencia != Match.NONE:
+                ruta = candidata
+                break
+    # Sin ruta (404) se agrupa todo: la etiqueta nunca lleva ids ni texto libre
+    return getattr(ruta, "path", None) or "sin_ruta"
+
+
+class MetricasMiddleware:
+    """
+    Middleware ASGI: latencia, tiempo de BD y serialización por ruta, y una
+    línea de resumen por request en el logger `instrumentacion.requests`
+    (muestreada, ver
+    logging_config.registrar_request).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in RUTAS_EXCLUIDAS:
+            await self.app(scope, receive, send)
+            return
+
+        medicion = MedicionRequest()
+        token = _medicion.set(medicion)
+        estado = {"status": 500}
+        inicio = time.perf_counter()
+
+        async def send_midiendo(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado["status"] = mensaje["status"]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, send_midiendo)
+        finally:
+            duracion = time.perf_counter() - inicio
+            _medicion.reset(token)
+            ruta = _etiqueta_ruta(scope)
+            if METRICS_ENABLED:
+                REQUEST_SEGUNDOS.labels(
+                    method=scope["method"], route=ruta, status=str(estado["status"])
+                ).observe(duracion)
+                REQUEST_DB_SEGUNDOS.labels(route=ruta).observe(medicion.db_segundos)
+                REQUEST_DB_CONSULTAS.labels(route=ruta).observe(medicion.consultas)
+                REQUEST_DB_FILAS.labels(route=ruta).observe(medicion.filas)
+                REQUEST_SERIALIZACION_SEGUNDOS.labels(route=ruta).observe(
+                    medicion.serializacion_segundos
+                )
+            _registrar_resumen(scope["method"], ruta, estado["status"], duracion, medicion)
+
+
+def _registrar_resumen(metodo: str, ruta: str, status: int, duracion: float, medicion: MedicionRequest) -> None:
+    duracion_ms = duracion * 1000
+    if not logger_requests.isEnabledFor(logging.INFO) or not registrar_request(duracion_ms, status):
+        return
+    logger_requests.info(
+        "%s %s %d %.1f ms",
+        metodo,
+        ruta,
+        status,
+        duracion_ms,
+        extra={
+            "http_method": metodo,
+            "route": ruta,
+            "status": status,
+            "duracion_ms": round(duracion_ms, 2),
+            "db_ms": round(medicion.db_segundos * 1000, 2),
+            "consultas": medicion.consultas,
+            "filas": medicion.filas,
+            "serializacion_ms": round(medicion.serializacion_segundos * 1000, 2),
+        },
+    )
+
+
+def respuesta_metricas() -> Response:
+    """Respuesta de /metrics en el formato de texto de Prometheus"""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,121 @@
+"""
+Registro diferido (write-behind) de usuarios.ultimo_ingreso.
+
+Los accesos se anotan en memoria y se escriben en un único UPDATE masivo cada
+LAST_SEEN_FLUSH_SECONDS segundos (y al apagar la aplicación), en vez de hacer
+UPDATE + COMMIT sobre `usuarios` en cada request autenticado: eso ponía una
+transacción de escritura en todos los endpoints de lectura y generaba contención
+de bloqueos cuando un mismo usuario abría varias pestañas.
+"""
+
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import text
+
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+LAST_SEEN_FLUSH_SECONDS = float(os.getenv("LAST_SEEN_FLUSH_SECONDS", "30"))
+
+_BULK_UPDATE_SQL = text("""
+    UPDATE usuarios AS u
+    SET ultimo_ingreso = v.ts
+    FROM unnest(CAST(:emails AS varchar[]), CAST(:tss AS timestamptz[])) AS v(email, ts)
+    WHERE u.email = v.email
+      AND (u.ultimo_ingreso IS NULL OR u.ultimo_ingreso < v.ts)
+""")
+
+
+class LastSeenTracker:
+    """
+    Acumula el último acceso por email y lo persiste en lotes.
+
+    - touch(): O(1), sin acceso a BD (seguro para el camino caliente)
+    - get(): último acceso conocido por esta instancia (incluye lo no persistido)
+    - flush(): escribe todo lo pendiente en un solo UPDATE
+    """
+
+    def __init__(self, flush_interval: float = LAST_SEEN_FLUSH_SECONDS):
+        self.flush_interval = flush_interval
+        self._ultimo: Dict[str, datetime] = {}
+        self._pendientes: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def touch(self, email: str, when: Optional[datetime] = None) -> None:
+        """Anota un acceso del usuario (se persiste en el próximo flush)"""
+        when = when or datetime.now(timezone.utc)
+        with self._lock:
+            previo = self._ultimo.get(email)
+            if previo is None or previo < when:
+                self._ultimo[email] = when
+                self._pendientes[email] = when
+
+    def get(self, email: str) -> Optional[datetime]:
+        """Último acceso conocido en memoria, o None si esta instancia no lo ha visto"""
+        with self._lock:
+            return self._ultimo.get(email)
+
+    def flush(self) -> int:
+        """
+        Persiste los accesos pendientes en un único UPDATE.
+
+        Returns:
+            int: Cantidad de usuarios enviados a la BD
+        """
+        with self._lock:
+            if not self._pendientes:
+                return 0
+            lote, self._pendientes = self._pendientes, {}
+
+        db = SessionLocal()
+        try:
+            db.execute(
+                _BULK_UPDATE_SQL,
+                {"emails": list(lote.keys()), "tss": list(lote.values())},
+            )
+            db.commit()
+            return len(lote)
+        except Exception as e:
+            db.rollback()
+            # Reencolar sin pisar accesos más recientes registrados mientras tanto
+            with self._lock:
+                for email, ts in lote.items():
+                    actual = self._pendientes.get(email)
+                    if actual is None or actual < ts:
+                        self._pendientes[email] = ts
+            logger.error(f"No se pudo persistir ultimo_ingreso ({len(lote)} usuarios): {e}")
+            return 0
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def start(self) -> None:
+        """Inicia el hilo de flush periódico (idempotente)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="last-seen-flush", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Detiene el hilo y persiste lo pendiente"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval)
+            self._thread = None
+        self.flush()
+
+
+last_seen_tracker = LastSeenTracker()
@@ -0,0 +1,110 @@
+"""
+Configuración de logging de la API: JSON estructurado, niveles por módulo y
+muestreo.
+
+- LOG_FORMAT=json (por defecto) escribe una línea JSON por registro con los
+  campos que Cloud Logging reconoce (severity, message, time) más logger y
+  los `extra` del registro; LOG_FORMAT=texto, una línea legible para local.
+- LOG_LEVEL fija el nivel raíz y LOG_LEVELS el de módulos puntuales:
+  "auth=DEBUG,instrumentacion.consultas_lentas=WARNING". Un logger por debajo
+  de su nivel no arma el mensaje (los argumentos van con %s, no f-strings).
+- Los registros DEBUG que pasan el nivel se muestrean con
+  LOG_DEBUG_SAMPLE_RATE (0.0–1.0): activar DEBUG en producción para un módulo
+  caliente no multiplica el volumen de logs.
+- La línea de resumen por request (logger `instrumentacion.requests`, ver
+  instrumentacion.MetricasMiddleware) reemplaza al access log de uvicorn y se
+  muestrea con LOG_REQUEST_SAMPLE_RATE; errores y requests lentos
+  (LOG_REQUEST_SLOW_MS) se registran siempre.
+"""
+
+import json
+import logging
+import os
+import random
+import sys
+from datetime import datetime, timezone
+
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# uvicorn.access queda en WARNING: el resumen por request ya lleva método, ruta y estado
+LOG_LEVELS = os.getenv("LOG_LEVELS", "uvicorn.access=WARNING")
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.01"))
+LOG_REQUEST_SAMPLE_RATE = float(os.getenv("LOG_REQUEST_SAMPLE_RATE", "1.0"))
+LOG_REQUEST_SLOW_MS = float(os.getenv("LOG_REQUEST_SLOW_MS", "1000"))
+
+# Atributos propios de LogRecord: lo demás viene de `extra`
+_ATRIBUTOS_RECORD = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por registro (structured logging de Cloud Logging)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entrada = {
+            "severity": record.levelname,
+            "message": record.getMessage(),
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "logger": record.name,
+        }
+        for clave, valor in record.__dict__.items():
+            if clave not in _ATRIBUTOS_RECORD and not clave.startswith("_"):
+                entrada[clave] = valor
+        if record.exc_info:
+            entrada["stack_trace"] = self.formatException(record.exc_info)
+        return json.dumps(entrada, ensure_ascii=False, default=str)
+
+
+class FiltroMuestreoDebug(logging.Filter):
+    """Deja pasar una fracción de los registros DEBUG"""
+
+    def __init__(self, tasa: float):
+        super().__init__()
+        self.tasa = tasa
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or muestrear(self.tasa)
+
+
+def muestrear(tasa: float) -> bool:
+    """True con probabilidad `tasa` (1.0 = siempre, 0.0 = nunca)"""
+    return tasa >= 1.0 or (tasa > 0.0 and random.random() < tasa)
+
+
+def registrar_request(duracion_ms: float, status: int) -> bool:
+    """Si la línea de resumen de este request se escribe (muestreo)"""
+    return status >= 500 or duracion_ms >= LOG_REQUEST_SLOW_MS or muestrear(LOG_REQUEST_SAMPLE_RATE)
+
+
+def _niveles_por_modulo(valor: str) -> dict:
+    niveles = {}
+    for par in valor.split(","):
+        if "=" not in par:
+            continue
+        modulo, nivel = par.split("=", 1)
+        niveles[modulo.strip()] = nivel.strip().upper()
+    return niveles
+
+
+def configurar_logging() -> None:
+    """Instala el handler de stdout y los niveles (llamar una vez al arrancar)"""
+    handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        handler.setFormatter(FormatoJSON())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    handler.addFilter(FiltroMuestreoDebug(LOG_DEBUG_SAMPLE_RATE))
+
+    raiz = logging.getLogger()
+    for anterior in list(raiz.handlers):
+        raiz.removeHandler(anterior)
+    raiz.addHandler(handler)
+    raiz.setLevel(LOG_LEVEL)
+
+    # uvicorn instala sus propios handlers de texto: que pasen por el raíz
+    for nombre in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        logger_uvicorn = logging.getLogger(nombre)
+        logger_uvicorn.handlers = []
+        logger_uvicorn.propagate = True
+
+    for modulo, nivel in _niveles_por_modulo(LOG_LEVELS).items():
+        logging.getLogger(modulo).setLevel(nivel)
@@ -1,18 +1,25 @@
 from fastapi import FastAPI, Depends, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func, case, text
+from sqlalchemy import func, case, text, true, update
 from typing import List, Optional
 from datetime import datetime
+import asyncio
 import logging
+import threading
 
-# Configurar logging para Cloud Run
-logging.basicConfig(level=logging.INFO)
+from logging_config import configurar_logging
+
+# Logging estructurado para Cloud Run (niveles y muestreo: logging_config.py)
+configurar_logging()
 logger = logging.getLogger(__name__)
 
 from database import get_db
-from models import Enrolado, VentaElectronica, CompraElectronica, Usuario, Base
-from database import engine
+from models import Enrolado, VentaElectronica, Usuario
+from database import engine, engine_replica, DB_POOL_PREWARM
+from database_async import async_engine, async_engine_replica, get_async_db
+from engine_factory import estadisticas_pool, precalentar_pool, precalentar_pool_async
 from schemas import (
     UsuarioResponse,
     EnroladoResponse,
@@ -21,31 +28,106 @@ from schemas import (
     ClienteConFacturas,
     MetricasResponse,
     PaginatedResponse,
+    PaginationMetadata,
     ActualizarEstadoRequest,
     ActualizarEstadoPerdidaRequest,
+    ActualizarEstadoBulkRequest,
+    ActualizarEstadoBulkResponse,
+    ResultadoEstadoBulk,
 )
 from repositories.venta_repository import VentaRepository
-from repositories.venta_backend_repository import VentaBackendRepository
+from repositories.async_venta_backend_repository import AsyncVentaBackendRepository
 from repositories.compra_repository import CompraRepository
 from repositories.enrolado_repository import EnroladoRepository
-from auth import get_user_context, get_optional_user_context
+from auth import get_user_context, get_optional_user_context, get_auth_cache_stats, inicializar_firebase
+from last_seen import last_seen_tracker
+import count_cache
+import empresas_cache
+import exportacion
+import replica_routing
+import response_cache
+from instrumentacion import MetricasMiddleware, RespuestaJSONMedida, registrar_filas, respuesta_metricas
+from response_cache import ResponseCacheMiddleware
+from replica_routing import get_async_db_lectura, get_db_lectura, get_db_replica
+from ventas_backend_refresh import refresh_scheduler, rollup_metricas_vigente_async
+from ventas_serializer import ventas_page_response
 
 app = FastAPI(
     title="CRM SUNAT API",
     description="API para consultar datos de ventas y compras de SUNAT",
     version="2.0.0",
+    default_response_class=RespuestaJSONMedida,
 )
 
 
+# El esquema se crea con run_crear_tablas.py y los scripts SQL numerados, no al
+# arrancar.
+
+
+def _precalentar():
+    inicializar_firebase()
+    precalentar_pool(engine, DB_POOL_PREWARM)
+    if engine_replica is not None:
+        precalentar_pool(engine_replica, DB_POOL_PREWARM)
+
+
 @app.on_event("startup")
-def create_tables():
-    """Crea las tablas en la base de datos al iniciar la aplicación"""
-    try:
-        Base.metadata.create_all(bind=engine)
-        print("[OK] Tablas de base de datos creadas/verificadas exitosamente")
-    except Exception as e:
-        print(f"[ERROR] Error al crear tablas: {e}")
+def start_precalentamiento():
+    """
+    Abre conexiones del pool e inicializa Firebase en un hilo de fondo: el
+    servidor empieza a escuchar sin esperar a Cloud SQL.
+    """
+    threading.Thread(target=_precalentar, name="precalentar", daemon=True).start()
+
+
+# Referencia a la tarea (el event loop solo guarda referencias débiles)
+_precalentamiento_async: Optional[asyncio.Future] = None
+
+
+@app.on_event("startup")
+async def start_precalentamiento_async():
+    """Precalienta el pool asyncpg de los endpoints async, sin bloquear el arranque"""
+    global _precalentamiento_async
+    engines = [e for e in (async_engine, async_engine_replica) if e is not None]
+    _precalentamiento_async = asyncio.gather(
+        *(precalentar_pool_async(e, DB_POOL_PREWARM) for e in engines)
+    )
+
+
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    """Cierra las conexiones de los pools asyncpg"""
+    await async_engine.dispose()
+    if async_engine_replica is not None:
+        await async_engine_replica.dispose()
+
+
+@app.on_event("startup")
+def start_last_seen_tracker():
+    """Inicia el flush periódico de usuarios.ultimo_ingreso"""
+    last_seen_tracker.start()
+
 
+@app.on_event("shutdown")
+def stop_last_seen_tracker():
+    """Persiste los últimos ingresos pendientes antes de apagar"""
+    last_seen_tracker.stop()
+
+
+@app.on_event("startup")
+def start_refresh_scheduler():
+    """Inicia el hilo que refresca ventas_backend fuera de los requests"""
+    refresh_scheduler.start()
+
+
+@app.on_event("shutdown")
+def stop_refresh_scheduler():
+    """Ejecuta el refresh pendiente (si lo hay) antes de apagar"""
+    refresh_scheduler.stop()
+
+
+# ETag / 304 y caché de respuestas del dashboard (dentro de CORS)
+app.add_middleware(ResponseCacheMiddleware)
 
 # Configurar CORS
 app.add_middleware(
@@ -61,6 +143,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Métricas por ruta (el más externo: mide también los 304 y aciertos de caché)
+app.add_middleware(MetricasMiddleware)
+
 
 @app.get("/")
 def read_root():
@@ -86,6 +171,86 @@ def debug_user_info(user_context: dict = Depends(get_user_context)):
     }
 
 
+@app.get("/debug/auth-cache")
+def debug_auth_cache():
+    """Debug endpoint - aciertos/fallos de la caché de tokens y contextos de usuario"""
+    return get_auth_cache_stats()
+
+
+@app.get("/debug/empresas-cache")
+def debug_empresas_cache():
+    """Debug endpoint - aciertos/fallos de la caché del selector de empresas"""
+    return empresas_cache.stats()
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Métricas Prometheus (latencia, tiempo de BD y serialización por ruta)"""
+    return respuesta_metricas()
+
+
+@app.get("/debug/response-cache")
+def debug_response_cache():
+    """Debug endpoint - aciertos, 304 y versión de la caché de respuestas"""
+    return response_cache.stats()
+
+
+@app.get("/debug/count-cache")
+def debug_count_cache():
+    """Debug endpoint - estado de la caché de conteos de /api/ventas"""
+    return count_cache.stats()
+
+
+@app.get("/debug/db-pool")
+def debug_db_pool():
+    """Debug endpoint - conexiones en uso y espera de checkout de los pools de BD"""
+    pools = {"sync": estadisticas_pool(engine), "async": estadisticas_pool(async_engine)}
+    if engine_replica is not None:
+        pools["replica_sync"] = estadisticas_pool(engine_replica)
+        pools["replica_async"] = estadisticas_pool(async_engine_replica)
+    pools["replica_routing"] = replica_routing.stats()
+    return pools
+
+
+@app.get("/api/ventas/refresh-status")
+def get_refresh_status(user_context: dict = Depends(get_user_context)):
+    """
+    Estado del refresh de ventas_backend en esta instancia: si hay uno en curso
+    o pendiente, hora y duración del último.
+    """
+    return refresh_scheduler.status()
+
+
+@app.post("/admin/refresh-ventas-backend")
+def refresh_ventas_backend_now(
+    wait: bool = Query(False, description="Esperar a que el refresh termine"),
+    timeout: float = Query(300, ge=1, le=900, description="Segundos máximos de espera"),
+    user_context: dict = Depends(get_user_context),
+):
+    """
+    Endpoint de administración: solicita un refresh de ventas_backend.
+    Con wait=true refresca sin debounce y responde cuando terminó.
+    Solo admins pueden usar este endpoint.
+    """
+    if user_context["rol"] != "admin":
+        raise HTTPException(
+            status_code=403, detail="Solo admins pueden usar este endpoint"
+        )
+
+    if not wait:
+        refresh_scheduler.request()
+        return {"solicitado": True, **refresh_scheduler.status()}
+
+    ok = refresh_scheduler.refresh_now(timeout=timeout)
+    if not ok:
+        raise HTTPException(
+            status_code=503,
+            detail=refresh_scheduler.status()["ultimo_error"]
+            or "El refresh no terminó dentro del tiempo de espera",
+        )
+    return {"solicitado": True, **refresh_scheduler.status()}
+
+
 @app.post("/admin/assign-all-enrolados")
 def assign_all_enrolados_to_admin(
     user_context: dict = Depends(get_user_context), db: Session = Depends(get_db)
@@ -102,8 +267,6 @@ def assign_all_enrolados_to_admin(
     email = user_context["email"]
 
     # Actualizar todos los enrolados que no tienen email asignado
-    from sqlalchemy import update
-
     stmt = (
         update(Enrolado)
         .where((Enrolado.email == None) | (Enrolado.email == ""))
@@ -112,6 +275,8 @@ def assign_all_enrolados_to_admin(
 
     result = db.execute(stmt)
     db.commit()
+    replica_routing.registrar_escritura(email)
+    response_cache.bump_version()
 
     return {
         "message": f"Enrolados asignados a {email}",
@@ -216,7 +381,8 @@ def debug_usuarios(db: Session = Depends(get_db)):
 
 @app.get("/debug/mi-contexto")
 async def debug_mi_contexto(
-    user_context: dict = Depends(get_user_context), db: Session = Depends(get_db)
+    user_context: dict = Depends(get_user_context),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Debug endpoint AUTENTICADO - muestra el contexto del usuario actual"""
     try:
@@ -248,8 +414,9 @@ async def debug_mi_contexto(
 
         query_sql += " GROUP BY moneda"
 
-        result = db.execute(text(query_sql), params)
+        result = await db.execute(text(query_sql), params)
         resultados = result.fetchall()
+        registrar_filas(len(resultados))
 
         return {
             "user_context": user_context,
@@ -387,8 +554,47 @@ def get_usuarios_no_admin(
     return usuarios
 
 
+def _filtros_ventas(
+    ruc_empresa: Optional[str],
+    rucs_empresa: Optional[List[str]],
+    periodo: Optional[str],
+    fecha_desde: Optional[str],
+    fecha_hasta: Optional[str],
+    moneda: Optional[str],
+    usuario_email: Optional[str],
+    usuario_emails: Optional[List[str]],
+    user_context: Optional[dict],
+) -> dict:
+    """Filtros de /api/ventas en la forma que esperan los métodos de VentaBackendRepository"""
+    fecha_desde_date = (
+        datetime.strptime(fecha_desde, "%Y-%m-%d").date() if fecha_desde else None
+    )
+    fecha_hasta_date = (
+        datetime.strptime(fecha_hasta, "%Y-%m-%d").date() if fecha_hasta else None
+    )
+
+    authorized_rucs = user_context["authorized_rucs"] if user_context else None
+
+    emails_to_filter = (
+        usuario_emails
+        if usuario_emails
+        else ([usuario_email] if usuario_email else None)
+    )
+
+    return dict(
+        ruc=ruc_empresa,
+        rucs_empresa=rucs_empresa,
+        periodo=periodo,
+        fecha_desde=fecha_desde_date,
+        fecha_hasta=fecha_hasta_date,
+        moneda=moneda,
+        authorized_rucs=authorized_rucs,
+        usuario_emails=emails_to_filter,
+    )
+
+
 @app.get("/api/ventas", response_model=PaginatedResponse[VentaResponse])
-def get_ventas(
+async def get_ventas(
     page: int = Query(1, ge=1, description="Número de página"),
     page_size: int = Query(
         20, ge=1, le=10000, description="Elementos por página (máximo 10000)"
@@ -411,64 +617,167 @@ def get_ventas(
     usuario_emails: Optional[List[str]] = Query(
         None, description="Filtrar por múltiples emails de usuario"
     ),
+    pagination: str = Query(
+        "offset",
+        description="Modo de paginación: 'offset' (usa page) o 'cursor' (keyset, usa cursor)",
+    ),
+    cursor: Optional[str] = Query(
+        None,
+        description="Cursor opaco de pagination.next_cursor (implica pagination=cursor)",
+    ),
+    count_mode: str = Query(
+        "auto",
+        description="Total: 'auto' (caché o estimación, sin bloquear), 'exact' o 'estimate'",
+    ),
     user_context: dict = Depends(get_user_context),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db_lectura),
 ):
     """
     Obtiene ventas paginadas con filtros.
     OPTIMIZADO: Usa vista materializada ventas_backend
-    """
-    repo = VentaBackendRepository(db)
 
-    fecha_desde_date = (
-        datetime.strptime(fecha_desde, "%Y-%m-%d").date() if fecha_desde else None
-    )
-    fecha_hasta_date = (
-        datetime.strptime(fecha_hasta, "%Y-%m-%d").date() if fecha_hasta else None
-    )
+    Paginación:
+    - offset (por defecto): parámetro page, compatible con versiones anteriores
+    - cursor: cada respuesta trae pagination.next_cursor para pedir la siguiente
+      página; el costo no crece con la profundidad de la página
 
-    authorized_rucs = user_context["authorized_rucs"] if user_context else None
+    Total: la página no espera un COUNT exacto. Si el conteo no está en caché
+    se devuelve la estimación del planner (pagination.total_is_estimate=true)
+    y el conteo exacto se calcula en segundo plano.
 
-    emails_to_filter = (
-        usuario_emails
-        if usuario_emails
-        else ([usuario_email] if usuario_email else None)
-    )
+    Async (asyncpg): no ocupa un hilo del threadpool mientras espera a la BD.
+    """
+    if count_mode not in count_cache.COUNT_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"count_mode inválido. Debe ser uno de: {', '.join(count_cache.COUNT_MODES)}",
+        )
 
-    # --- RESTAURADO ---
-    # Esta función ahora devuelve (items, total_real)
-    items, total = repo.get_ventas_paginadas(
-        page=page,
-        page_size=page_size,
-        ruc=ruc_empresa,
+    repo = AsyncVentaBackendRepository(db)
+
+    filtros = _filtros_ventas(
+        ruc_empresa=ruc_empresa,
         rucs_empresa=rucs_empresa,
         periodo=periodo,
-        fecha_desde=fecha_desde_date,
-        fecha_hasta=fecha_hasta_date,
-        sort_by=sort_by,
+        fecha_desde=fecha_desde,
+        fecha_hasta=fecha_hasta,
         moneda=moneda,
-        authorized_rucs=authorized_rucs,
-        usuario_emails=emails_to_filter,
+        usuario_email=usuario_email,
+        usuario_emails=usuario_emails,
+        user_context=user_context,
     )
-    # --- FIN DE RESTAURACIÓN ---
 
-    items_with_calculation = [
-        VentaResponse.from_orm_with_calculation(
-            venta, usuario_nombre, usuario_email, venta.nota_credito_monto
+    usar_cursor = pagination == "cursor" or cursor is not None
+
+    if usar_cursor:
+        try:
+            items, next_cursor = await repo.get_ventas_keyset(
+                cursor=cursor, page_size=page_size, sort_by=sort_by, **filtros
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        # Primera página sin siguiente: ya se conoce el total exacto
+        total, total_estimado = await count_cache.resolve_total_async(
+            repo,
+            filtros,
+            count_mode=count_mode,
+            minimo=len(items),
+            exacto=cursor is None and next_cursor is None,
+        )
+    else:
+        items, hay_mas = await repo.get_ventas_pagina(
+            page=page, page_size=page_size, sort_by=sort_by, **filtros
+        )
+        next_cursor = None
+        # Filas vistas hasta esta página; si no hay más (y la página no está
+        # fuera de rango) es el total exacto
+        vistos = (page - 1) * page_size + len(items)
+        total, total_estimado = await count_cache.resolve_total_async(
+            repo,
+            filtros,
+            count_mode=count_mode,
+            minimo=vistos + (1 if hay_mas else 0),
+            exacto=not hay_mas and (len(items) > 0 or page == 1),
         )
-        for venta, usuario_nombre, usuario_email in items
-    ]
 
-    # --- RESTAURADO ---
-    # Volvemos a crear la paginación usando el 'total' real
-    return PaginatedResponse.create(
-        items=items_with_calculation, total=total, page=page, page_size=page_size
+    # Las filas se serializan directo a JSON (mismo formato que el response_model)
+    if usar_cursor:
+        pagination = PaginationMetadata.create(
+            total=total,
+            page=page,
+            page_size=page_size,
+            has_next=next_cursor is not None,
+            has_previous=cursor is not None,
+            next_cursor=next_cursor,
+            total_is_estimate=total_estimado,
+        )
+    else:
+        pagination = PaginationMetadata.create(
+            total=total,
+            page=page,
+            page_size=page_size,
+            has_next=hay_mas,
+            total_is_estimate=total_estimado,
+        )
+
+    respuesta = ventas_page_response(items, pagination)
+    if total_estimado:
+        # El total exacto llega después: response_cache no guarda esta página
+        respuesta.headers["Cache-Control"] = "no-store"
+    return respuesta
+
+
+@app.get("/api/ventas/export")
+def export_ventas(
+    formato: str = Query("csv", description="Formato: 'csv' o 'xlsx'"),
+    ruc_empresa: Optional[str] = Query(None, description="Filtrar por RUC de empresa"),
+    rucs_empresa: Optional[List[str]] = Query(
+        None, description="Filtrar por múltiples RUCs"
+    ),
+    periodo: Optional[str] = Query(None, description="Filtrar por periodo (YYYYMM)"),
+    fecha_desde: Optional[str] = Query(None, description="Fecha desde (YYYY-MM-DD)"),
+    fecha_hasta: Optional[str] = Query(None, description="Fecha hasta (YYYY-MM-DD)"),
+    sort_by: str = Query("fecha", description="Ordenar por: 'fecha' o 'monto'"),
+    moneda: Optional[str] = Query(
+        None, description="Filtrar por moneda: 'PEN' o 'USD'"
+    ),
+    usuario_email: Optional[str] = Query(
+        None,
+        description="Filtrar por email de usuario (deprecated, usar usuario_emails)",
+    ),
+    usuario_emails: Optional[List[str]] = Query(
+        None, description="Filtrar por múltiples emails de usuario"
+    ),
+    user_context: dict = Depends(get_user_context),
+):
+    """
+    Exporta todas las ventas filtradas (mismos filtros que /api/ventas) como
+    CSV o XLSX. Las filas se leen con un cursor del servidor y se envían por
+    bloques: no hay límite de page_size ni se arma la lista en memoria.
+    """
+    if formato not in exportacion.EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"formato inválido. Debe ser uno de: {', '.join(exportacion.EXPORT_FORMATS)}",
+        )
+
+    filtros = _filtros_ventas(
+        ruc_empresa=ruc_empresa,
+        rucs_empresa=rucs_empresa,
+        periodo=periodo,
+        fecha_desde=fecha_desde,
+        fecha_hasta=fecha_hasta,
+        moneda=moneda,
+        usuario_email=usuario_email,
+        usuario_emails=usuario_emails,
+        user_context=user_context,
     )
-    # --- FIN DE RESTAURACIÓN ---
+
+    return exportacion.exportar_ventas(filtros, formato=formato, sort_by=sort_by)
 
 
 @app.get("/api/ventas/count")
-def get_ventas_count(
+async def get_ventas_count(
     ruc_empresa: Optional[str] = Query(None, description="Filtrar por RUC de empresa"),
     rucs_empresa: Optional[List[str]] = Query(
         None, description="Filtrar por múltiples RUCs"
@@ -482,14 +791,23 @@ def get_ventas_count(
     usuario_emails: Optional[List[str]] = Query(
         None, description="Filtrar por múltiples emails de usuario"
     ),
+    count_mode: str = Query(
+        "exact", description="'exact' (caché o COUNT) o 'estimate' (estimación del planner)"
+    ),
     user_context: dict = Depends(get_user_context),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db_lectura),
 ):
     """
     Endpoint optimizado que SOLO cuenta las facturas.
     Se llama de forma asíncrona desde el frontend.
+    Los conteos exactos se cachean por filtros hasta el próximo refresh de ventas_backend.
     """
-    repo = VentaBackendRepository(db)
+    if count_mode not in ("exact", "estimate"):
+        raise HTTPException(
+            status_code=400, detail="count_mode inválido. Debe ser 'exact' o 'estimate'"
+        )
+
+    repo = AsyncVentaBackendRepository(db)
 
     fecha_desde_date = (
         datetime.strptime(fecha_desde, "%Y-%m-%d").date() if fecha_desde else None
@@ -500,8 +818,7 @@ def get_ventas_count(
 
     authorized_rucs = user_context["authorized_rucs"] if user_context else None
 
-    # Usamos la nueva función de repositorio que solo cuenta
-    total = repo.get_ventas_count(
+    filtros = dict(
         ruc=ruc_empresa,
         rucs_empresa=rucs_empresa,
         periodo=periodo,
@@ -512,7 +829,9 @@ def get_ventas_count(
         usuario_emails=usuario_emails,
     )
 
-    return {"total_items": total}
+    total, total_estimado = await count_cache.resolve_total_async(repo, filtros, count_mode=count_mode)
+
+    return {"total_items": total, "is_estimate": total_estimado}
 
 
 @app.get(
@@ -559,7 +878,7 @@ def get_empresas_del_periodo(
         None, description="Filtrar empresas por usuarios asignados"
     ),
     user_context: dict = Depends(get_user_context),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db_lectura),
 ):
     """
     Obtiene lista de empresas únicas (RUC y razón social).
@@ -568,15 +887,21 @@ def get_empresas_del_periodo(
     Admin ve todas las empresas, usuarios normales solo ven sus enrolados asignados.
 
     Si se proporciona usuario_emails, filtra las empresas para mostrar solo las asignadas a esos usuarios.
+
+    Sale de empresas_periodos y se cachea en memoria por (periodo, RUCs
+    autorizados, usuarios) hasta el próximo refresh de ventas_backend.
     """
     repo = VentaRepository(db)
     authorized_rucs = user_context["authorized_rucs"]
-    empresas = repo.get_empresas_unicas_por_periodo(
-        periodo=periodo, authorized_rucs=authorized_rucs, usuario_emails=usuario_emails
+    return empresas_cache.get_empresas(
+        lambda: repo.get_empresas_unicas_por_periodo(
+            periodo=periodo, authorized_rucs=authorized_rucs, usuario_emails=usuario_emails
+        ),
+        periodo=periodo,
+        authorized_rucs=authorized_rucs,
+        usuario_emails=usuario_emails,
     )
 
-    return empresas
-
 
 @app.get("/api/ventas/ultima-actualizacion")
 def get_ultima_actualizacion(
@@ -644,6 +969,125 @@ def get_clientes_con_facturas(
     )
 
 
+ESTADOS_VALIDOS = ["Sin gestión", "Gestionando", "Ganada", "Perdida"]
+MOTIVOS_PERDIDA = [
+    "Por Tasa",
+    "Por Riesgo",
+    "Deudor no califica",
+    "Cliente no interesado",
+    "Competencia",
+    "Otro",
+]
+
+# Máximo de facturas por llamada a /api/ventas/estado:bulk
+BULK_ESTADO_MAX_IDS = 1000
+
+
+@app.put("/api/ventas/estado:bulk", response_model=ActualizarEstadoBulkResponse)
+def actualizar_estado_ventas_bulk(
+    request: ActualizarEstadoBulkRequest,
+    user_context: dict = Depends(get_user_context),
+    db: Session = Depends(get_db),
+):
+    """
+    Actualiza estado1 (y estado2 si es 'Perdida') de varias facturas.
+    Autenticación OBLIGATORIA: solo se actualizan facturas de RUCs autorizados.
+
+    Una consulta resuelve existencia y autorización de todos los ids, un solo
+    UPDATE los cambia (los triggers de ventas_backend corren una vez por
+    sentencia) y el rollup de métricas se refresca una sola vez. Responde el
+    resultado de cada id: 200, 403 (RUC no autorizado) o 404 (no existe).
+
+    Con estado1 distinto de 'Perdida' se limpia estado2; con 'Perdida' sin
+    estado2 se conserva el motivo actual (igual que PUT /api/ventas/{id}/estado).
+    """
+    ids = list(dict.fromkeys(request.ids))
+    if not ids:
+        raise HTTPException(status_code=400, detail="Debe indicar al menos una factura")
+    if len(ids) > BULK_ESTADO_MAX_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo {BULK_ESTADO_MAX_IDS} facturas por solicitud",
+        )
+
+    if request.estado1 not in ESTADOS_VALIDOS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Estado inválido. Debe ser uno de: {', '.join(ESTADOS_VALIDOS)}",
+        )
+    if request.estado2 is not None:
+        if request.estado1 != "Perdida":
+            raise HTTPException(
+                status_code=400, detail="estado2 solo aplica con estado1 'Perdida'"
+            )
+        if request.estado2 not in MOTIVOS_PERDIDA:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Motivo inválido. Debe ser uno de: {', '.join(MOTIVOS_PERDIDA)}",
+            )
+
+    # Existencia y autorización de todos los ids en una consulta
+    authorized_rucs = user_context["authorized_rucs"]
+    autorizada = (
+        true() if authorized_rucs is None else VentaElectronica.ruc.in_(authorized_rucs)
+    )
+    filas = (
+        db.query(VentaElectronica.id, autorizada.label("autorizada"))
+        .filter(VentaElectronica.id.in_(ids))
+        .all()
+    )
+    encontradas = {fila.id for fila in filas}
+    autorizadas = [fila.id for fila in filas if fila.autorizada]
+
+    valores = {"estado1": request.estado1}
+    if request.estado1 != "Perdida":
+        valores["estado2"] = None
+    elif request.estado2 is not None:
+        valores["estado2"] = request.estado2
+
+    actualizadas = set()
+    if autorizadas:
+        # La condición de RUC se repite por si la factura cambió entre ambas consultas
+        stmt = (
+            update(VentaElectronica)
+            .where(VentaElectronica.id.in_(autorizadas), autorizada)
+            .values(**valores)
+            .returning(VentaElectronica.id)
+            .execution_options(synchronize_session=False)
+        )
+        actualizadas = set(db.execute(stmt).scalars().all())
+        db.commit()
+        replica_routing.registrar_escritura(user_context["email"])
+        response_cache.bump_version()
+
+        # ventas_backend se actualiza por trigger en el mismo commit; el
+        # rollup de métricas se refresca una sola vez en segundo plano
+        refresh_scheduler.request()
+
+    resultados = []
+    for venta_id in ids:
+        if venta_id in actualizadas:
+            resultados.append(ResultadoEstadoBulk(id=venta_id, status_code=200))
+        elif venta_id in encontradas:
+            resultados.append(
+                ResultadoEstadoBulk(
+                    id=venta_id,
+                    status_code=403,
+                    detail="No autorizado para modificar esta factura",
+                )
+            )
+        else:
+            resultados.append(
+                ResultadoEstadoBulk(
+                    id=venta_id, status_code=404, detail="Factura no encontrada"
+                )
+            )
+
+    return ActualizarEstadoBulkResponse(
+        actualizadas=len(actualizadas), resultados=resultados
+    )
+
+
 @app.put("/api/ventas/{venta_id}/estado", response_model=VentaResponse)
 def actualizar_estado_venta(
     venta_id: int,
@@ -671,11 +1115,10 @@ def actualizar_estado_venta(
         )
 
     # Validar estado
-    estados_validos = ["Sin gestión", "Gestionando", "Ganada", "Perdida"]
-    if request.estado1 not in estados_validos:
+    if request.estado1 not in ESTADOS_VALIDOS:
         raise HTTPException(
             status_code=400,
-            detail=f"Estado inválido. Debe ser uno de: {', '.join(estados_validos)}",
+            detail=f"Estado inválido. Debe ser uno de: {', '.join(ESTADOS_VALIDOS)}",
         )
 
     # Actualizar estado1
@@ -686,17 +1129,12 @@ def actualizar_estado_venta(
         venta.estado2 = None
 
     db.commit()
+    replica_routing.registrar_escritura(user_context["email"])
+    response_cache.bump_version()
 
-    try:
-        # Refresca la vista en una transacción separada para que las métricas se actualicen
-        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
-            conn.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY ventas_backend"))
-        logging.info(f"Vista ventas_backend refrescada (estado1={request.estado1})")
-    except Exception as e:
-        # Si el refresh falla (ej. por concurrencia), no rompemos la app.
-        # Los datos se actualizarán en el próximo refresh programado.
-        logging.error(f"Error al refrescar la vista: {e}")
-        pass
+    # ventas_backend se actualiza por trigger en el mismo commit; el rollup de
+    # métricas (o la vista, si aún es materializada) se refresca en segundo plano
+    refresh_scheduler.request()
 
     db.refresh(venta)
 
@@ -731,18 +1169,10 @@ def actualizar_estado_perdida(
         )
 
     # Validar motivo de pérdida
-    motivos_validos = [
-        "Por Tasa",
-        "Por Riesgo",
-        "Deudor no califica",
-        "Cliente no interesado",
-        "Competencia",
-        "Otro",
-    ]
-    if request.estado2 not in motivos_validos:
+    if request.estado2 not in MOTIVOS_PERDIDA:
         raise HTTPException(
             status_code=400,
-            detail=f"Motivo inválido. Debe ser uno de: {', '.join(motivos_validos)}",
+            detail=f"Motivo inválido. Debe ser uno de: {', '.join(MOTIVOS_PERDIDA)}",
         )
 
     # Actualizar estado1 a "Perdida" y estado2 con el motivo
@@ -750,15 +1180,12 @@ def actualizar_estado_perdida(
     venta.estado2 = request.estado2
 
     db.commit()
+    replica_routing.registrar_escritura(user_context["email"])
+    response_cache.bump_version()
 
-    try:
-        # Refresca la vista en una transacción separada
-        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
-            conn.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY ventas_backend"))
-        logging.info("Vista ventas_backend refrescada (estado1=Perdida)")
-    except Exception as e:
-        logging.error(f"Error al refrescar la vista: {e}")
-    pass
+    # ventas_backend se actualiza por trigger en el mismo commit; el rollup de
+    # métricas (o la vista, si aún es materializada) se refresca en segundo plano
+    refresh_scheduler.request()
 
     db.refresh(venta)
 
@@ -769,8 +1196,78 @@ def actualizar_estado_perdida(
 # ==================== ENDPOINTS DE MÉTRICAS ====================
 
 
+def _metricas_resumen_fallback(
+    db: Session,
+    fecha_desde_date,
+    fecha_hasta_date,
+    authorized_rucs: Optional[List[str]],
+    rucs_empresa: Optional[List[str]],
+    moneda: Optional[List[str]],
+    usuario_emails: Optional[List[str]],
+):
+    """
+    FALLBACK de /api/metricas/resumen: query directo sobre ventas cuando la
+    vista no está disponible. Se ejecuta con AsyncSession.run_sync.
+    """
+    is_admin = authorized_rucs is None
+    query = (
+        db.query(
+            VentaElectronica.moneda,
+            func.sum(VentaElectronica.total_cp).label("total_facturado"),
+            func.sum(
+                case(
+                    (
+                        VentaElectronica.estado1 == "Ganada",
+                        VentaElectronica.total_cp,
+                    ),
+                    else_=0,
+                )
+            ).label("monto_ganado"),
+            func.sum(
+                case(
+                    (
+                        (VentaElectronica.estado1.is_(None))
+                        | (
+                            (VentaElectronica.estado1 != "Ganada")
+                            & (VentaElectronica.estado1 != "Perdida")
+                        ),
+                        VentaElectronica.total_cp,
+                    ),
+                    else_=0,
+                )
+            ).label("monto_disponible"),
+            func.count(VentaElectronica.id).label("cantidad"),
+        )
+        .join(Enrolado, VentaElectronica.ruc == Enrolado.ruc, isouter=True)
+        .filter(
+            VentaElectronica.fecha_emision >= fecha_desde_date,
+            VentaElectronica.fecha_emision <= fecha_hasta_date,
+            VentaElectronica.tipo_cp_doc != "7",
+            ~VentaElectronica.serie_cdp.like("B%"),
+        )
+    )
+
+    # Si NO es admin, filtrar por RUCs autorizados
+    if not is_admin:
+        query = query.filter(VentaElectronica.ruc.in_(authorized_rucs))
+
+    if rucs_empresa and len(rucs_empresa) > 0:
+        query = query.filter(VentaElectronica.ruc.in_(rucs_empresa))
+
+    if moneda and len(moneda) > 0:
+        query = query.filter(VentaElectronica.moneda.in_(moneda))
+
+    # Aplicar filtro de usuarios SOLO si NO es admin
+    # ADMIN SIEMPRE VE TODAS LAS FACTURAS
+    if not is_admin and usuario_emails and len(usuario_emails) > 0:
+        query = query.filter(Enrolado.email.in_(usuario_emails))
+
+    query = query.group_by(VentaElectronica.moneda)
+    return query.all()
+
+
 @app.get("/api/metricas/resumen")
-def get_metricas_resumen(
+async def get_metricas_resumen(
     fecha_desde: str = Query(..., description="Fecha inicio YYYY-MM-DD"),
     fecha_hasta: str = Query(..., description="Fecha fin YYYY-MM-DD"),
     rucs_empresa: Optional[List[str]] = Query(
@@ -783,7 +1280,7 @@ def get_metricas_resumen(
         None, description="Lista de emails de usuarios"
     ),
     user_context: dict = Depends(get_user_context),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db_lectura),
 ):
     """
     Endpoint ULTRA-OPTIMIZADO usando materialized views.
@@ -794,37 +1291,72 @@ def get_metricas_resumen(
     - Datos pre-calculados cada hora
     - Soporta millones de registros sin degradación
 
+    FUENTE: rollup ventas_metricas_diarias si está al día con ventas_backend;
+    si no, la materialized view.
+
     FALLBACK: Si la MV no existe, usa query directo (backward compatible)
     """
     try:
         authorized_rucs = user_context["authorized_rucs"]
         is_admin = authorized_rucs is None
 
-        logger.info("=" * 80)
-        logger.info(
-            f"🔐 [Métricas] Usuario: {user_context.get('email')}, Rol: {user_context.get('rol')}"
-        )
-        logger.info(
-            f"🔐 [Métricas] Admin: {is_admin}, Authorized RUCs: {authorized_rucs}"
-        )
-        logger.info(f"📅 [Métricas] Rango: {fecha_desde} a {fecha_hasta}")
-        logger.info("🎯 [Métricas] Filtros recibidos:")
-        logger.info(f"   - rucs_empresa: {rucs_empresa}")
-        logger.info(f"   - moneda: {moneda}")
-        logger.info(f"   - usuario_emails: {usuario_emails}")
-
         # Convertir fechas
         fecha_desde_date = datetime.strptime(fecha_desde, "%Y-%m-%d").date()
         fecha_hasta_date = datetime.strptime(fecha_hasta, "%Y-%m-%d").date()
-        logger.info(
-            f"📅 [Métricas] Fechas convertidas: {fecha_desde_date} a {fecha_hasta_date}"
-        )
 
-        # Intentar usar materialized view (ULTRA RÁPIDO)
-        try:
-            logger.info("🔄 [Métricas] Intentando usar Materialized View...")
+        params = {"fecha_desde": fecha_desde_date, "fecha_hasta": fecha_hasta_date}
+        filtros_sql = ""
+
+        # Agregar filtros opcionales solo si se especifican
+        # (ventas_backend y ventas_metricas_diarias comparten ruc/moneda/fecha_emision)
+        if rucs_empresa and len(rucs_empresa) > 0:
+            filtros_sql += " AND ruc = ANY(:filter_rucs)"
+            params["filter_rucs"] = rucs_empresa
+        elif not is_admin and authorized_rucs:
+            filtros_sql += " AND ruc = ANY(:authorized_rucs)"
+            params["authorized_rucs"] = authorized_rucs
 
-            query_sql = """
+        if moneda and len(moneda) > 0:
+            filtros_sql += " AND moneda = ANY(:filter_moneda)"
+            params["filter_moneda"] = moneda
+
+        # SOLO filtrar por usuario_emails si NO es admin y se especifica explícitamente
+        # ADMIN SIEMPRE VE TODAS LAS FACTURAS (sin filtro de usuario)
+        if not is_admin and usuario_emails and len(usuario_emails) > 0:
+            filtros_sql += """
+                AND ruc IN (
+                    SELECT ruc FROM enrolados WHERE email = ANY(:filter_usuarios)
+                )
+            """
+            params["filter_usuarios"] = usuario_emails
+
+        # Rollup diario (unos cientos de filas) si está al día con la vista;
+        # si no, la consulta sobre la materialized view
+        usar_rollup = await rollup_metricas_vigente_async(db)
+
+        try:
+            if usar_rollup:
+                query_sql = """
+            SELECT
+                moneda,
+                SUM(monto_neto)::numeric as total_facturado,
+                SUM(CASE
+                    WHEN estado1 = 'Ganada'
+                    THEN monto_neto
+                    ELSE 0
+                END)::numeric as monto_ganado,
+                SUM(CASE
+                    WHEN estado1 IS NULL OR (estado1 != 'Ganada' AND estado1 != 'Perdida')
+                    THEN monto_neto
+                    ELSE 0
+                END)::numeric as monto_disponible,
+                SUM(cantidad)::integer as cantidad
+            FROM ventas_metricas_diarias
+            WHERE fecha_emision >= :fecha_desde
+              AND fecha_emision <= :fecha_hasta
+        """
+            else:
+                query_sql = """
             SELECT
                 moneda,
                 SUM(CASE
@@ -848,131 +1380,28 @@ def get_metricas_resumen(
               AND fecha_emision <= :fecha_hasta
         """
 
-            params = {"fecha_desde": fecha_desde_date, "fecha_hasta": fecha_hasta_date}
-
-            # Agregar filtros opcionales solo si se especifican
-            if rucs_empresa and len(rucs_empresa) > 0:
-                logger.info(f"   ✓ Aplicando filtro rucs_empresa: {rucs_empresa}")
-                query_sql += " AND ruc = ANY(:filter_rucs)"
-                params["filter_rucs"] = rucs_empresa
-            elif not is_admin and authorized_rucs:
-                logger.info(
-                    f"   ✓ Aplicando filtro authorized_rucs (no admin): {authorized_rucs}"
-                )
-                query_sql += " AND ruc = ANY(:authorized_rucs)"
-                params["authorized_rucs"] = authorized_rucs
-            else:
-                logger.info("   ✓ NO se aplica filtro de RUC (admin o sin filtros)")
-
-            if moneda and len(moneda) > 0:
-                logger.info(f"   ✓ Aplicando filtro moneda: {moneda}")
-                query_sql += " AND moneda = ANY(:filter_moneda)"
-                params["filter_moneda"] = moneda
-
-            # SOLO filtrar por usuario_emails si NO es admin y se especifica explícitamente
-            # ADMIN SIEMPRE VE TODAS LAS FACTURAS (sin filtro de usuario)
-            if not is_admin and usuario_emails and len(usuario_emails) > 0:
-                logger.info(
-                    f"   ✓ Aplicando filtro usuario_emails (no admin): {usuario_emails}"
-                )
-                query_sql += """
-                    AND ruc IN (
-                        SELECT ruc FROM enrolados WHERE email = ANY(:filter_usuarios)
-                    )
-                """
-                params["filter_usuarios"] = usuario_emails
-            elif is_admin and usuario_emails and len(usuario_emails) > 0:
-                logger.info(
-                    "   ✓ IGNORANDO filtro usuario_emails (usuario es ADMIN - ve todo)"
-                )
-
+            query_sql += filtros_sql
             query_sql += " GROUP BY moneda"
 
-            logger.info("📝 [Métricas] Query SQL completo:")
-            logger.info(query_sql)
-            logger.info("📝 [Métricas] Parámetros: {params}")
-
-            query = db.execute(text(query_sql), params)
+            query = await db.execute(text(query_sql), params)
             results = query.fetchall()
 
-            logger.info(
-                f"✅ [Métricas] Query ejecutada - Filas retornadas: {len(results)}"
-            )
-            if results:
-                for row in results:
-                    logger.info(
-                        f"   📊 {row.moneda}: Total={row.total_facturado}, Ganado={row.monto_ganado}, Disponible={row.monto_disponible}, Cantidad={row.cantidad}"
-                    )
-            else:
-                logger.warning("   ⚠️ NO SE ENCONTRARON RESULTADOS")
-
         except Exception as mv_error:
             # FALLBACK: Si MV no existe, usar query directo
             logger.warning(
                 f"⚠️ [Métricas] MV no disponible, usando query directo: {mv_error}"
             )
-
-            query = (
-                db.query(
-                    VentaElectronica.moneda,
-                    func.sum(VentaElectronica.total_cp).label("total_facturado"),
-                    func.sum(
-                        case(
-                            (
-                                VentaElectronica.estado1 == "Ganada",
-                                VentaElectronica.total_cp,
-                            ),
-                            else_=0,
-                        )
-                    ).label("monto_ganado"),
-                    func.sum(
-                        case(
-                            (
-                                (VentaElectronica.estado1.is_(None))
-                                | (
-                                    (VentaElectronica.estado1 != "Ganada")
-                                    & (VentaElectronica.estado1 != "Perdida")
-                                ),
-                                VentaElectronica.total_cp,
-                            ),
-                            else_=0,
-                        )
-                    ).label("monto_disponible"),
-                    func.count(VentaElectronica.id).label("cantidad"),
-                )
-                .join(Enrolado, VentaElectronica.ruc == Enrolado.ruc, isouter=True)
-                .filter(
-                    VentaElectronica.fecha_emision >= fecha_desde_date,
-                    VentaElectronica.fecha_emision <= fecha_hasta_date,
-                    VentaElectronica.tipo_cp_doc != "7",
-                    ~VentaElectronica.serie_cdp.like("B%"),
-                )
+            await db.rollback()
+            results = await db.run_sync(
+                _metricas_resumen_fallback,
+                fecha_desde_date,
+                fecha_hasta_date,
+                authorized_rucs,
+                rucs_empresa,
+                moneda,
+                usuario_emails,
             )
-
-            # Si NO es admin, filtrar por RUCs autorizados
-            if not is_admin:
-                query = query.filter(VentaElectronica.ruc.in_(authorized_rucs))
-
-            if rucs_empresa and len(rucs_empresa) > 0:
-                query = query.filter(VentaElectronica.ruc.in_(rucs_empresa))
-
-            if moneda and len(moneda) > 0:
-                query = query.filter(VentaElectronica.moneda.in_(moneda))
-
-            # Aplicar filtro de usuarios SOLO si NO es admin
-            # ADMIN SIEMPRE VE TODAS LAS FACTURAS
-            if not is_admin and usuario_emails and len(usuario_emails) > 0:
-                query = query.filter(Enrolado.email.in_(usuario_emails))
-                logger.info(
-                    f"   ✓ [FALLBACK] Aplicando filtro usuario_emails (no admin): {usuario_emails}"
-                )
-            elif is_admin and usuario_emails and len(usuario_emails) > 0:
-                logger.info(
-                    f"   ✓ [FALLBACK] IGNORANDO filtro usuario_emails (usuario es ADMIN - ve todo)"
-                )
-
-            query = query.group_by(VentaElectronica.moneda)
-            results = query.all()
+        registrar_filas(len(results))
 
         # Transformar resultados
         metricas = {
@@ -998,26 +1427,17 @@ def get_metricas_resumen(
                 "montoDisponible": float(row.monto_disponible or 0),
                 "cantidad": int(row.cantidad or 0),
             }
-            logger.info(f"💰 [Métricas] Procesando {moneda_key}:")
-            logger.info(
-                f"   Total Facturado: {metricas[moneda_key]['totalFacturado']:,.2f}"
-            )
-            logger.info(f"   Monto Ganado: {metricas[moneda_key]['montoGanado']:,.2f}")
-            logger.info(
-                f"   Monto Disponible: {metricas[moneda_key]['montoDisponible']:,.2f}"
-            )
-            logger.info(f"   Cantidad: {metricas[moneda_key]['cantidad']}")
 
-        logger.info("📤 [Métricas] Respuesta final que se enviará al frontend:")
-        logger.info(f"   PEN: {metricas['PEN']}")
-        logger.info(f"   USD: {metricas['USD']}")
-        logger.info("=" * 80)
+        # Tiempos y filas por ruta: /metrics (instrumentacion.py)
+        logger.debug(
+            "[Métricas] %s rollup=%s filas=%d", user_context.get("email"), usar_rollup, len(results)
+        )
         return metricas
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"❌ [Métricas] Error crítico: {e}", exc_info=True)
+        logger.error("[Métricas] Error crítico: %s", e, exc_info=True)
         raise HTTPException(
             status_code=500, detail=f"Error al obtener métricas: {str(e)}"
         )
@@ -1079,19 +1499,88 @@ def get_compras(
     )
 
 
+@app.get("/api/compras/export")
+def export_compras(
+    formato: str = Query("csv", description="Formato: 'csv' o 'xlsx'"),
+    ruc_empresa: Optional[str] = Query(None, description="Filtrar por RUC de empresa"),
+    periodo: Optional[str] = Query(None, description="Filtrar por periodo (YYYYMM)"),
+    fecha_desde: Optional[str] = Query(None, description="Fecha desde (YYYY-MM-DD)"),
+    fecha_hasta: Optional[str] = Query(None, description="Fecha hasta (YYYY-MM-DD)"),
+    user_context: dict = Depends(get_user_context),
+):
+    """
+    Exporta todas las compras filtradas (mismos filtros que /api/compras) como
+    CSV o XLSX, en streaming.
+    """
+    if formato not in exportacion.EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"formato inválido. Debe ser uno de: {', '.join(exportacion.EXPORT_FORMATS)}",
+        )
+
+    filtros = dict(
+        ruc_empresa=ruc_empresa,
+        periodo=periodo,
+        fecha_desde=fecha_desde,
+        fecha_hasta=fecha_hasta,
+        authorized_rucs=user_context["authorized_rucs"],
+    )
+
+    return exportacion.exportar_compras(filtros, formato=formato)
+
+
 # ==================== ESTADÍSTICAS GENERALES ====================
 
 
+# Totales mantenidos por triggers (10_estadisticas_tablas.sql)
+_ESTADISTICAS_SQL = text("""
+    SELECT
+        MAX(filas) FILTER (WHERE tabla = 'enrolados'),
+        MAX(filas) FILTER (WHERE tabla = 'ventas_sire'),
+        MAX(filas) FILTER (WHERE tabla = 'compras_sire'),
+        MAX(monto_total) FILTER (WHERE tabla = 'ventas_sire'),
+        MAX(monto_total) FILTER (WHERE tabla = 'compras_sire')
+    FROM estadisticas_tablas
+""")
+
+# Recuento en vivo, en una sola consulta
+_ESTADISTICAS_EXACTAS_SQL = text("""
+    SELECT
+        (SELECT COUNT(*) FROM enrolados),
+        v.filas, c.filas, v.monto, c.monto
+    FROM (SELECT COUNT(*), COALESCE(SUM(total_cp), 0) FROM ventas_sire) AS v(filas, monto),
+         (SELECT COUNT(*), COALESCE(SUM(total_cp), 0) FROM compras_sire) AS c(filas, monto)
+""")
+
+
 @app.get("/api/estadisticas/resumen")
-def get_resumen_general(db: Session = Depends(get_db)):
-    """Estadísticas generales del sistema"""
+def get_resumen_general(
+    exact: bool = Query(
+        False, description="Recontar en vivo (recorre ventas_sire y compras_sire completas)"
+    ),
+    db: Session = Depends(get_db_replica),
+):
+    """
+    Estadísticas generales del sistema.
+
+    Por defecto lee los totales de estadisticas_tablas (una fila por tabla,
+    mantenida por triggers). Con exact=true, o si la tabla aún no existe o
+    está incompleta, cuenta en vivo.
+    """
+    fila = None
+    if not exact:
+        try:
+            fila = db.execute(_ESTADISTICAS_SQL).one()
+        except Exception as e:
+            logger.warning("No se pudo leer estadisticas_tablas: %s", e)
+            db.rollback()
+        if fila is not None and None in fila:
+            fila = None
 
-    total_enrolados = db.query(func.count(Enrolado.id)).scalar()
-    total_ventas = db.query(func.count(VentaElectronica.id)).scalar()
-    total_compras = db.query(func.count(CompraElectronica.id)).scalar()
+    if fila is None:
+        fila = db.execute(_ESTADISTICAS_EXACTAS_SQL).one()
 
-    monto_total_ventas = db.query(func.sum(VentaElectronica.total_cp)).scalar() or 0
-    monto_total_compras = db.query(func.sum(CompraElectronica.total_cp)).scalar() or 0
+    total_enrolados, total_ventas, total_compras, monto_total_ventas, monto_total_compras = fila
 
     return {
         "total_enrolados": total_enrolados,
@@ -58,7 +58,8 @@ class Enrolado(Base):
 class PeriodoFallido(Base):
     """
     Modelo para tracking de periodos que fallaron durante el procesamiento.
-    Permite reintento manual y seguimiento de errores.
+    Permite reintento manual y seguimiento de errores; el programador de
+    ingesta (ingesta/programador.py) reintenta los no resueltos con backoff.
     """
 
     __tablename__ = "periodos_fallidos"
@@ -70,6 +71,10 @@ class PeriodoFallido(Base):
     fecha_fallo = Column(DateTime, default=datetime.now)
     motivo = Column(Text)
     resuelto = Column(Boolean, default=False, nullable=False)
+    intentos = Column(Integer, default=1, nullable=False)
+    proximo_intento = Column(
+        DateTime, nullable=True, comment="Cuándo reintentar (backoff exponencial)"
+    )
 
     __table_args__ = (Index("idx_ruc_periodo_tipo_fallo", "ruc", "periodo", "tipo"),)
 
@@ -351,8 +356,11 @@ class VentaSire(Base):
 
 class VentaBackend(Base):
     """
-    Vista materializada optimizada para consultas del backend.
+    Facturas optimizadas para consultas del backend (ventas_backend).
     Incluye cálculos pre-procesados de notas de crédito y totales netos.
+    Es una tabla mantenida por triggers sobre ventas_sire/enrolados/usuarios
+    (06_ventas_backend_incremental.sql) o, antes de esa migración, una vista
+    materializada con las mismas columnas.
     NO usar insert/update/delete en este modelo - es solo lectura.
     """
 
@@ -436,6 +444,23 @@ class VentaBackend(Base):
         return f"<VentaBackend(id={self.id}, ruc={self.ruc}, periodo={self.periodo}, total_neto={self.total_neto})>"
 
 
+class EmpresaPeriodo(Base):
+    """
+    Empresas (RUC y razón social) con ventas en cada periodo, para el selector
+    de empresas. Mantenida por triggers sobre ventas_sire
+    (11_empresas_periodos.sql); solo lectura desde la aplicación.
+    """
+
+    __tablename__ = "empresas_periodos"
+
+    ruc = Column(String(11), primary_key=True)
+    periodo = Column(String(6), primary_key=True)
+    razon_social = Column(String(500), nullable=False)
+
+    def __repr__(self):
+        return f"<EmpresaPeriodo(ruc={self.ruc}, periodo={self.periodo})>"
+
+
 # Alias para backward compatibility con código legacy
 CompraElectronica = CompraSire
 VentaElectronica = VentaSire
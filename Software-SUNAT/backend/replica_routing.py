@@ -0,0 +1,83 @@
+"""
+Enrutamiento de los endpoints de lectura a la réplica de PostgreSQL.
+
+/api/ventas, /api/ventas/count, /api/ventas/empresas, /api/metricas/resumen y
+/api/estadisticas/resumen solo leen; en el primario compiten con los cambios
+de estado y los refresh de ventas_backend. Sus dependencias de sesión
+(get_db_lectura, get_async_db_lectura, get_db_replica) usan SesionEnrutada:
+lecturas a la réplica (DATABASE_REPLICA_URL o CLOUD_SQL_REPLICA_CONNECTION_NAME),
+escrituras al primario. Sin réplica configurada todo va al primario.
+
+Guardia de lecturas propias: la réplica va algunos segundos detrás del
+primario. Los endpoints que escriben llaman a registrar_escritura(email) tras
+el commit y, durante DB_REPLICA_LECTURA_PROPIA_S segundos, las lecturas de ese
+usuario van al primario (ve su propio cambio de estado al recargar la lista).
+El registro es por instancia: con varias instancias de Cloud Run conviene que
+la ventana cubra el lag habitual de la réplica más que el tiempo de un reload.
+"""
+
+import logging
+from typing import Optional
+
+from fastapi import Depends
+
+from auth import get_user_context
+from cache import TTLCache
+from database import DB_REPLICA_LECTURA_PROPIA_S, SessionLectura, engine_replica
+from database_async import AsyncSessionLectura
+
+logger = logging.getLogger(__name__)
+
+_escrituras_recientes = TTLCache(maxsize=10000, ttl=DB_REPLICA_LECTURA_PROPIA_S)
+
+
+def registrar_escritura(email: Optional[str]) -> None:
+    """Anota que el usuario acaba de escribir (sus lecturas irán al primario)"""
+    if email and engine_replica is not None:
+        _escrituras_recientes.set(email, True)
+
+
+def leer_de_replica(email: Optional[str]) -> bool:
+    """False si el usuario escribió dentro de la ventana de la guardia"""
+    return email is None or _escrituras_recientes.get(email) is None
+
+
+def get_db_lectura(user_context: dict = Depends(get_user_context)):
+    """
+    Dependency de sesión de lectura (sync) para endpoints autenticados.
+    """
+    db = SessionLectura()
+    db.info["usar_replica"] = leer_de_replica(user_context["email"])
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db_lectura(user_context: dict = Depends(get_user_context)):
+    """
+    Dependency de sesión de lectura (async) para endpoints autenticados.
+    """
+    async with AsyncSessionLectura() as db:
+        db.sync_session.info["usar_replica"] = leer_de_replica(user_context["email"])
+        yield db
+
+
+def get_db_replica():
+    """
+    Dependency de sesión de lectura sin usuario (sin guardia de lecturas propias).
+    """
+    db = SessionLectura()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def stats() -> dict:
+    """Estado de la réplica y de la guardia de lecturas propias"""
+    return {
+        "replica_configurada": engine_replica is not None,
+        "ventana_lectura_propia_s": DB_REPLICA_LECTURA_PROPIA_S,
+        "usuarios_en_primario": len(_escrituras_recientes),
+    }
@@ -0,0 +1,176 @@
+from sqlalchemy import func, select
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
+from datetime import date
+
+from instrumentacion import registrar_filas
+from models import VentaBackend
+from repositories.venta_backend_repository import (
+    _COLUMNAS_RESPUESTA,
+    VentaBackendRepository,
+)
+
+
+class AsyncVentaBackendRepository:
+    """
+    Variante async (AsyncSession / asyncpg) de las lecturas de
+    VentaBackendRepository que usan /api/ventas y /api/ventas/count.
+
+    Filtros, orden, cursor y estimación son los mismos helpers del repositorio
+    sync (aplicados sobre select() en vez de Query), así ambas versiones
+    devuelven exactamente las mismas filas.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_ventas_pagina(
+        self,
+        page: int = 1,
+        page_size: int = 20,
+        ruc: Optional[str] = None,
+        rucs_empresa: Optional[List[str]] = None,
+        periodo: Optional[str] = None,
+        fecha_desde: Optional[date] = None,
+        fecha_hasta: Optional[date] = None,
+        sort_by: str = "fecha",
+        moneda: Optional[str] = None,
+        authorized_rucs: Optional[List[str]] = None,
+        usuario_emails: Optional[List[str]] = None,
+    ) -> Tuple[List[Row], bool]:
+        """
+        Ver VentaBackendRepository.get_ventas_pagina.
+
+        Returns:
+            Tuple de (lista de Rows con _COLUMNAS_RESPUESTA, hay_mas)
+        """
+        query = VentaBackendRepository._aplicar_filtros(
+            self._select_respuesta(),
+            ruc=ruc,
+            rucs_empresa=rucs_empresa,
+            periodo=periodo,
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+            moneda=moneda,
+            authorized_rucs=authorized_rucs,
+            usuario_emails=usuario_emails,
+        )
+        query = query.order_by(*VentaBackendRepository._orden(sort_by))
+
+        offset = (page - 1) * page_size
+        rows = (await self.db.execute(query.limit(page_size + 1).offset(offset))).all()
+        registrar_filas(len(rows))
+
+        return rows[:page_size], len(rows) > page_size
+
+    async def get_ventas_keyset(
+        self,
+        cursor: Optional[str] = None,
+        page_size: int = 20,
+        ruc: Optional[str] = None,
+        rucs_empresa: Optional[List[str]] = None,
+        periodo: Optional[str] = None,
+        fecha_desde: Optional[date] = None,
+        fecha_hasta: Optional[date] = None,
+        sort_by: str = "fecha",
+        moneda: Optional[str] = None,
+        authorized_rucs: Optional[List[str]] = None,
+        usuario_emails: Optional[List[str]] = None,
+    ) -> Tuple[List[Row], Optional[str]]:
+        """
+        Ver VentaBackendRepository.get_ventas_keyset.
+
+        Returns:
+            Tuple de (lista de Rows con _COLUMNAS_RESPUESTA, next_cursor)
+
+        Raises:
+            ValueError: Si el cursor es inválido o corresponde a otro ordenamiento
+        """
+        sort_by = "monto" if sort_by == "monto" else "fecha"
+
+        query = VentaBackendRepository._aplicar_filtros(
+            self._select_respuesta(),
+            ruc=ruc,
+            rucs_empresa=rucs_empresa,
+            periodo=periodo,
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+            moneda=moneda,
+            authorized_rucs=authorized_rucs,
+            usuario_emails=usuario_emails,
+        )
+
+        if cursor:
+            query = VentaBackendRepository._filtro_cursor(query, cursor, sort_by)
+
+        query = query.order_by(*VentaBackendRepository._orden(sort_by))
+
+        # Se pide una fila extra para saber si existe una página siguiente
+        rows = (await self.db.execute(query.limit(page_size + 1))).all()
+        registrar_filas(len(rows))
+        return VentaBackendRepository._pagina_keyset(rows, page_size, sort_by)
+
+    async def get_ventas_count(
+        self,
+        ruc: Optional[str] = None,
+        rucs_empresa: Optional[List[str]] = None,
+        periodo: Optional[str] = None,
+        fecha_desde: Optional[date] = None,
+        fecha_hasta: Optional[date] = None,
+        moneda: Optional[str] = None,
+        authorized_rucs: Optional[List[str]] = None,
+        usuario_emails: Optional[List[str]] = None,
+    ) -> int:
+        """Ver VentaBackendRepository.get_ventas_count"""
+        query = select(func.count(VentaBackend.id)).filter(VentaBackend.tipo_cp_doc == "1")
+        query = VentaBackendRepository._aplicar_filtros(
+            query,
+            ruc=ruc,
+            rucs_empresa=rucs_empresa,
+            periodo=periodo,
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+            moneda=moneda,
+            authorized_rucs=authorized_rucs,
+            usuario_emails=usuario_emails,
+        )
+        total = (await self.db.execute(query)).scalar() or 0
+        registrar_filas(1)
+        return total
+
+    async def estimate_ventas_count(
+        self,
+        ruc: Optional[str] = None,
+        rucs_empresa: Optional[List[str]] = None,
+        periodo: Optional[str] = None,
+        fecha_desde: Optional[date] = None,
+        fecha_hasta: Optional[date] = None,
+        moneda: Optional[str] = None,
+        authorized_rucs: Optional[List[str]] = None,
+        usuario_emails: Optional[List[str]] = None,
+    ) -> int:
+        """Ver VentaBackendRepository.estimate_ventas_count (solo EXPLAIN)"""
+        query = select(VentaBackend.id).filter(VentaBackend.tipo_cp_doc == "1")
+        query = VentaBackendRepository._aplicar_filtros(
+            query,
+            ruc=ruc,
+            rucs_empresa=rucs_empresa,
+            periodo=periodo,
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+            moneda=moneda,
+            authorized_rucs=authorized_rucs,
+            usuario_emails=usuario_emails,
+        )
+
+        sql, params = VentaBackendRepository._sql_explain(query, self.db.get_bind().dialect)
+        conexion = await self.db.connection()
+        plan = (await conexion.exec_driver_sql(sql, params)).scalar()
+        registrar_filas(1)
+        return VentaBackendRepository._filas_estimadas(plan)
+
+    @staticmethod
+    def _select_respuesta():
+        """Facturas (tipo 1) proyectadas a las columnas de VentaResponse"""
+        return select(*_COLUMNAS_RESPUESTA).filter(VentaBackend.tipo_cp_doc == "1")
@@ -1,11 +1,32 @@
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
-from typing import Optional, List
+from typing import Iterator, Optional, List
 from datetime import date
 from models import CompraElectronica
+from instrumentacion import contar_filas
 from repositories.base_repository import BaseRepository
 
 
+# Columnas de CompraResponse (las exportaciones no cargan la entidad completa)
+_COLUMNAS_EXPORTACION = (
+    CompraElectronica.id,
+    CompraElectronica.ruc,
+    CompraElectronica.razon_social,
+    CompraElectronica.periodo,
+    CompraElectronica.car_sunat,
+    CompraElectronica.fecha_emision,
+    CompraElectronica.tipo_cp_doc,
+    CompraElectronica.serie_cdp,
+    CompraElectronica.nro_cp_inicial,
+    CompraElectronica.nro_doc_identidad,
+    CompraElectronica.apellidos_nombres_razon_social,
+    CompraElectronica.total_cp,
+    CompraElectronica.moneda,
+    CompraElectronica.tipo_cambio,
+)
+
+
 class CompraRepository(BaseRepository[CompraElectronica]):
     """Repositorio especializado para consultas de compras"""
 
@@ -37,16 +58,80 @@ class CompraRepository(BaseRepository[CompraElectronica]):
         Returns:
             tuple: (items, total_count)
         """
-        query = self.db.query(CompraElectronica)
+        # CONTROL DE ACCESO: Usuario sin RUCs autorizados, retornar vacío
+        if authorized_rucs is not None and len(authorized_rucs) == 0:
+            return [], 0
+
+        query = self._aplicar_filtros(
+            self.db.query(CompraElectronica),
+            ruc_empresa=ruc_empresa,
+            periodo=periodo,
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+            authorized_rucs=authorized_rucs,
+        )
+
+        # Ordenar por fecha descendente
+        query = query.order_by(desc(CompraElectronica.fecha_emision))
+
+        # Contar total
+        total = query.count()
+
+        # Aplicar paginación
+        offset = (page - 1) * page_size
+        items = query.offset(offset).limit(page_size).all()
+
+        return items, total
+
+    def iter_compras(
+        self,
+        ruc_empresa: Optional[str] = None,
+        periodo: Optional[str] = None,
+        fecha_desde: Optional[date] = None,
+        fecha_hasta: Optional[date] = None,
+        authorized_rucs: Optional[List[str]] = None,
+        chunk_size: int = 2000,
+    ) -> Iterator[Row]:
+        """
+        Recorre todas las compras filtradas con un cursor del lado del servidor
+        (yield_per), `chunk_size` filas por vez. Para exportaciones.
 
+        Args:
+            (filtros iguales a get_compras_paginadas)
+            chunk_size: Filas por lote leído del cursor
+
+        Yields:
+            Rows con _COLUMNAS_EXPORTACION
+        """
+        if authorized_rucs is not None and len(authorized_rucs) == 0:
+            return
+
+        query = self._aplicar_filtros(
+            self.db.query(*_COLUMNAS_EXPORTACION),
+            ruc_empresa=ruc_empresa,
+            periodo=periodo,
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+            authorized_rucs=authorized_rucs,
+        )
+        query = query.order_by(desc(CompraElectronica.fecha_emision), desc(CompraElectronica.id))
+
+        yield from contar_filas(query.yield_per(chunk_size))
+
+    def _aplicar_filtros(
+        self,
+        query,
+        ruc_empresa: Optional[str] = None,
+        periodo: Optional[str] = None,
+        fecha_desde: Optional[date] = None,
+        fecha_hasta: Optional[date] = None,
+        authorized_rucs: Optional[List[str]] = None,
+    ):
+        """Aplica los filtros comunes de /api/compras"""
         # CONTROL DE ACCESO: Filtrar por RUCs autorizados
         if authorized_rucs is not None:
-            if len(authorized_rucs) == 0:
-                # Usuario sin RUCs autorizados, retornar vacío
-                return [], 0
             query = query.filter(CompraElectronica.ruc.in_(authorized_rucs))
 
-        # Aplicar filtros
         if ruc_empresa:
             query = query.filter(CompraElectronica.ruc == ruc_empresa)
 
@@ -59,14 +144,4 @@ class CompraRepository(BaseRepository[CompraElectronica]):
         if fecha_hasta:
             query = query.filter(CompraElectronica.fecha_emision <= fecha_hasta)
 
-        # Ordenar por fecha descendente
-        query = query.order_by(desc(CompraElectronica.fecha_emision))
-
-        # Contar total
-        total = query.count()
-
-        # Aplicar paginación
-        offset = (page - 1) * page_size
-        items = query.offset(offset).limit(page_size).all()
-
-        return items, total
+        return query
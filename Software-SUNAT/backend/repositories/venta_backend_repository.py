@@ -1,12 +1,74 @@
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
-from typing import List, Optional, Tuple
+from sqlalchemy import func, desc, and_, or_, tuple_
+from typing import Any, Iterator, List, Optional, Tuple
 from datetime import date
+from decimal import Decimal, InvalidOperation
+import base64
+import binascii
+import json
 
 from models import VentaBackend, Enrolado, Usuario
+from instrumentacion import contar_filas
 from repositories.base_repository import BaseRepository
 
 
+def _encode_cursor(sort_by: str, valor: Any, venta_id: int) -> str:
+    """Codifica la posición (valor de orden, id) como un token opaco URL-safe"""
+    if valor is not None:
+        valor = valor.isoformat() if sort_by == "fecha" else str(valor)
+    payload = json.dumps({"s": sort_by, "v": valor, "id": venta_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, sort_by: str) -> Tuple[Any, int]:
+    """
+    Decodifica un cursor generado por _encode_cursor.
+
+    Raises:
+        ValueError: Si el cursor está corrupto o es de otro ordenamiento
+    """
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(cursor + padding))
+        if data["s"] != sort_by:
+            raise ValueError("El cursor corresponde a otro ordenamiento")
+        valor = data["v"]
+        if valor is not None:
+            valor = date.fromisoformat(valor) if sort_by == "fecha" else Decimal(valor)
+        return valor, int(data["id"])
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError, KeyError,
+            TypeError, InvalidOperation) as e:
+        raise ValueError(f"Cursor inválido: {e}")
+
+
+# Columnas que usa VentaResponse.from_orm_with_calculation (+ usuario y NC).
+# Las consultas de listado devuelven Rows con solo estas columnas en vez de
+# entidades VentaBackend completas (~50 columnas, en el identity map).
+_COLUMNAS_RESPUESTA = (
+    VentaBackend.id,
+    VentaBackend.ruc,
+    VentaBackend.razon_social,
+    VentaBackend.periodo,
+    VentaBackend.car_sunat,
+    VentaBackend.fecha_emision,
+    VentaBackend.tipo_cp_doc,
+    VentaBackend.serie_cdp,
+    VentaBackend.nro_cp_inicial,
+    VentaBackend.nro_doc_identidad,
+    VentaBackend.apellidos_nombres_razon_social,
+    VentaBackend.total_cp,
+    VentaBackend.moneda,
+    VentaBackend.tipo_cambio,
+    VentaBackend.estado1,
+    VentaBackend.estado2,
+    VentaBackend.nota_credito_monto,
+    VentaBackend.monto_neto,
+    VentaBackend.usuario_nombre,
+    VentaBackend.usuario_email,
+)
+
+
 class VentaBackendRepository(BaseRepository[VentaBackend]):
     """
     Repositorio optimizado que usa la vista materializada ventas_backend.
@@ -39,7 +101,7 @@ class VentaBackendRepository(BaseRepository[VentaBackend]):
         moneda: Optional[str] = None,
         authorized_rucs: Optional[List[str]] = None,
         usuario_emails: Optional[List[str]] = None,
-    ) -> Tuple[List[Tuple[VentaBackend, Optional[str], Optional[str]]], int]:
+    ) -> Tuple[List[Row], int]:
         """
         Query optimizado usando vista materializada.
 
@@ -57,16 +119,322 @@ class VentaBackendRepository(BaseRepository[VentaBackend]):
             usuario_emails: Filtrar por emails de usuarios asignados
 
         Returns:
-            Tuple de (lista de tuplas (venta, usuario_nombre, usuario_email), total_count)
+            Tuple de (lista de Rows con _COLUMNAS_RESPUESTA, total_count)
         """
 
-        query = self.db.query(
-            VentaBackend,
-            VentaBackend.usuario_nombre,
-            VentaBackend.usuario_email
-        ).filter(VentaBackend.tipo_cp_doc == "1")
+        query = self._query_respuesta()
+
+        query = self._aplicar_filtros(
+            query,
+            ruc=ruc,
+            rucs_empresa=rucs_empresa,
+            periodo=periodo,
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+            moneda=moneda,
+            authorized_rucs=authorized_rucs,
+            usuario_emails=usuario_emails,
+        )
 
-        # Aplicar filtros
+        # Contar total
+        total = query.count()
+
+        # Ordenamiento
+        query = query.order_by(*self._orden(sort_by))
+
+        # Paginación
+        offset = (page - 1) * page_size
+        items = query.limit(page_size).offset(offset).all()
+
+        return items, total
+
+    def get_ventas_pagina(
+        self,
+        page: int = 1,
+        page_size: int = 20,
+        ruc: Optional[str] = None,
+        rucs_empresa: Optional[List[str]] = None,
+        periodo: Optional[str] = None,
+        fecha_desde: Optional[date] = None,
+        fecha_hasta: Optional[date] = None,
+        sort_by: str = "fecha",
+        moneda: Optional[str] = None,
+        authorized_rucs: Optional[List[str]] = None,
+        usuario_emails: Optional[List[str]] = None,
+    ) -> Tuple[List[Row], bool]:
+        """
+        Igual que get_ventas_paginadas pero SIN contar el conjunto filtrado:
+        pide una fila extra para saber si hay página siguiente. El total se
+        resuelve aparte (en /api/ventas, count_cache.resolve_total_async).
+
+        Returns:
+            Tuple de (lista de Rows con _COLUMNAS_RESPUESTA, hay_mas)
+        """
+        query = self._query_respuesta()
+
+        query = self._aplicar_filtros(
+            query,
+            ruc=ruc,
+            rucs_empresa=rucs_empresa,
+            periodo=periodo,
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+            moneda=moneda,
+            authorized_rucs=authorized_rucs,
+            usuario_emails=usuario_emails,
+        )
+
+        query = query.order_by(*self._orden(sort_by))
+
+        offset = (page - 1) * page_size
+        rows = query.limit(page_size + 1).offset(offset).all()
+
+        return rows[:page_size], len(rows) > page_size
+
+    def get_ventas_keyset(
+        self,
+        cursor: Optional[str] = None,
+        page_size: int = 20,
+        ruc: Optional[str] = None,
+        rucs_empresa: Optional[List[str]] = None,
+        periodo: Optional[str] = None,
+        fecha_desde: Optional[date] = None,
+        fecha_hasta: Optional[date] = None,
+        sort_by: str = "fecha",
+        moneda: Optional[str] = None,
+        authorized_rucs: Optional[List[str]] = None,
+        usuario_emails: Optional[List[str]] = None,
+    ) -> Tuple[List[Row], Optional[str]]:
+        """
+        Paginación por cursor (keyset / seek): en lugar de OFFSET continúa desde
+        la última fila de la página anterior, así cada página es un recorrido de
+        rango sobre idx_ventas_backend_tipo_fecha_id / idx_ventas_backend_tipo_monto_id
+        sin importar qué tan profunda sea.
+
+        Args:
+            cursor: Cursor opaco devuelto como next_cursor (None = primera página)
+            (resto de filtros iguales a get_ventas_paginadas)
+
+        Returns:
+            Tuple de (lista de Rows con _COLUMNAS_RESPUESTA, next_cursor)
+            next_cursor es None cuando no hay más páginas
+
+        Raises:
+            ValueError: Si el cursor es inválido o corresponde a otro ordenamiento
+        """
+        sort_by = "monto" if sort_by == "monto" else "fecha"
+
+        query = self._query_respuesta()
+
+        query = self._aplicar_filtros(
+            query,
+            ruc=ruc,
+            rucs_empresa=rucs_empresa,
+            periodo=periodo,
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+            moneda=moneda,
+            authorized_rucs=authorized_rucs,
+            usuario_emails=usuario_emails,
+        )
+
+        if cursor:
+            query = self._filtro_cursor(query, cursor, sort_by)
+
+        query = query.order_by(*self._orden(sort_by))
+
+        # Se pide una fila extra para saber si existe una página siguiente
+        rows = query.limit(page_size + 1).all()
+        return self._pagina_keyset(rows, page_size, sort_by)
+
+    def iter_ventas(
+        self,
+        ruc: Optional[str] = None,
+        rucs_empresa: Optional[List[str]] = None,
+        periodo: Optional[str] = None,
+        fecha_desde: Optional[date] = None,
+        fecha_hasta: Optional[date] = None,
+        sort_by: str = "fecha",
+        moneda: Optional[str] = None,
+        authorized_rucs: Optional[List[str]] = None,
+        usuario_emails: Optional[List[str]] = None,
+        chunk_size: int = 2000,
+    ) -> Iterator[Row]:
+        """
+        Recorre todas las facturas filtradas sin cargarlas en memoria: la
+        consulta usa un cursor del lado del servidor (yield_per) y trae
+        `chunk_size` filas por vez. Para exportaciones.
+
+        Args:
+            (filtros iguales a get_ventas_paginadas)
+            chunk_size: Filas por lote leído del cursor
+
+        Yields:
+            Rows con _COLUMNAS_RESPUESTA
+        """
+        if authorized_rucs is not None and len(authorized_rucs) == 0:
+            return
+
+        query = self._query_respuesta()
+        query = self._aplicar_filtros(
+            query,
+            ruc=ruc,
+            rucs_empresa=rucs_empresa,
+            periodo=periodo,
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+            moneda=moneda,
+            authorized_rucs=authorized_rucs,
+            usuario_emails=usuario_emails,
+        )
+        query = query.order_by(*self._orden(sort_by))
+
+        yield from contar_filas(query.yield_per(chunk_size))
+
+    def get_ventas_count(
+        self,
+        ruc: Optional[str] = None,
+        rucs_empresa: Optional[List[str]] = None,
+        periodo: Optional[str] = None,
+        fecha_desde: Optional[date] = None,
+        fecha_hasta: Optional[date] = None,
+        moneda: Optional[str] = None,
+        authorized_rucs: Optional[List[str]] = None,
+        usuario_emails: Optional[List[str]] = None,
+    ) -> int:
+        """
+        Cuenta las facturas que devolvería get_ventas_paginadas con los mismos filtros.
+
+        Returns:
+            int: Total de facturas
+        """
+        query = self.db.query(func.count(VentaBackend.id)).filter(
+            VentaBackend.tipo_cp_doc == "1"
+        )
+        query = self._aplicar_filtros(
+            query,
+            ruc=ruc,
+            rucs_empresa=rucs_empresa,
+            periodo=periodo,
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+            moneda=moneda,
+            authorized_rucs=authorized_rucs,
+            usuario_emails=usuario_emails,
+        )
+        return query.scalar() or 0
+
+    def estimate_ventas_count(
+        self,
+        ruc: Optional[str] = None,
+        rucs_empresa: Optional[List[str]] = None,
+        periodo: Optional[str] = None,
+        fecha_desde: Optional[date] = None,
+        fecha_hasta: Optional[date] = None,
+        moneda: Optional[str] = None,
+        authorized_rucs: Optional[List[str]] = None,
+        usuario_emails: Optional[List[str]] = None,
+    ) -> int:
+        """
+        Estimación del planner de PostgreSQL para el conteo de get_ventas_count.
+
+        Solo ejecuta EXPLAIN (no recorre la vista): cuesta lo mismo con 100 filas
+        que con 1.7M. La precisión depende de las estadísticas de ANALYZE.
+
+        Returns:
+            int: Filas estimadas ("Plan Rows" del nodo raíz)
+        """
+        query = self.db.query(VentaBackend.id).filter(VentaBackend.tipo_cp_doc == "1")
+        query = self._aplicar_filtros(
+            query,
+            ruc=ruc,
+            rucs_empresa=rucs_empresa,
+            periodo=periodo,
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+            moneda=moneda,
+            authorized_rucs=authorized_rucs,
+            usuario_emails=usuario_emails,
+        )
+
+        sql, params = self._sql_explain(query.statement, self.db.get_bind().dialect)
+        plan = self.db.connection().exec_driver_sql(sql, params).scalar()
+        return self._filas_estimadas(plan)
+
+    @staticmethod
+    def _sql_explain(statement, dialect) -> Tuple[str, Any]:
+        """EXPLAIN (FORMAT JSON) de `statement` con los parámetros en el formato del driver"""
+        # Los IN se expanden al compilar
+        compiled = statement.compile(
+            dialect=dialect,
+            compile_kwargs={"render_postcompile": True},
+        )
+        if compiled.positiontup is None:
+            # Driver con parámetros con nombre (psycopg2)
+            return f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+        params = tuple(compiled.params[nombre] for nombre in compiled.positiontup)
+        return f"EXPLAIN (FORMAT JSON) {compiled}", params
+
+    @staticmethod
+    def _filas_estimadas(plan) -> int:
+        """Filas estimadas ("Plan Rows") del nodo raíz de un EXPLAIN (FORMAT JSON)"""
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    def _query_respuesta(self):
+        """Facturas (tipo 1) proyectadas a las columnas de VentaResponse"""
+        return self.db.query(*_COLUMNAS_RESPUESTA).filter(VentaBackend.tipo_cp_doc == "1")
+
+    @staticmethod
+    def _filtro_cursor(query, cursor: str, sort_by: str):
+        """
+        Filas posteriores a la posición del cursor en el orden de _orden(sort_by).
+
+        Raises:
+            ValueError: Si el cursor es inválido o corresponde a otro ordenamiento
+        """
+        columna = VentaBackend.monto_neto if sort_by == "monto" else VentaBackend.fecha_emision
+        ultimo_valor, ultimo_id = _decode_cursor(cursor, sort_by)
+        # ORDER BY col DESC deja los NULL primero (comportamiento de PostgreSQL)
+        if ultimo_valor is None:
+            return query.filter(
+                or_(
+                    and_(columna.is_(None), VentaBackend.id < ultimo_id),
+                    columna.isnot(None),
+                )
+            )
+        return query.filter(tuple_(columna, VentaBackend.id) < (ultimo_valor, ultimo_id))
+
+    @staticmethod
+    def _pagina_keyset(rows: List[Row], page_size: int, sort_by: str) -> Tuple[List[Row], Optional[str]]:
+        """Recorta la fila extra pedida y arma next_cursor desde la última fila"""
+        items = rows[:page_size]
+
+        next_cursor = None
+        if len(rows) > page_size:
+            ultima = items[-1]
+            valor = ultima.monto_neto if sort_by == "monto" else ultima.fecha_emision
+            next_cursor = _encode_cursor(sort_by, valor, ultima.id)
+
+        return items, next_cursor
+
+    @staticmethod
+    def _aplicar_filtros(
+        query,
+        ruc: Optional[str] = None,
+        rucs_empresa: Optional[List[str]] = None,
+        periodo: Optional[str] = None,
+        fecha_desde: Optional[date] = None,
+        fecha_hasta: Optional[date] = None,
+        moneda: Optional[str] = None,
+        authorized_rucs: Optional[List[str]] = None,
+        usuario_emails: Optional[List[str]] = None,
+    ):
+        """
+        Aplica los filtros comunes de /api/ventas sobre la vista materializada.
+        Sirve igual para un Query del ORM y para un select() (versión async).
+        """
         if authorized_rucs is not None:
             query = query.filter(VentaBackend.ruc.in_(authorized_rucs))
 
@@ -97,24 +465,18 @@ class VentaBackendRepository(BaseRepository[VentaBackend]):
             else:
                 query = query.filter(VentaBackend.usuario_email.in_(usuario_emails))
 
-        # Contar total
-        total = query.count()
+        return query
 
-        # Ordenamiento
+    @staticmethod
+    def _orden(sort_by: str) -> tuple:
+        """
+        Ordenamiento estable (id como desempate) compartido por la paginación
+        por offset y por cursor.
+        """
         if sort_by == "monto":
-            query = query.order_by(desc(VentaBackend.monto_neto))
-        else:
-            # Por defecto: fecha descendente
-            query = query.order_by(
-                desc(VentaBackend.fecha_emision), desc(VentaBackend.id)
-            )
-
-        # Paginación
-        offset = (page - 1) * page_size
-        items = query.limit(page_size).offset(offset).all()
-
-        # Devolvemos 0 como total, ya no lo calculamos aquí
-        return items, total
+            return desc(VentaBackend.monto_neto), desc(VentaBackend.id)
+        # Por defecto: fecha descendente
+        return desc(VentaBackend.fecha_emision), desc(VentaBackend.id)
 
     def get_empresas_unicas_por_periodo(
         self,
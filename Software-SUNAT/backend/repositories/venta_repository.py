@@ -1,11 +1,28 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import func, desc, String
+from sqlalchemy.exc import DBAPIError
 from typing import List, Optional, Dict, Any, Tuple
 from datetime import date
+import logging
 
-from models import VentaElectronica, Enrolado, Usuario
+from models import EmpresaPeriodo, VentaElectronica, Enrolado, Usuario
+from instrumentacion import contar_filas
 from repositories.base_repository import BaseRepository
 
+logger = logging.getLogger(__name__)
+
+# SQLSTATE de Postgres para "relation does not exist"
+_UNDEFINED_TABLE = "42P01"
+
+
+def _es_tabla_inexistente(error: DBAPIError) -> bool:
+    """True si el error del driver es undefined_table (psycopg2, pg8000 o asyncpg)"""
+    orig = error.orig
+    codigo = getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)
+    if codigo is None and orig is not None and orig.args and isinstance(orig.args[0], dict):
+        codigo = orig.args[0].get("C")  # pg8000
+    return codigo == _UNDEFINED_TABLE
+
 
 class VentaRepository(BaseRepository[VentaElectronica]):
     """Repositorio especializado para consultas de ventas"""
@@ -131,33 +148,22 @@ class VentaRepository(BaseRepository[VentaElectronica]):
         if usuario_emails and len(usuario_emails) > 0:
             from sqlalchemy import or_
 
-            print(f"🔍 [BACKEND] Filtrando por usuario_emails: {usuario_emails}")
-
             # Separar "UNASSIGNED" de emails normales
             has_unassigned = "UNASSIGNED" in usuario_emails
             normal_emails = [email for email in usuario_emails if email != "UNASSIGNED"]
 
-            print(f"🔍 [BACKEND] has_unassigned={has_unassigned}, normal_emails={normal_emails}")
-
             # Construir condiciones
             conditions = []
             if has_unassigned:
                 # Agregar condición para facturas sin usuario asignado
                 conditions.append(Usuario.email.is_(None))
-                print("✅ [BACKEND] Agregada condición: Usuario.email IS NULL")
             if normal_emails:
                 # Agregar condición para emails específicos
                 conditions.append(Usuario.email.in_(normal_emails))
-                print(f"✅ [BACKEND] Agregada condición: Usuario.email IN {normal_emails}")
 
             # Aplicar filtro con OR entre condiciones
             if conditions:
-                print("🎯 [BACKEND] Aplicando {len(conditions)} condición(es) de usuario")
                 query = query.filter(or_(*conditions))
-            else:
-                print("⚠️ [BACKEND] NO se construyeron condiciones de filtro")
-        else:
-            print("⚠️ [BACKEND] NO se recibieron usuario_emails o está vacío")
 
         # Aplicar ordenamiento según el parámetro
         if sort_by == "monto":
@@ -167,24 +173,15 @@ class VentaRepository(BaseRepository[VentaElectronica]):
 
         # Contar total
         total = query.count()
-        print(f"📊 [BACKEND] Total de facturas encontradas (después de filtros): {total}")
 
         # Aplicar paginación
         offset = (page - 1) * page_size
         results = query.offset(offset).limit(page_size).all()
-        print(f"📊 [BACKEND] Facturas en esta página: {len(results)}")
 
         # Retornar tuplas (venta, usuario_nombre, usuario_email, nota_credito_monto)
         items = [(venta, usuario_nombre, usuario_email, nota_credito_monto)
                  for venta, usuario_nombre, usuario_email, nota_credito_monto in results]
 
-        # DEBUG: Mostrar emails y notas de crédito de las primeras 3 facturas
-        if len(items) > 0:
-            sample = items[:3]
-            print("🔍 [BACKEND] Muestra de emails y notas de crédito en resultados:")
-            for venta, usuario_nombre, usuario_email, nc_monto in sample:
-                print(f"  - {venta.ruc}: usuario_email={usuario_email}, usuario_nombre={usuario_nombre}, nc_monto={nc_monto}")
-
         return items, total
 
     def get_ventas_con_enrolados(
@@ -309,49 +306,60 @@ class VentaRepository(BaseRepository[VentaElectronica]):
         Versión optimizada que usa una sola query con agrupación
         Agrupa ventas por enrolado de forma eficiente
 
+        Trae las facturas de todos los enrolados en UNA query ordenada por
+        (ruc, fecha|monto), proyectando solo las columnas de FacturaParaCRM, y
+        las agrupa en Python mientras llegan (yield_per).
+
         Args:
             sort_by: Campo por el cual ordenar. Opciones: "fecha" (por defecto), "monto"
             authorized_rucs: Lista de RUCs autorizados para el usuario (control de acceso)
         """
 
-        # Query principal con joinedload para evitar N+1
-        query = self.db.query(Enrolado)
+        enrolados_query = self.db.query(Enrolado.id, Enrolado.ruc)
 
         # CONTROL DE ACCESO: Filtrar enrolados por RUCs autorizados
         if authorized_rucs is not None:
             if len(authorized_rucs) == 0:
                 # Usuario sin RUCs autorizados, retornar lista vacía
                 return []
-            query = query.filter(Enrolado.ruc.in_(authorized_rucs))
+            enrolados_query = enrolados_query.filter(Enrolado.ruc.in_(authorized_rucs))
+
+        enrolados = enrolados_query.order_by(Enrolado.id).all()
+        if not enrolados:
+            return []
+
+        ventas_query = self.db.query(
+            VentaElectronica.id,
+            VentaElectronica.ruc,
+            VentaElectronica.serie_cdp,
+            VentaElectronica.nro_cp_inicial,
+            VentaElectronica.apellidos_nombres_razon_social,
+            VentaElectronica.total_cp,
+            VentaElectronica.fecha_emision,
+            VentaElectronica.nro_doc_identidad,
+            VentaElectronica.tipo_cp_doc,
+            VentaElectronica.moneda,
+            VentaElectronica.car_sunat,
+        ).filter(
+            VentaElectronica.ruc.in_([enrolado.ruc for enrolado in enrolados])
+        )
+
+        if periodo:
+            ventas_query = ventas_query.filter(VentaElectronica.periodo == periodo)
 
-        enrolados = query.all()
-        result = []
+        ventas_query = self._aplicar_filtros_base(ventas_query)
 
-        for enrolado in enrolados:
-            # Subquery optimizada para ventas del enrolado
-            ventas_query = self.db.query(VentaElectronica).filter(
-                VentaElectronica.ruc == enrolado.ruc
-            )
+        # Aplicar ordenamiento (agrupado por RUC)
+        if sort_by == "monto":
+            orden = desc(VentaElectronica.total_cp)
+        else:  # Por defecto: fecha
+            orden = desc(VentaElectronica.fecha_emision)
+        ventas_query = ventas_query.order_by(VentaElectronica.ruc, orden)
 
-            if periodo:
-                ventas_query = ventas_query.filter(VentaElectronica.periodo == periodo)
-
-            ventas_query = self._aplicar_filtros_base(ventas_query)
-
-            # Aplicar ordenamiento
-            if sort_by == "monto":
-                ventas = ventas_query.order_by(
-                    desc(VentaElectronica.total_cp)
-                ).all()
-            else:  # Por defecto: fecha
-                ventas = ventas_query.order_by(
-                    desc(VentaElectronica.fecha_emision)
-                ).all()
-
-            # Transformar al formato esperado
-            facturas = []
-            for venta in ventas:
-                factura = {
+        facturas_por_ruc: Dict[str, List[Dict[str, Any]]] = {}
+        for venta in contar_filas(ventas_query.yield_per(1000)):
+            facturas_por_ruc.setdefault(venta.ruc, []).append(
+                {
                     "id": f"{venta.serie_cdp}-{venta.nro_cp_inicial}"
                     if venta.serie_cdp and venta.nro_cp_inicial
                     else f"V-{venta.id}",
@@ -370,17 +378,18 @@ class VentaRepository(BaseRepository[VentaElectronica]):
                     "moneda": venta.moneda,
                     "car_sunat": venta.car_sunat,
                 }
-                facturas.append(factura)
+            )
 
-            cliente = {
+        # Los enrolados sin facturas en el periodo también se devuelven
+        return [
+            {
                 "id": enrolado.id,
                 "name": enrolado.ruc,
                 "ruc": enrolado.ruc,
-                "availableInvoices": facturas,
+                "availableInvoices": facturas_por_ruc.get(enrolado.ruc, []),
             }
-            result.append(cliente)
-
-        return result
+            for enrolado in enrolados
+        ]
 
     def get_empresas_unicas_por_periodo(
         self,
@@ -392,31 +401,68 @@ class VentaRepository(BaseRepository[VentaElectronica]):
         Obtiene lista de empresas únicas (RUC y razón social) de todos los períodos o uno específico
         Usado para llenar el selector de clientes en el frontend
 
+        Lee la dimensión empresas_periodos (una fila por RUC y periodo). Si la
+        tabla no existe (11_empresas_periodos.sql sin aplicar) agrupa ventas_sire.
+
         Args:
             periodo: Periodo a consultar (YYYYMM). Si es None, retorna todas las empresas de todos los períodos
             authorized_rucs: Lista de RUCs autorizados para el usuario (control de acceso)
             usuario_emails: Filtrar empresas por usuarios asignados (opcional). Acepta "UNASSIGNED" para empresas sin usuario.
         """
+        # CONTROL DE ACCESO: Usuario sin RUCs autorizados, retornar lista vacía
+        if authorized_rucs is not None and len(authorized_rucs) == 0:
+            return []
+
+        try:
+            empresas = self._query_empresas(
+                EmpresaPeriodo, periodo, authorized_rucs, usuario_emails
+            ).all()
+        except DBAPIError as e:
+            if not _es_tabla_inexistente(e):
+                raise
+            self.db.rollback()
+            logger.warning(f"empresas_periodos no disponible, agrupando ventas_sire: {e.orig}")
+            empresas = self._query_empresas(
+                VentaElectronica, periodo, authorized_rucs, usuario_emails
+            ).all()
+
+        return [
+            {"ruc": ruc, "razon_social": razon_social or ruc}
+            for ruc, razon_social in empresas
+        ]
+
+    def _query_empresas(
+        self,
+        fuente,
+        periodo: Optional[str],
+        authorized_rucs: Optional[List[str]],
+        usuario_emails: Optional[List[str]],
+    ):
+        """
+        GROUP BY ruc con MAX(razon_social) sobre `fuente` (EmpresaPeriodo o
+        VentaElectronica: ambas tienen ruc, periodo y razon_social).
+        """
         from sqlalchemy import func as sql_func, or_
 
+        query = self.db.query(
+            fuente.ruc,
+            sql_func.max(fuente.razon_social).label('razon_social')
+        ).filter(
+            fuente.razon_social.isnot(None),
+            fuente.razon_social != '',
+            fuente.razon_social != '-'
+        )
+
         # Si se filtran usuarios, hacer JOIN con Enrolado y Usuario
         if usuario_emails and len(usuario_emails) > 0:
             # Separar "UNASSIGNED" de emails normales
             has_unassigned = "UNASSIGNED" in usuario_emails
             normal_emails = [email for email in usuario_emails if email != "UNASSIGNED"]
 
-            # Query con JOINs para filtrar por usuario
-            query = self.db.query(
-                VentaElectronica.ruc,
-                sql_func.max(VentaElectronica.razon_social).label('razon_social')
-            ).outerjoin(
-                Enrolado, VentaElectronica.ruc == Enrolado.ruc
+            query = query.outerjoin(
+                Enrolado, fuente.ruc == Enrolado.ruc
             ).outerjoin(
                 Usuario, Enrolado.email == Usuario.email
-            ).filter(
-                VentaElectronica.razon_social.isnot(None),
-                VentaElectronica.razon_social != '',
-                VentaElectronica.razon_social != '-'
             )
 
             # Construir condiciones de filtro de usuario
@@ -428,34 +474,14 @@ class VentaRepository(BaseRepository[VentaElectronica]):
 
             if conditions:
                 query = query.filter(or_(*conditions))
-        else:
-            # Query simplificada sin JOIN (comportamiento original)
-            query = self.db.query(
-                VentaElectronica.ruc,
-                sql_func.max(VentaElectronica.razon_social).label('razon_social')
-            ).filter(
-                VentaElectronica.razon_social.isnot(None),
-                VentaElectronica.razon_social != '',
-                VentaElectronica.razon_social != '-'
-            )
 
         # Filtrar por período solo si se especifica
         if periodo:
-            query = query.filter(VentaElectronica.periodo == periodo)
+            query = query.filter(fuente.periodo == periodo)
 
         # CONTROL DE ACCESO: Filtrar por RUCs autorizados
         if authorized_rucs is not None:
-            if len(authorized_rucs) == 0:
-                # Usuario sin RUCs autorizados, retornar lista vacía
-                return []
-            query = query.filter(VentaElectronica.ruc.in_(authorized_rucs))
+            query = query.filter(fuente.ruc.in_(authorized_rucs))
 
         # Agrupar por RUC
-        query = query.group_by(VentaElectronica.ruc)
-
-        empresas = query.all()
-
-        return [
-            {"ruc": ruc, "razon_social": razon_social or ruc}
-            for ruc, razon_social in empresas
-        ]
+        return query.group_by(fuente.ruc)
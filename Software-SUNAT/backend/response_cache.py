@@ -0,0 +1,351 @@
+"""
+Caché de respuestas con ETag / 304 para los endpoints del dashboard.
+
+El frontend vuelve a pedir /api/metricas/resumen, /api/ventas,
+/api/ventas/empresas y /api/ventas/ultima-actualizacion en cada cambio de
+filtro, pero los datos solo cambian con una carga (refresh de ventas_backend)
+o un cambio de estado. ResponseCacheMiddleware:
+
+- Guarda la respuesta por endpoint + query normalizada + RUCs autorizados del
+  usuario (dos usuarios con los mismos RUCs comparten entrada).
+- El ETag sale de una versión de datos que se incrementa con cada refresh de
+  ventas_backend y cada cambio de estado (bump_version). Una entrada guardada
+  con otra versión no se sirve.
+- Con If-None-Match igual al ETag vigente y la entrada todavía en caché
+  responde 304 sin ejecutar el endpoint; vencida la entrada se ejecuta y
+  responde 200. Las respuestas llevan `Cache-Control: private, no-cache` para
+  que el navegador revalide siempre.
+- Respuestas distintas de 200 o marcadas `Cache-Control: no-store` por el
+  endpoint (p. ej. /api/ventas con total estimado) no se cachean ni llevan ETag.
+- Con réplica de lectura (replica_routing): el usuario dentro de la guardia de
+  lecturas propias lee del primario y pasa sin caché (ni lee ni guarda, así no
+  recibe la entrada de otro usuario armada desde la réplica). Durante
+  DB_REPLICA_LECTURA_PROPIA_S segundos después de ver una versión nueva
+  tampoco se guarda ni se emite ETag: la réplica puede no tener aún el cambio
+  que provocó el bump y la entrada quedaría con la versión nueva y datos viejos.
+
+Backend: LRU en memoria por instancia (por defecto) o Redis si se define
+RESPONSE_CACHE_REDIS_URL; con Redis la versión y las entradas se comparten
+entre instancias y procesos (la ingesta también incrementa la versión). En
+memoria, un cambio hecho en otra instancia se ve recién al vencer
+RESPONSE_CACHE_TTL.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+from typing import Iterable, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+RESPONSE_CACHE_MAXSIZE = int(os.getenv("RESPONSE_CACHE_MAXSIZE", "512"))
+# Respuestas más grandes no se guardan (llevan ETag pero nunca reciben 304)
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(2 * 1024 * 1024)))
+RESPONSE_CACHE_REDIS_URL = os.getenv("RESPONSE_CACHE_REDIS_URL")
+
+RUTAS_CACHEADAS = (
+    "/api/metricas/resumen",
+    "/api/ventas",
+    "/api/ventas/empresas",
+    "/api/ventas/ultima-actualizacion",
+)
+
+_CACHE_CONTROL = "private, no-cache"
+
+# (status, content-type, body)
+Entrada = Tuple[int, str, bytes]
+
+
+class MemoriaBackend:
+    """Versión y entradas en memoria de la instancia (LRU con TTL)"""
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_MAXSIZE, ttl: float = RESPONSE_CACHE_TTL):
+        self._entradas = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Distinta en cada arranque: un ETag de antes de reiniciar no vale
+        self._version = int(time.time() * 1000)
+        self._lock = threading.Lock()
+
+    async def version(self) -> int:
+        return self._version
+
+    def bump_version(self) -> int:
+        with self._lock:
+            self._version += 1
+            # Las entradas de la versión anterior ya no se sirven
+            self._entradas.clear()
+            return self._version
+
+    async def get(self, version: int, clave: str) -> Optional[Entrada]:
+        return self._entradas.get((version, clave))
+
+    async def set(self, version: int, clave: str, entrada: Entrada) -> None:
+        self._entradas.set((version, clave), entrada)
+
+    def stats(self) -> dict:
+        return {"backend": "memoria", "version": self._version, **self._entradas.stats()}
+
+
+class RedisBackend:
+    """
+    Versión (INCR) y entradas (SETEX) en Redis o compatible (Memorystore,
+    Valkey). El paquete redis se importa recién al crear el backend.
+    """
+
+    def __init__(self, url: str, ttl: float = RESPONSE_CACHE_TTL, prefijo: str = "sunat:respuestas"):
+        import redis
+        import redis.asyncio
+
+        self.ttl = max(int(ttl), 1)
+        self.prefijo = prefijo
+        self._clave_version = f"{prefijo}:version"
+        self._sync = redis.Redis.from_url(url)
+        self._async = redis.asyncio.from_url(url)
+
+    async def version(self) -> int:
+        return int(await self._async.get(self._clave_version) or 0)
+
+    def bump_version(self) -> int:
+        return int(self._sync.incr(self._clave_version))
+
+    async def get(self, version: int, clave: str) -> Optional[Entrada]:
+        valor = await self._async.get(f"{self.prefijo}:{version}:{clave}")
+        return pickle.loads(valor) if valor is not None else None
+
+    async def set(self, version: int, clave: str, entrada: Entrada) -> None:
+        await self._async.setex(f"{self.prefijo}:{version}:{clave}", self.ttl, pickle.dumps(entrada))
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "version": int(self._sync.get(self._clave_version) or 0)}
+
+
+def _crear_backend():
+    if RESPONSE_CACHE_REDIS_URL:
+        try:
+            return RedisBackend(RESPONSE_CACHE_REDIS_URL)
+        except Exception as e:
+            logger.error(f"No se pudo crear el backend Redis, usando memoria: {e}")
+    return MemoriaBackend()
+
+
+backend = _crear_backend()
+
+_contadores = {
+    "hits": 0, "misses": 0, "not_modified": 0, "no_cacheables": 0, "lectura_propia": 0, "errores": 0,
+}
+
+
+def bump_version() -> None:
+    """
+    Invalida todas las respuestas cacheadas (nueva versión de datos).
+    Llamar después de un refresh de ventas_backend o un cambio de estado.
+    """
+    try:
+        backend.bump_version()
+    except Exception as e:
+        _contadores["errores"] += 1
+        logger.warning(f"No se pudo incrementar la versión de la caché de respuestas: {e}")
+
+
+def clave_respuesta(ruta: str, query_string: bytes, authorized_rucs: Optional[list]) -> str:
+    """
+    Firma de la respuesta: ruta + parámetros ordenados (los repetidos como
+    rucs_empresa se ordenan también) + RUCs autorizados (None = admin).
+    """
+    parametros = sorted(parse_qsl(query_string.decode("latin-1"), keep_blank_values=True))
+    rucs = "*" if authorized_rucs is None else ",".join(sorted(set(authorized_rucs)))
+    firma = f"{ruta}?{urlencode(parametros)}|{rucs}"
+    return hashlib.sha1(firma.encode("utf-8")).hexdigest()[:24]
+
+
+def _etag(version: int, clave: str) -> str:
+    return f'W/"{version}-{clave}"'
+
+
+def _coincide(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidatos = [c.strip() for c in if_none_match.split(",")]
+    # Comparación débil: W/"x" y "x" son equivalentes
+    return "*" in candidatos or etag in candidatos or etag[2:] in candidatos
+
+
+class _VentanaReplica:
+    """
+    Momento en que esta instancia vio por primera vez cada versión. Con Redis
+    el bump puede venir de otra instancia o de la ingesta: verlo más tarde solo
+    alarga la ventana, nunca la acorta.
+    """
+
+    def __init__(self):
+        self._version: Optional[int] = None
+        self._desde = 0.0
+
+    def guardado_permitido(self, version: int, ventana_s: float) -> bool:
+        ahora = time.monotonic()
+        if version != self._version:
+            self._version, self._desde = version, ahora
+        return ahora - self._desde >= ventana_s
+
+
+class ResponseCacheMiddleware:
+    """Middleware ASGI: ETag / 304 y caché de respuestas para `rutas`"""
+
+    def __init__(self, app, rutas: Iterable[str] = RUTAS_CACHEADAS, contexto=None):
+        """
+        Args:
+            app: Aplicación ASGI
+            rutas: Rutas exactas a cachear (solo GET)
+            contexto: async (authorization) -> contexto de usuario o None.
+                      Por defecto auth.get_optional_user_context (usa la caché
+                      de tokens, así el endpoint no vuelve a verificar).
+        """
+        self.app = app
+        self.rutas = frozenset(rutas)
+        if contexto is None:
+            from auth import get_optional_user_context as contexto
+        self.contexto = contexto
+        import replica_routing
+
+        self.routing = replica_routing
+        self.ventana = _VentanaReplica()
+
+    async def __call__(self, scope, receive, send):
+        if (
+            not RESPONSE_CACHE_ENABLED
+            or scope["type"] != "http"
+            or scope["method"] != "GET"
+            or scope["path"] not in self.rutas
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        try:
+            contexto = await self.contexto(headers.get("authorization"))
+            version = await backend.version()
+        except Exception as e:
+            _contadores["errores"] += 1
+            logger.warning(f"Caché de respuestas no disponible: {e}")
+            await self.app(scope, receive, send)
+            return
+
+        # Sin usuario el endpoint responde 401: no hay nada que cachear
+        if contexto is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Lee del primario: la caché puede tener datos de la réplica anteriores a su escritura
+        if not self.routing.leer_de_replica(contexto["email"]):
+            _contadores["lectura_propia"] += 1
+            await self.app(scope, receive, send)
+            return
+
+        clave = clave_respuesta(scope["path"], scope["query_string"], contexto["authorized_rucs"])
+        etag = _etag(version, clave)
+
+        try:
+            entrada = await backend.get(version, clave)
+        except Exception as e:
+            _contadores["errores"] += 1
+            logger.warning(f"Error leyendo la caché de respuestas: {e}")
+            entrada = None
+
+        # 304 solo con la entrada viva: así RESPONSE_CACHE_TTL también acota las
+        # revalidaciones (un bump de otro proceso no llega al backend en memoria)
+        if entrada is not None and _coincide(headers.get("if-none-match"), etag):
+            _contadores["not_modified"] += 1
+            await send({
+                "type": "http.response.start",
+                "status": 304,
+                "headers": [
+                    (b"etag", etag.encode()),
+                    (b"cache-control", _CACHE_CONTROL.encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if entrada is not None:
+            _contadores["hits"] += 1
+            status, media_type, body = entrada
+            await send({
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", media_type.encode()),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"etag", etag.encode()),
+                    (b"cache-control", _CACHE_CONTROL.encode()),
+                    (b"x-cache", b"HIT"),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        _contadores["misses"] += 1
+        guardar = self.routing.engine_replica is None or self.ventana.guardado_permitido(
+            version, self.routing.DB_REPLICA_LECTURA_PROPIA_S
+        )
+        await self._ejecutar_y_guardar(scope, receive, send, version, clave, etag, guardar)
+
+    async def _ejecutar_y_guardar(
+        self, scope, receive, send, version: int, clave: str, etag: str, guardar: bool = True
+    ):
+        estado = {"cacheable": False, "status": 200, "media_type": "", "partes": [], "bytes": 0}
+
+        async def send_capturando(mensaje):
+            if mensaje["type"] == "http.response.start":
+                respuesta = MutableHeaders(scope=mensaje)
+                cacheable = (
+                    guardar
+                    and mensaje["status"] == 200
+                    and "no-store" not in respuesta.get("cache-control", "")
+                )
+                estado["cacheable"] = cacheable
+                estado["status"] = mensaje["status"]
+                estado["media_type"] = respuesta.get("content-type", "application/json")
+                if cacheable:
+                    respuesta["etag"] = etag
+                    respuesta["cache-control"] = _CACHE_CONTROL
+                    respuesta["x-cache"] = "MISS"
+                else:
+                    _contadores["no_cacheables"] += 1
+
+            elif mensaje["type"] == "http.response.body" and estado["cacheable"]:
+                cuerpo = mensaje.get("body", b"")
+                estado["bytes"] += len(cuerpo)
+                if estado["bytes"] > RESPONSE_CACHE_MAX_BYTES:
+                    estado["cacheable"] = False
+                    estado["partes"] = []
+                else:
+                    estado["partes"].append(cuerpo)
+                    if not mensaje.get("more_body", False):
+                        entrada = (estado["status"], estado["media_type"], b"".join(estado["partes"]))
+                        try:
+                            await backend.set(version, clave, entrada)
+                        except Exception as e:
+                            _contadores["errores"] += 1
+                            logger.warning(f"Error guardando en la caché de respuestas: {e}")
+
+            await send(mensaje)
+
+        await self.app(scope, receive, send_capturando)
+
+
+def stats() -> dict:
+    """Contadores y estado del backend (para /debug)"""
+    try:
+        info = backend.stats()
+    except Exception as e:
+        info = {"error": str(e)}
+    return {"enabled": RESPONSE_CACHE_ENABLED, **_contadores, **info}
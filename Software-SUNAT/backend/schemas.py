@@ -15,6 +15,32 @@ class PaginationMetadata(BaseModel):
     total_pages: int
     has_next: bool
     has_previous: bool
+    next_cursor: Optional[str] = None  # Solo en paginación por cursor (keyset)
+    total_is_estimate: bool = False  # total_items es una estimación del planner
+
+    @classmethod
+    def create(
+        cls,
+        total: int,
+        page: int,
+        page_size: int,
+        has_next: Optional[bool] = None,
+        has_previous: Optional[bool] = None,
+        next_cursor: Optional[str] = None,
+        total_is_estimate: bool = False,
+    ):
+        """Calcula total_pages y, si no se indican, has_next / has_previous"""
+        total_pages = ceil(total / page_size) if page_size > 0 else 0
+        return cls(
+            page=page,
+            page_size=page_size,
+            total_items=total,
+            total_pages=total_pages,
+            has_next=page < total_pages if has_next is None else has_next,
+            has_previous=page > 1 if has_previous is None else has_previous,
+            next_cursor=next_cursor,
+            total_is_estimate=total_is_estimate,
+        )
 
 class PaginatedResponse(BaseModel, Generic[T]):
     """Schema genérico para respuestas paginadas"""
@@ -22,18 +48,32 @@ class PaginatedResponse(BaseModel, Generic[T]):
     pagination: PaginationMetadata
 
     @classmethod
-    def create(cls, items: List[T], total: int, page: int, page_size: int):
-        """Método helper para crear respuesta paginada"""
-        total_pages = ceil(total / page_size) if page_size > 0 else 0
+    def create(
+        cls,
+        items: List[T],
+        total: int,
+        page: int,
+        page_size: int,
+        has_next: Optional[bool] = None,
+        has_previous: Optional[bool] = None,
+        next_cursor: Optional[str] = None,
+        total_is_estimate: bool = False,
+    ):
+        """Método helper para crear respuesta paginada
+
+        has_next / has_previous se calculan desde page y total salvo que se
+        indiquen explícitamente (paginación por cursor o total estimado).
+        """
         return cls(
             items=items,
-            pagination=PaginationMetadata(
+            pagination=PaginationMetadata.create(
+                total=total,
                 page=page,
                 page_size=page_size,
-                total_items=total,
-                total_pages=total_pages,
-                has_next=page < total_pages,
-                has_previous=page > 1
+                has_next=has_next,
+                has_previous=has_previous,
+                next_cursor=next_cursor,
+                total_is_estimate=total_is_estimate,
             )
         )
 
@@ -69,6 +109,23 @@ class ActualizarEstadoPerdidaRequest(BaseModel):
     """Schema para actualizar estado1 a 'Perdida' y especificar motivo en estado2"""
     estado2: str  # Por Tasa, Por Riesgo, Deudor no califica, Cliente no interesado, Competencia, Otro
 
+class ActualizarEstadoBulkRequest(BaseModel):
+    """Schema para actualizar estado1 (y estado2) de varias facturas a la vez"""
+    ids: List[int]
+    estado1: str  # Sin gestión, Gestionando, Ganada, Perdida
+    estado2: Optional[str] = None  # Motivo de pérdida; solo con estado1 = 'Perdida'
+
+class ResultadoEstadoBulk(BaseModel):
+    """Resultado por factura de la actualización masiva"""
+    id: int
+    status_code: int  # 200 actualizada, 403 no autorizada, 404 no encontrada
+    detail: Optional[str] = None
+
+class ActualizarEstadoBulkResponse(BaseModel):
+    """Schema para respuesta de la actualización masiva de estados"""
+    actualizadas: int
+    resultados: List[ResultadoEstadoBulk]
+
 class VentaResponse(BaseModel):
     """Schema para respuesta de Venta Electrónica"""
     id: int
@@ -107,8 +164,6 @@ class VentaResponse(BaseModel):
             usuario_email: Email del usuario (opcional)
             nota_credito_monto: Monto de la nota de crédito asociada (opcional)
         """
-        import logging
-
         data = {
             "id": venta.id,
             "ruc": venta.ruc,
@@ -135,11 +190,9 @@ class VentaResponse(BaseModel):
         if venta.total_cp and venta.tipo_cambio and venta.tipo_cambio > 0:
             monto_calc = float(venta.total_cp) / float(venta.tipo_cambio)
             data["monto_original"] = monto_calc
-            logging.info(f"✅ Cálculo: {venta.total_cp} / {venta.tipo_cambio} = {monto_calc} ({venta.moneda})")
         else:
             # Si no hay tipo_cambio válido, usar total_cp directamente
             data["monto_original"] = float(venta.total_cp) if venta.total_cp else None
-            logging.warning(f"⚠️ Sin tipo_cambio: total_cp={venta.total_cp}, tipo_cambio={venta.tipo_cambio}")
 
         # Usar valores pre-calculados de la vista materializada si existen
         # La vista usa: total_neto, monto_nota_credito, tiene_nota_credito
@@ -217,6 +270,8 @@ class PeriodoFallidoResponse(BaseModel):
     fecha_fallo: datetime
     motivo: Optional[str] = None
     resuelto: bool
+    intentos: int = 1
+    proximo_intento: Optional[datetime] = None
 
     model_config = ConfigDict(from_attributes=True)
 
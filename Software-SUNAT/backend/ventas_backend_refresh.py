@@ -0,0 +1,300 @@
+"""
+Refresh de ventas_backend y de las tablas derivadas.
+
+refresh_ventas_backend() (ver 05_metricas_diarias_rollup.sql) refresca la vista,
+reconstruye el rollup ventas_metricas_diarias y registra la hora de cada uno en
+mantenimiento_vistas. Desde la aplicación siempre se refresca por aquí para que
+además se invaliden las cachés en memoria que dependen de la vista.
+
+Con 06_ventas_backend_incremental.sql aplicado, ventas_backend es una tabla que
+los triggers mantienen al día y el refresh solo reconstruye el rollup.
+
+Los endpoints no refrescan en línea: piden el refresh a `refresh_scheduler`,
+que agrupa las solicitudes y lo ejecuta en un hilo de fondo.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import count_cache
+import empresas_cache
+import response_cache
+from database import engine
+from engine_factory import sin_statement_timeout
+from instrumentacion import registrar_filas
+
+logger = logging.getLogger(__name__)
+
+# Espera tras la última solicitud antes de refrescar (agrupa clics seguidos)
+REFRESH_DEBOUNCE_SECONDS = float(os.getenv("REFRESH_DEBOUNCE_SECONDS", "5"))
+# Demora máxima desde la primera solicitud pendiente (evita posponer indefinidamente)
+REFRESH_MAX_DELAY_SECONDS = float(os.getenv("REFRESH_MAX_DELAY_SECONDS", "30"))
+
+# Candado entre instancias de Cloud Run: un solo REFRESH a la vez en toda la BD
+_ADVISORY_LOCK_SQL = text("SELECT pg_try_advisory_lock(hashtext('ventas_backend_refresh'))")
+_ADVISORY_UNLOCK_SQL = text("SELECT pg_advisory_unlock(hashtext('ventas_backend_refresh'))")
+
+_ROLLUP_VIGENTE_SQL = text("""
+    SELECT r.actualizado_en >= v.actualizado_en
+    FROM mantenimiento_vistas r, mantenimiento_vistas v
+    WHERE r.nombre = 'ventas_metricas_diarias'
+      AND v.nombre = 'ventas_backend'
+""")
+
+
+def refrescar_ventas_backend() -> bool:
+    """
+    Refresca ventas_backend (y el rollup de métricas) en una transacción propia.
+
+    Returns:
+        bool: False si otra instancia ya está refrescando (no se hizo nada)
+
+    Raises:
+        Exception: Si falla el REFRESH
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if not conn.execute(_ADVISORY_LOCK_SQL).scalar():
+            return False
+        try:
+            # El refresh completo puede superar DB_STATEMENT_TIMEOUT_MS
+            with sin_statement_timeout(conn):
+                conn.execute(text("SELECT refresh_ventas_backend()"))
+        finally:
+            conn.execute(_ADVISORY_UNLOCK_SQL)
+    count_cache.invalidate_counts()
+    empresas_cache.invalidate()
+    response_cache.bump_version()
+    return True
+
+
+def rollup_metricas_vigente(db: Session) -> bool:
+    """
+    True si ventas_metricas_diarias se reconstruyó en el último refresh de
+    ventas_backend. Si las tablas no existen (migración 05 sin aplicar) o el
+    rollup quedó atrás, retorna False y el llamador debe usar la vista.
+    """
+    try:
+        return bool(db.execute(_ROLLUP_VIGENTE_SQL).scalar())
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"No se pudo verificar el rollup de métricas: {e}")
+        return False
+
+
+async def rollup_metricas_vigente_async(db: AsyncSession) -> bool:
+    """Igual que rollup_metricas_vigente con una AsyncSession"""
+    try:
+        vigente = bool((await db.execute(_ROLLUP_VIGENTE_SQL)).scalar())
+        registrar_filas(1)
+        return vigente
+    except Exception as e:
+        await db.rollback()
+        logger.warning(f"No se pudo verificar el rollup de métricas: {e}")
+        return False
+
+
+class RefreshScheduler:
+    """
+    Agrupa solicitudes de refresh de ventas_backend.
+
+    - request(): O(1), no bloquea; marca un refresh pendiente
+    - Como máximo hay un refresh corriendo y uno pendiente: todas las
+      solicitudes que llegan mientras uno corre se atienden con el siguiente
+    - refresh_now(): solicita y espera a que un refresh posterior termine
+    - status(): hora y duración del último refresh
+    """
+
+    def __init__(
+        self,
+        refresh_fn: Callable[[], bool] = refrescar_ventas_backend,
+        debounce: float = REFRESH_DEBOUNCE_SECONDS,
+        max_delay: float = REFRESH_MAX_DELAY_SECONDS,
+    ):
+        self.refresh_fn = refresh_fn
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+
+        # Cada solicitud recibe un número; un refresh atiende todas las
+        # solicitudes anteriores a su inicio
+        self._solicitadas = 0
+        self._atendidas = 0
+        self._inmediato = False
+        self._primera_pendiente: Optional[float] = None
+        self._ultima_pendiente: Optional[float] = None
+        self._corriendo = False
+        self._en_curso = 0
+
+        self._ultimo_refresh: Optional[datetime] = None
+        self._ultima_duracion_ms: Optional[int] = None
+        self._ultimo_error: Optional[str] = None
+        self._ultimo_ok = True
+        self._refrescos = 0
+        self._fallidos = 0
+
+    def request(self, inmediato: bool = False) -> int:
+        """
+        Solicita un refresh (no bloquea).
+
+        Returns:
+            int: Número de solicitud (para refresh_now)
+        """
+        ahora = time.monotonic()
+        with self._cond:
+            self._solicitadas += 1
+            if self._primera_pendiente is None:
+                self._primera_pendiente = ahora
+            self._ultima_pendiente = ahora
+            self._inmediato = self._inmediato or inmediato
+            self._cond.notify_all()
+            return self._solicitadas
+
+    def refresh_now(self, timeout: Optional[float] = None) -> bool:
+        """
+        Refresca sin esperar el debounce y bloquea hasta que termine.
+
+        Returns:
+            bool: True si el refresh terminó bien dentro del timeout
+        """
+        if self._thread is None or not self._thread.is_alive():
+            # Sin hilo de fondo (scripts, tests manuales): refrescar aquí
+            return self._ejecutar(self.request())
+
+        numero = self.request(inmediato=True)
+        with self._cond:
+            atendida = self._cond.wait_for(
+                lambda: self._atendidas >= numero or self._stop, timeout=timeout
+            )
+            return atendida and self._atendidas >= numero and self._ultimo_ok
+
+    def _listo(self) -> bool:
+        """Hay solicitudes pendientes y ya pasó el debounce (llamar con el lock)"""
+        if self._solicitadas <= self._atendidas:
+            return False
+        if self._inmediato:
+            return True
+        ahora = time.monotonic()
+        return (
+            ahora - self._ultima_pendiente >= self.debounce
+            or ahora - self._primera_pendiente >= self.max_delay
+        )
+
+    def _ejecutar(self, numero: int) -> bool:
+        """Ejecuta un refresh que atiende las solicitudes hasta `numero`"""
+        inicio = time.monotonic()
+        try:
+            hecho = self.refresh_fn()
+            error = None
+        except Exception as e:
+            hecho = False
+            error = str(e)
+            logger.error(f"Error al refrescar ventas_backend: {e}")
+
+        duracion_ms = int((time.monotonic() - inicio) * 1000)
+        with self._cond:
+            self._corriendo = False
+            if hecho or error is not None:
+                # Un error no se reintenta en bucle: la próxima solicitud lo intentará
+                self._atendidas = max(self._atendidas, numero)
+                self._ultimo_ok = hecho
+                if hecho:
+                    self._ultimo_refresh = datetime.now(timezone.utc)
+                    self._ultima_duracion_ms = duracion_ms
+                    self._ultimo_error = None
+                    self._refrescos += 1
+                else:
+                    self._ultimo_error = error
+                    self._fallidos += 1
+                if self._solicitadas > self._atendidas:
+                    # Llegaron solicitudes mientras corría: quedan pendientes
+                    self._primera_pendiente = self._ultima_pendiente
+                else:
+                    self._primera_pendiente = None
+            else:
+                # Otra instancia estaba refrescando: reintentar tras el debounce
+                ahora = time.monotonic()
+                self._primera_pendiente = ahora
+                self._ultima_pendiente = ahora
+            self._cond.notify_all()
+
+        if hecho:
+            logger.info(f"Vista ventas_backend refrescada en {duracion_ms} ms")
+        return hecho
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stop and not self._listo():
+                    if self._solicitadas > self._atendidas:
+                        espera = min(
+                            self.debounce - (time.monotonic() - self._ultima_pendiente),
+                            self.max_delay - (time.monotonic() - self._primera_pendiente),
+                        )
+                        self._cond.wait(timeout=max(espera, 0.05))
+                    else:
+                        self._cond.wait()
+                if self._stop:
+                    return
+                numero = self._solicitadas
+                self._inmediato = False
+                self._corriendo = True
+                self._en_curso = numero
+
+            self._ejecutar(numero)
+
+    def start(self) -> None:
+        """Inicia el hilo de refresh (idempotente)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            self._stop = False
+        self._thread = threading.Thread(
+            target=self._run, name="ventas-backend-refresh", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Detiene el hilo; si quedó un refresh pendiente lo ejecuta antes de salir"""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        with self._cond:
+            numero = self._solicitadas
+            pendiente = numero > self._atendidas and not self._corriendo
+        if pendiente:
+            self._ejecutar(numero)
+
+    def status(self) -> dict:
+        """Estado del scheduler y del último refresh"""
+        with self._cond:
+            return {
+                "corriendo": self._corriendo,
+                "pendiente": self._solicitadas > max(
+                    self._atendidas, self._en_curso if self._corriendo else 0
+                ),
+                "ultimo_refresh": (
+                    self._ultimo_refresh.isoformat() if self._ultimo_refresh else None
+                ),
+                "ultima_duracion_ms": self._ultima_duracion_ms,
+                "ultimo_error": self._ultimo_error,
+                "solicitudes": self._solicitadas,
+                "refrescos": self._refrescos,
+                "refrescos_fallidos": self._fallidos,
+                "debounce_seconds": self.debounce,
+            }
+
+
+refresh_scheduler = RefreshScheduler()
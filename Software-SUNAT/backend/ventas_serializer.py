@@ -0,0 +1,108 @@
+"""
+Serialización directa de páginas de /api/ventas a bytes JSON.
+
+El camino normal (VentaResponse.from_orm_with_calculation por fila, luego
+PaginatedResponse, luego la validación y el jsonable_encoder de FastAPI)
+construye y recorre un modelo Pydantic por factura. Las filas ya vienen
+proyectadas de ventas_backend (datos confiables de la BD), así que aquí se
+calculan los mismos campos en un dict plano y se codifica toda la página con
+un solo json.dumps.
+
+La salida es idéntica byte a byte a la de FastAPI para
+PaginatedResponse[VentaResponse]: mismo orden de campos, mismas conversiones
+(Decimal → float, date → ISO) y los mismos parámetros de JSONResponse.render.
+No se usa orjson porque formatea floats grandes distinto (1e16 vs 1e+16).
+benchmarks/benchmark_ventas_serializer.py compara ambos caminos.
+"""
+
+import json
+from typing import Iterable, List
+
+from fastapi import Response
+
+from instrumentacion import medir_serializacion
+from schemas import PaginationMetadata
+
+SIN_GESTION = "Sin gestión"
+
+
+def _float(valor):
+    return float(valor) if valor else None
+
+
+def venta_a_dict(venta) -> dict:
+    """
+    Misma lógica que VentaResponse.from_orm_with_calculation para una fila de
+    VentaBackendRepository (sin total_neto; nota_credito_monto de la fila).
+    """
+    total_cp = venta.total_cp
+    tipo_cambio = venta.tipo_cambio
+
+    if total_cp and tipo_cambio and tipo_cambio > 0:
+        monto_original = float(total_cp) / float(tipo_cambio)
+    else:
+        monto_original = _float(total_cp)
+
+    nota_credito = venta.nota_credito_monto
+    if nota_credito is not None and nota_credito != 0:
+        nota_credito = float(nota_credito)
+        tiene_nota_credito = True
+        if monto_original is not None:
+            # float(): el schema convierte el 0 entero de max() a 0.0
+            monto_neto = float(max(0, monto_original + nota_credito))
+        else:
+            monto_neto = None
+    else:
+        nota_credito = None
+        tiene_nota_credito = False
+        monto_neto = monto_original
+
+    fecha_emision = venta.fecha_emision
+
+    # Orden de campos de VentaResponse
+    return {
+        "id": venta.id,
+        "ruc": venta.ruc,
+        "razon_social": venta.razon_social,
+        "periodo": venta.periodo,
+        "car_sunat": venta.car_sunat,
+        "fecha_emision": fecha_emision.isoformat() if fecha_emision is not None else None,
+        "tipo_cp_doc": venta.tipo_cp_doc,
+        "serie_cdp": venta.serie_cdp,
+        "nro_cp_inicial": venta.nro_cp_inicial,
+        "nro_doc_identidad": venta.nro_doc_identidad,
+        "apellidos_nombres_razon_social": venta.apellidos_nombres_razon_social,
+        "total_cp": _float(total_cp),
+        "moneda": venta.moneda,
+        "tipo_cambio": _float(tipo_cambio),
+        "monto_original": monto_original,
+        "usuario_nombre": venta.usuario_nombre,
+        "usuario_email": venta.usuario_email,
+        "nota_credito_monto": nota_credito,
+        "monto_neto": monto_neto,
+        "tiene_nota_credito": tiene_nota_credito,
+        "estado1": venta.estado1 or SIN_GESTION,
+        "estado2": venta.estado2,
+    }
+
+
+def ventas_page_json(ventas: Iterable, pagination: PaginationMetadata) -> bytes:
+    """Página completa {items, pagination} codificada como la codifica FastAPI"""
+    with medir_serializacion():
+        items: List[dict] = [venta_a_dict(venta) for venta in ventas]
+        contenido = {"items": items, "pagination": pagination.model_dump(mode="json")}
+        return json.dumps(
+            contenido,
+            ensure_ascii=False,
+            allow_nan=False,
+            indent=None,
+            separators=(",", ":"),
+        ).encode("utf-8")
+
+
+def ventas_page_response(ventas: Iterable, pagination: PaginationMetadata) -> Response:
+    """Response lista para devolver desde el endpoint (omite la validación de FastAPI)"""
+    return Response(
+        content=ventas_page_json(ventas, pagination),
+        media_type="application/json",
+    )
@@ -0,0 +1,271 @@
+"""
+Creación de engines de SQLAlchemy con pool configurable e instrumentado.
+
+- Tamaño, overflow, timeout y reciclado del pool salen del entorno
+  (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE).
+- Cada conexión nueva fija statement_timeout e
+  idle_in_transaction_session_timeout (DB_STATEMENT_TIMEOUT_MS,
+  DB_IDLE_IN_TX_TIMEOUT_MS; 0 = sin límite), así una consulta colgada o una
+  transacción abandonada no retienen la conexión indefinidamente.
+- El pool mide cuánto espera cada checkout y cuántas conexiones están en uso
+  (estadisticas_pool); los checkouts lentos se registran en el log.
+- Con una URL (DATABASE_URL) se conecta a cualquier Postgres, por ejemplo uno
+  local; sin URL usa el Cloud SQL Connector, que se crea recién al abrir la
+  primera conexión.
+
+Crear el engine no abre conexiones: la primera se abre en el primer request
+(o en precalentar_pool).
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy import exc
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ConfigPool:
+    """Parámetros del pool y de cada sesión de base de datos"""
+
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30.0
+    pool_recycle: int = 1800
+    statement_timeout_ms: int = 60000
+    idle_in_transaction_timeout_ms: int = 60000
+    # Checkouts que esperan más que esto se registran como lentos
+    espera_lenta_ms: float = 100.0
+
+    @classmethod
+    def desde_env(cls) -> "ConfigPool":
+        return cls(
+            pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+            pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+            statement_timeout_ms=int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "60000")),
+            idle_in_transaction_timeout_ms=int(os.getenv("DB_IDLE_IN_TX_TIMEOUT_MS", "60000")),
+            espera_lenta_ms=float(os.getenv("DB_POOL_ESPERA_LENTA_MS", "100")),
+        )
+
+
+class MetricasPool:
+    """Contadores de checkout de un pool (thread-safe)"""
+
+    def __init__(self, nombre: str, config: ConfigPool):
+        self.nombre = nombre
+        self.config = config
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkouts_lentos = 0
+        self.timeouts = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+        self.en_uso_max = 0
+
+    def registrar_checkout(self, espera: float, en_uso: int) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.espera_total += espera
+            self.espera_max = max(self.espera_max, espera)
+            self.en_uso_max = max(self.en_uso_max, en_uso)
+            if espera * 1000 >= self.config.espera_lenta_ms:
+                self.checkouts_lentos += 1
+
+    def registrar_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def stats(self, pool: QueuePool) -> dict:
+        with self._lock:
+            return {
+                "nombre": self.nombre,
+                "pool_size": pool.size(),
+                "max_overflow": self.config.max_overflow,
+                "en_uso": pool.checkedout(),
+                "disponibles": pool.checkedin(),
+                "overflow": pool.overflow(),
+                "en_uso_max": self.en_uso_max,
+                "checkouts": self.checkouts,
+                "checkouts_lentos": self.checkouts_lentos,
+                "timeouts": self.timeouts,
+                "espera_promedio_ms": round(self.espera_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "espera_max_ms": round(self.espera_max * 1000, 3),
+                "statement_timeout_ms": self.config.statement_timeout_ms,
+                "idle_in_transaction_timeout_ms": self.config.idle_in_transaction_timeout_ms,
+            }
+
+
+class _QueuePoolMedido(QueuePool):
+    """QueuePool que mide la espera de cada checkout"""
+
+    # Se fija en la subclase creada por crear_engine (sobrevive a pool.recreate())
+    metricas: MetricasPool
+
+    def connect(self):
+        inicio = time.perf_counter()
+        try:
+            conexion = super().connect()
+        except exc.TimeoutError:
+            self.metricas.registrar_timeout()
+            logger.error(f"[pool {self.metricas.nombre}] Timeout esperando conexión: {self.status()}")
+            raise
+        espera = time.perf_counter() - inicio
+        self.metricas.registrar_checkout(espera, self.checkedout())
+        if espera * 1000 >= self.metricas.config.espera_lenta_ms:
+            logger.warning(
+                f"[pool {self.metricas.nombre}] Checkout lento: {espera * 1000:.0f} ms ({self.status()})"
+            )
+        return conexion
+
+
+def _sql_timeouts(config: ConfigPool) -> list:
+    return [
+        f"SET statement_timeout = {int(config.statement_timeout_ms)}",
+        f"SET idle_in_transaction_session_timeout = {int(config.idle_in_transaction_timeout_ms)}",
+    ]
+
+
+def crear_engine(
+    nombre: str,
+    url: Optional[str] = None,
+    creator: Optional[Callable] = None,
+    config: Optional[ConfigPool] = None,
+) -> Engine:
+    """
+    Crea un engine con pool instrumentado.
+
+    Args:
+        nombre: Nombre del pool en logs y estadísticas
+        url: URL de SQLAlchemy (p. ej. postgresql+psycopg2://postgres@localhost/operaciones)
+        creator: Función que abre una conexión DBAPI (Cloud SQL); se usa si no hay url
+        config: Parámetros del pool; None = ConfigPool.desde_env()
+
+    Raises:
+        ValueError: Si no se indica url ni creator
+    """
+    if not url and creator is None:
+        raise ValueError("crear_engine necesita una url o un creator")
+    config = config or ConfigPool.desde_env()
+    metricas = MetricasPool(nombre, config)
+    poolclass = type("QueuePoolMedido", (_QueuePoolMedido,), {"metricas": metricas})
+
+    opciones = dict(
+        poolclass=poolclass,
+        pool_size=config.pool_size,
+        max_overflow=config.max_overflow,
+        pool_timeout=config.pool_timeout,
+        pool_recycle=config.pool_recycle,
+        pool_pre_ping=True,
+    )
+    if url:
+        engine = create_engine(url, **opciones)
+    else:
+        engine = create_engine("postgresql+pg8000://", creator=creator, **opciones)
+
+    sentencias = _sql_timeouts(config)
+
+    @event.listens_for(engine, "connect")
+    def _configurar_sesion(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for sentencia in sentencias:
+                cursor.execute(sentencia)
+        finally:
+            cursor.close()
+        # Sin commit el ROLLBACK al devolver la conexión al pool deshace los SET
+        dbapi_connection.commit()
+
+    logger.info(
+        f"[pool {nombre}] size={config.pool_size} overflow={config.max_overflow} "
+        f"timeout={config.pool_timeout}s recycle={config.pool_recycle}s "
+        f"statement_timeout={config.statement_timeout_ms}ms "
+        f"idle_in_tx={config.idle_in_transaction_timeout_ms}ms"
+    )
+    return engine
+
+
+def conector_cloud_sql() -> Callable:
+    """
+    Devuelve connect(instancia, **kwargs) para el Cloud SQL Connector (pg8000).
+
+    El Connector (y su import) se crean en la primera llamada, no al importar.
+    """
+    estado = {"connector": None}
+    lock = threading.Lock()
+
+    def conectar(instancia: str, **kwargs):
+        if estado["connector"] is None:
+            with lock:
+                if estado["connector"] is None:
+                    from google.cloud.sql.connector import Connector
+
+                    estado["connector"] = Connector()
+        return estado["connector"].connect(instancia, "pg8000", **kwargs)
+
+    return conectar
+
+
+def estadisticas_pool(engine: Engine) -> dict:
+    """Estado del pool y métricas de checkout acumuladas desde el arranque"""
+    metricas = getattr(engine.pool, "metricas", None)
+    if metricas is None:
+        return {"status": engine.pool.status()}
+    return metricas.stats(engine.pool)
+
+
+def precalentar_pool(engine: Engine, conexiones: int) -> int:
+    """
+    Abre `conexiones` conexiones a la vez y las devuelve al pool.
+
+    Pensado para correr en un hilo de fondo al arrancar: el primer request
+    encuentra conexiones ya abiertas en lugar de pagar el handshake de
+    Cloud SQL. Nunca abre más que pool_size (las de overflow se cerrarían).
+
+    Returns:
+        int: Conexiones abiertas
+    """
+    conexiones = min(conexiones, engine.pool.size())
+    abiertas = []
+    inicio = time.perf_counter()
+    try:
+        for _ in range(conexiones):
+            abiertas.append(engine.raw_connection())
+    except Exception as e:
+        logger.warning(f"No se pudo precalentar el pool: {e}")
+    finally:
+        for conexion in abiertas:
+            conexion.close()
+    if abiertas:
+        logger.info(
+            f"Pool precalentado: {len(abiertas)} conexiones en {time.perf_counter() - inicio:.2f}s"
+        )
+    return len(abiertas)
+
+
+@contextmanager
+def sin_statement_timeout(conn: Connection):
+    """
+    Desactiva statement_timeout en `conn` mientras dura el bloque (para
+    mantenimientos largos) y luego restaura el valor configurado.
+
+    Sirve también con conexiones AUTOCOMMIT, donde SET LOCAL no tiene efecto.
+    """
+    metricas = getattr(conn.engine.pool, "metricas", None)
+    valor = metricas.config.statement_timeout_ms if metricas else 0
+    conn.exec_driver_sql("SET statement_timeout = 0")
+    try:
+        yield conn
+    finally:
+        conn.exec_driver_sql(f"SET statement_timeout = {int(valor)}")
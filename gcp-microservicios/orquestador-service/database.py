@@ -1,22 +1,31 @@
 # orquestador-service-0/database.py
 import os
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
 # --- Importaciones añadidas ---
 from dotenv import load_dotenv
-from google.cloud.sql.connector import Connector
+
+from core.engine_factory import conector_cloud_sql, crear_engine
 
 
 load_dotenv()
 
-connector = Connector()
+_conectar = conector_cloud_sql()
 
 def get_db_connection():
     """
     Crea y retorna un motor de conexión a la base de datos de Cloud SQL.
+
+    Con DATABASE_URL se conecta directo a ese Postgres (p. ej. uno local) sin
+    Cloud SQL Connector. El pool se configura con las variables DB_POOL_* y
+    DB_*_TIMEOUT_MS (ver core/engine_factory.py); crear el engine no abre
+    conexiones.
     """
+    database_url = os.getenv("DATABASE_URL")
+    if database_url:
+        return crear_engine("orquestador", url=database_url)
+
     instance_connection_name = os.getenv("DB_INSTANCE_CONNECTION_NAME")
     db_user = os.getenv("DB_USER")
     db_pass = os.getenv("DB_PASS")
@@ -27,16 +36,14 @@ def get_db_connection():
     if not db_user:
         raise ValueError("La variable de entorno DB_USER no está definida.")
 
-    engine = create_engine(
-        "postgresql+pg8000://",
-        creator=lambda: connector.connect(
+    engine = crear_engine(
+        "orquestador",
+        creator=lambda: _conectar(
             instance_connection_name,
-            "pg8000",
             user=db_user,
             password=db_pass,
             db=db_name
         ),
-        pool_pre_ping=True,
     )
     return engine
 
@@ -52,4 +59,4 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
@@ -14,6 +14,7 @@ from google.cloud import storage
 import firebase_admin
 from firebase_admin import credentials, auth
 from database import get_db, engine, SessionLocal
+from core.engine_factory import estadisticas_pool
 from repository import OperationRepository
 import models
 from pydantic import BaseModel
@@ -21,6 +22,7 @@ import logging
 import asyncio
 import requests
 from services.microservice_client import microservice_client
+from services.last_seen_tracker import last_seen_tracker
 
 load_dotenv()
 
@@ -44,6 +46,12 @@ app = FastAPI(title="Orquestador de Operaciones")
 async def startup_event():
     """Initialize database tables after server starts"""
     initialize_database()
+    last_seen_tracker.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    """Persist pending ultimo_ingreso updates before exiting"""
+    last_seen_tracker.stop()
 
 app.add_middleware(
     CORSMiddleware,
@@ -615,11 +623,14 @@ async def get_current_user_session(user: dict = Depends(get_current_user), db: S
     if not user_in_db:
         raise HTTPException(status_code=404, detail="Usuario no encontrado en la base de datos.")
 
+    # ultimo_ingreso puede estar pendiente de flush: priorizar el valor en memoria
+    ultimo_ingreso = last_seen_tracker.get(user_in_db.email) or user_in_db.ultimo_ingreso
+
     return UserSession(
         email=user_in_db.email,
         nombre=user_in_db.nombre,
         rol=user_in_db.rol,
-        ultimo_ingreso=user_in_db.ultimo_ingreso
+        ultimo_ingreso=ultimo_ingreso
     )
 
 
@@ -659,4 +670,9 @@ async def health_check():
             "status": "unhealthy",
             "error": str(e),
             "timestamp": datetime.now(timezone.utc).isoformat()
-        }
\ No newline at end of file
+        }
+
+@app.get("/debug/db-pool")
+def debug_db_pool():
+    """Conexiones en uso y espera de checkout del pool de base de datos"""
+    return estadisticas_pool(engine)
@@ -5,6 +5,7 @@ from datetime import datetime, timedelta, timezone
 from models import Gestion, Operacion, Factura, Empresa, Usuario 
 from sqlalchemy import text
 from sqlalchemy.orm import joinedload, selectinload
+from services.last_seen_tracker import last_seen_tracker
 
 class OperationRepository:
     def __init__(self, db: Session):
@@ -180,16 +181,23 @@ class OperationRepository:
         return query.order_by(priority_order, Operacion.monto_sumatoria_total.desc()).all()
         
     def update_and_get_last_login(self, email: str, name: str) -> Optional[datetime]:
+        """
+        Registra el acceso actual y retorna el anterior.
+        Los usuarios existentes se actualizan en lote (services/last_seen_tracker.py);
+        solo el alta de un usuario nuevo escribe de forma síncrona.
+        """
         now = datetime.now(timezone.utc)
-        usuario = self.db.query(Usuario).filter(Usuario.email == email).first()
-        if usuario:
+        previous_login = last_seen_tracker.get(email)
+        if previous_login is None:
+            usuario = self.db.query(Usuario).filter(Usuario.email == email).first()
+            if not usuario:
+                usuario = Usuario(email=email, nombre=name, ultimo_ingreso=now)
+                self.db.add(usuario)
+                self.db.commit()
+                last_seen_tracker.touch(email, now)
+                return None
             previous_login = usuario.ultimo_ingreso
-            usuario.ultimo_ingreso = now
-        else:
-            previous_login = None
-            usuario = Usuario(email=email, nombre=name, ultimo_ingreso=now)
-            self.db.add(usuario)
-        self.db.commit()
+        last_seen_tracker.touch(email, now)
         return previous_login
     
     def check_duplicate_invoices(self, invoices_data: List[Dict]) -> Dict[str, Any]:
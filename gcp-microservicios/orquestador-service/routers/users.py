@@ -5,6 +5,7 @@ from pydantic import BaseModel
 from core.dependencies import get_current_user
 from database import get_db
 from repository import OperationRepository
+from services.last_seen_tracker import last_seen_tracker
 import models
 
 router = APIRouter(prefix="/api/users", tags=["users"])
@@ -44,14 +45,15 @@ async def get_analysts(
     try:
         usuarios = db.query(models.Usuario).all()
         
-        analysts = [
-            {
+        analysts = []
+        for usuario in usuarios:
+            # ultimo_ingreso puede estar pendiente de flush: priorizar el valor en memoria
+            ultimo_ingreso = last_seen_tracker.get(usuario.email) or usuario.ultimo_ingreso
+            analysts.append({
                 "email": usuario.email,
                 "nombre": usuario.nombre,
-                "ultimo_ingreso": usuario.ultimo_ingreso.isoformat() if usuario.ultimo_ingreso else None
-            }
-            for usuario in usuarios
-        ]
+                "ultimo_ingreso": ultimo_ingreso.isoformat() if ultimo_ingreso else None
+            })
         
         return {"analysts": analysts}
         
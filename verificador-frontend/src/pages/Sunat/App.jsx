@@ -299,15 +299,63 @@ export default function App() {
     }
   };
 
-  const handleBulkStatusUpdate = (newStatus) => {
-    setInvoiceStatuses((prev) => {
-      const updated = { ...prev };
-      selectedInvoiceKeys.forEach((key) => {
-        updated[key] = newStatus;
-      });
-      return updated;
+  const handleBulkStatusUpdate = async (newStatus) => {
+    // Una sola llamada para todas las facturas seleccionadas
+    const ventaIdPorKey = {};
+    invoices.forEach((invoice) => {
+      ventaIdPorKey[invoice.key] = invoice.ventaId;
+    });
+    const keysPorVentaId = {};
+    selectedInvoiceKeys.forEach((key) => {
+      const ventaId = ventaIdPorKey[key];
+      if (ventaId !== undefined) {
+        keysPorVentaId[ventaId] = key;
+      }
     });
-    setSelectedInvoiceKeys([]);
+
+    try {
+      const token = await firebaseUser.getIdToken();
+      const response = await fetch(`${API_BASE_URL}/api/ventas/estado:bulk`, {
+        method: "PUT",
+        headers: {
+          "Content-Type": "application/json",
+          Authorization: `Bearer ${token}`,
+        },
+        body: JSON.stringify({
+          ids: Object.keys(keysPorVentaId).map(Number),
+          estado1: newStatus,
+        }),
+      });
+
+      if (!response.ok) {
+        throw new Error(`Error al actualizar estados: ${response.status}`);
+      }
+
+      const { resultados } = await response.json();
+      const fallidas = resultados.filter((r) => r.status_code !== 200);
+
+      // Actualizar estado local solo de las facturas actualizadas
+      setInvoiceStatuses((prev) => {
+        const updated = { ...prev };
+        resultados
+          .filter((r) => r.status_code === 200)
+          .forEach((r) => {
+            updated[keysPorVentaId[r.id]] = newStatus;
+          });
+        return updated;
+      });
+      setSelectedInvoiceKeys([]);
+
+      // Forzar recarga de datos para actualizar métricas y tabla
+      setRefreshTrigger((prev) => prev + 1);
+
+      if (fallidas.length > 0) {
+        alert(`${fallidas.length} factura(s) no se pudieron actualizar`);
+      }
+    } catch (error) {
+      console.error("Error al actualizar estados:", error);
+      alert(`Error al actualizar estados: ${error.message}`);
+    }
   };
 
   const toggleInvoiceSelection = (key) => {